@@ -1,33 +1,307 @@
-import pdfplumber
-import pytesseract
-from PIL import Image
+# Heavy libraries (pdfplumber, pytesseract, tkinter, spaCy) are imported where they are
+# used, so a run over one or two files doesn't pay for what it never touches
 import re
-import pandas as pd
-from tkinter import Tk
-from tkinter.filedialog import askopenfilenames
-
-def replace_empty_with_dash(df, columns):
-    for column in columns:
-        df[column] = df[column].replace("", "-").replace(".", "-").replace("Total", "-").replace("Advance", "-")
-    return df
+import os
+import glob
+import argparse
+import json
+import time
+from functools import partial, lru_cache
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+from output_sinks import open_sink, TeeSink, LINE_ITEM_COLUMNS, SINK_FORMATS
+from instrumentation import DocumentTrace, RunStats, NULL_TRACE, profile_call
+from pdf_backends import open_document, backend_version, BACKENDS, DEFAULT_BACKEND, DEFAULT_RESOLUTION
+from ocr_engines import get_ocr_pool, resolve_engine, engine_version, ENGINE_CHOICES, DEFAULT_ENGINE
+from text_cache import get_cache, file_digest, image_digest, make_key, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from memory import MemoryMonitor, release_memory
+
+# Settings that change the text we get back; they are part of every cache key
+def text_settings(backend=DEFAULT_BACKEND):
+    return {"backend": backend, "version": backend_version(backend)}
+
+@lru_cache(maxsize=None)
+def _engine_settings(engine):
+    try:
+        engine = resolve_engine(engine)
+    except RuntimeError:
+        # No engine installed: only text layers can be read, and they don't depend on one
+        return {"engine": None, "lang": "eng", "resolution": DEFAULT_RESOLUTION}
+    return {"engine": engine, "tesseract": engine_version(engine), "lang": "eng", "resolution": DEFAULT_RESOLUTION}
+
+def ocr_settings(engine="pytesseract", preprocess=None):
+    settings = _engine_settings(engine)
+    if preprocess is None:
+        return settings
+    return {**settings, "resolution": preprocess.render_dpi, "preprocess": preprocess.settings()}
+
+# Resolution pages are rendered at for OCR
+def render_resolution(preprocess=None):
+    return preprocess.render_dpi if preprocess is not None else DEFAULT_RESOLUTION
+
+# Function to OCR one rendered page, looking it up by its pixel hash first.
+# Without an engine this is the plain pytesseract call (one tesseract process per page).
+# With a preprocessor (ocr_preprocess.OcrPreprocessor) the page is cleaned up and cropped
+# first; a cache hit skips that too.
+def ocr_page_image(image, cache=None, engine=None, preprocess=None):
+    def recognise():
+        page = preprocess(image) if preprocess is not None else image
+        if engine is not None:
+            return engine.image_to_string(page)
+        import pytesseract
+        return pytesseract.image_to_string(page)
+
+    if cache is None:
+        return recognise()
+
+    key = make_key("ocr-page", image_digest(image),
+                   ocr_settings(engine.name if engine is not None else "pytesseract", preprocess))
+    text = cache.get(key)
+    if text is None:
+        text = recognise()
+        cache.put(key, text)
+    return text
 
 # Function to extract text from images using OCR (if needed)
-def extract_text_from_image(pdf_path):
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            img = page.to_image()
-            text += pytesseract.image_to_string(img.original)
-    return text
+# One page is rendered at a time and released before the next one is read.
+def extract_text_from_image(pdf_path, cache=None, backend=DEFAULT_BACKEND, preprocess=None):
+    resolution = render_resolution(preprocess)
+    page_texts = []
+    with open_document(pdf_path, backend) as doc:
+        for page_number in range(len(doc)):
+            page_texts.append(ocr_page_image(doc.render(page_number, resolution), cache, preprocess=preprocess))
+            doc.release(page_number)
+    return "".join(page_texts)
 
 # Function to extract all text from PDF
-def extract_full_text(pdf_path):
-    text = ""
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text()  # Extracts general text from each page
+def extract_full_text(pdf_path, cache=None, backend=DEFAULT_BACKEND):
+    if cache is not None:
+        key = make_key("text", file_digest(pdf_path), text_settings(backend))
+        text = cache.get(key)
+        if text is not None:
+            return text
+
+    with open_document(pdf_path, backend) as doc:
+        # Extracts general text from each page; one join instead of growing a string page by page
+        text = "".join(doc.page_text(page_number) for page_number in range(len(doc)))
+
+    if cache is not None:
+        cache.put(key, text)
     return text
 
+# Pages with fewer readable characters than this are treated as scanned
+MIN_PAGE_TEXT_CHARS = 20
+
+# Function to decide whether a page's text layer is empty or unusable
+def page_needs_ocr(page_text, min_chars=MIN_PAGE_TEXT_CHARS):
+    if not page_text or not page_text.strip():
+        return True
+
+    readable = sum(ch.isalnum() for ch in page_text)
+    if readable < min_chars:
+        return True
+
+    # Fonts without a unicode map come out as "(cid:123)" runs
+    if page_text.count("(cid:") * 6 > readable:
+        return True
+
+    return False
+
+# Cache key of a document's hybrid text: its bytes plus every setting that changes the text
+def hybrid_cache_key(pdf_path, backend=DEFAULT_BACKEND, ocr_engine=DEFAULT_ENGINE, stop_early=False,
+                     preprocess=None):
+    settings = {"text": text_settings(backend), "ocr": ocr_settings(ocr_engine, preprocess),
+                "min_chars": MIN_PAGE_TEXT_CHARS}
+    if stop_early:
+        settings["stop_early"] = True
+    return make_key("hybrid", file_digest(pdf_path), settings)
+
+# Function to yield (page number, text, OCR used) for each page of an open document, in order.
+# A page is only read, rendered or OCR-ed once the consumer is about to get to it: up to
+# `lookahead` pages are queued ahead so the OCR threads stay busy, and everything past
+# the point where the consumer stops iterating is never touched.
+# With low_memory (a window of pages) no more than that many pages are ahead, and each
+# page is released from the document once it is done; memory (memory.MemoryMonitor) is
+# checked after every page. page_images holds pages already rendered at this resolution
+# (by the vendor template probe), which are OCR-ed without rendering them again.
+def iter_page_texts(doc, ocr_workers=1, cache=None, trace=NULL_TRACE, ocr_engine=DEFAULT_ENGINE, lookahead=None,
+                    preprocess=None, low_memory=None, memory=None, page_images=None):
+    lookahead = low_memory or lookahead or max(1, ocr_workers)
+    resolution = render_resolution(preprocess)
+    ahead = deque()  # (page number, text or OCR future)
+    next_page = 0
+
+    def traced_ocr(engine, image, page_number):
+        with trace.span("ocr", page_number):
+            return ocr_page_image(image, cache, engine, preprocess)
+
+    try:
+        while ahead or next_page < len(doc):
+            while len(ahead) < lookahead and next_page < len(doc):
+                with trace.span("text", next_page):
+                    page_text = doc.page_text(next_page)
+                if page_needs_ocr(page_text):
+                    image = page_images.pop(next_page, None) if page_images else None
+                    if image is None:
+                        with trace.span("render", next_page):
+                            image = doc.render(next_page, resolution)
+                    pool = get_ocr_pool(ocr_engine, max(1, ocr_workers))
+                    page_text = pool.submit(traced_ocr, image, next_page)
+                    # Only the OCR job holds on to the render
+                    del image
+                ahead.append((next_page, page_text))
+                next_page += 1
+
+            page_number, page_text = ahead.popleft()
+            ocr_used = not isinstance(page_text, str)
+            if ocr_used:
+                page_text = page_text.result()
+            if low_memory:
+                doc.release(page_number)
+            if memory is not None:
+                memory.check(page_number)
+            yield page_number, page_text, ocr_used
+    finally:
+        # The consumer stopped early: drop the OCR jobs that haven't started yet
+        for _, page_text in ahead:
+            if not isinstance(page_text, str):
+                page_text.cancel()
+
+# Marks the end of the line-item table
+LINE_ITEMS_END = "Grand Total"
+
+# Follows the pages of a document as they are read and tells when the header fields and
+# the line-item table are complete, so the rest of the document can be skipped. Each page
+# is checked on its own, so the cost stays linear in the number of pages read.
+#
+# GSTIN is the one field a later page can still change: extract_details keeps the last
+# GSTIN of the text, and a page after the stop (an annexure quoting a transporter, say)
+# may hold another. last_gstin_text finds that page, so stopping early gives the same
+# GSTIN as reading everything.
+class PageFieldTracker:
+    def __init__(self, fields=None):
+        self.pending = {spec[0]: spec for spec in FIELD_SPECS
+                        if spec is not LINE_ITEMS and (fields is None or spec[0] in fields)}
+        self.need_gstin = fields is None or 'GSTIN' in fields
+        self.seen_line_items = False
+        self.line_items_closed = False
+
+    # Function to check one more page; returns True once nothing more is needed
+    def feed(self, page_text):
+        if self.need_gstin and find_last_gstin(page_text):
+            self.need_gstin = False
+
+        for field, (_, labels, pattern, window, _) in list(self.pending.items()):
+            starts = [position for position in map(page_text.find, labels) if position != -1]
+            if starts and search_from_label(pattern, page_text, min(starts), window):
+                del self.pending[field]
+
+        if not self.line_items_closed:
+            last_item_end = 0
+            for match in GOODS_PATTERN.finditer(page_text):
+                self.seen_line_items = True
+                last_item_end = match.end()
+            if self.seen_line_items and page_text.find(LINE_ITEMS_END, last_item_end) != -1:
+                self.line_items_closed = True
+
+        return self.complete()
+
+    def complete(self):
+        return not self.pending and not self.need_gstin and self.line_items_closed
+
+    # Function to look at the pages after the stop for a GSTIN, from the last page back:
+    # the first page found with one holds the document's last GSTIN. rest is the (page
+    # number, text layer) of those pages; ocr(page number) OCRs a page without a text
+    # layer, which is the only way to know whether it holds one. Returns the text of that
+    # page ("" if none has a GSTIN), the pages read and the pages OCR-ed to find it.
+    @staticmethod
+    def last_gstin_text(rest, ocr):
+        ocr_pages = 0
+        for page_number, page_text in reversed(rest):
+            ocr_used = page_needs_ocr(page_text)
+            if ocr_used:
+                page_text = ocr(page_number)
+                ocr_pages += 1
+            if find_last_gstin(page_text):
+                return page_text, ocr_pages + (not ocr_used), ocr_pages
+        return "", ocr_pages, ocr_pages
+
+# Function to OCR one page of an open document, from its render in page_images if the
+# template probe left one there
+def ocr_document_page(doc, page_number, ocr_workers=1, cache=None, trace=NULL_TRACE, ocr_engine=DEFAULT_ENGINE,
+                      preprocess=None, page_images=None):
+    image = page_images.pop(page_number, None) if page_images else None
+    if image is None:
+        with trace.span("render", page_number):
+            image = doc.render(page_number, render_resolution(preprocess))
+
+    def traced_ocr(engine):
+        with trace.span("ocr", page_number):
+            return ocr_page_image(image, cache, engine, preprocess)
+    return get_ocr_pool(ocr_engine, max(1, ocr_workers)).submit(traced_ocr).result()
+
+# Function to extract text page by page, OCR-ing only the pages that need it.
+# Pages are streamed from iter_page_texts while the OCR pool works ahead; its threads
+# keep their engine loaded from one document to the next. With stop_early, reading
+# (and above all OCR-ing) stops at the page where every header field and the end of
+# the line-item table have been seen; after it only the page with the last GSTIN is
+# added, found by the tracker.
+def extract_hybrid_text(pdf_path, ocr_workers=1, cache=None, trace=NULL_TRACE, backend=DEFAULT_BACKEND,
+                        ocr_engine=DEFAULT_ENGINE, stop_early=False, preprocess=None, low_memory=None, memory=None,
+                        page_images=None, doc=None):
+    if cache is not None:
+        key = hybrid_cache_key(pdf_path, backend, ocr_engine, stop_early, preprocess)
+        cached = cache.get(key)
+        if cached is not None:
+            entry = json.loads(cached)
+            trace.cached = True
+            trace.skipped_pages = entry.get("skipped_pages", 0)
+            return entry["text"], entry["pages"], entry["ocr_pages"]
+
+    page_texts = []
+    ocr_pages = 0
+    tracker = PageFieldTracker() if stop_early else None
+
+    # One open document serves both the text layer and the page renders; one passed in
+    # stays open for the caller
+    if doc is None:
+        with trace.span("open"):
+            doc = open_document(pdf_path, backend)
+        owned = doc
+    else:
+        owned = nullcontext()
+    with owned:
+        total_pages = len(doc)
+        pages = iter_page_texts(doc, ocr_workers, cache, trace, ocr_engine, preprocess=preprocess,
+                                low_memory=low_memory, memory=memory, page_images=page_images)
+        for page_number, page_text, ocr_used in pages:
+            page_texts.append(page_text)
+            ocr_pages += ocr_used
+            if tracker is not None and tracker.feed(page_text):
+                break
+        pages.close()
+        pages_read = len(page_texts)
+
+        if pages_read < total_pages:
+            rest = []
+            for page_number in range(pages_read, total_pages):
+                with trace.span("text", page_number):
+                    rest.append((page_number, doc.page_text(page_number)))
+            tail_text, tail_pages, tail_ocr_pages = tracker.last_gstin_text(rest, partial(
+                ocr_document_page, doc, ocr_workers=ocr_workers, cache=cache, trace=trace, ocr_engine=ocr_engine,
+                preprocess=preprocess, page_images=page_images))
+            page_texts.append(tail_text)
+            pages_read += tail_pages
+            ocr_pages += tail_ocr_pages
+
+    trace.skipped_pages = total_pages - pages_read
+    text = "".join(page_texts)
+    if cache is not None:
+        cache.put(key, json.dumps({"text": text, "pages": pages_read, "ocr_pages": ocr_pages,
+                                   "skipped_pages": trace.skipped_pages}))
+    return text, pages_read, ocr_pages
+
 def extract_text_and_debug(pdf_path):
     text = extract_full_text(pdf_path)
 
@@ -39,149 +313,616 @@ def extract_text_and_debug(pdf_path):
     print(text[:1000])  # Print the first 1000 characters for inspection
     return text
 
+GSTIN_PATTERN = re.compile(r"\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[A-Z0-9]{1}[Z]{1}[A-Z0-9]{1}\b")
+GOODS_PATTERN = re.compile(r'\d+\.\s+(.*?)\s+(\d{8})\s+([\d\.]+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+([\d,]+)')
+
+# Marks where the line items go in FIELD_SPECS, so details keeps its usual key order
+LINE_ITEMS = None
+
+# Declarative table of the header fields, in the order extract_details fills them:
+# (field, labels, compiled pattern, search window after the label, default).
+# Every pattern starts with one of its labels, so a field whose labels don't occur
+# is skipped outright and the others are searched from their label onwards.
+# The window (in characters) bounds that first search; None searches to the end.
+FIELD_SPECS = [
+    ('GSTIN NO', ('GSTIN',), re.compile(r'GSTIN\s*NO\s*[:\-]?\s*([\w\d]+)'), 80, ""),
+    ('Company Name', ('BILL OF SUPPLY', 'TAX INVOICE'), re.compile(
+        r'^(?:BILL OF SUPPLY|TAX INVOICE)\s*[\r\n]?(M/s\s+[A-Z][A-Z0-9 &,-\.]+|[A-Z][A-Z0-9 &,-\.]+)',
+        re.MULTILINE), 200, "N/A"),
+    ('Invoice No', ('Invoice No.',), re.compile(r'Invoice No\.\s*[:\-]?\s*(\d+)'), 80, ""),
+    ('Date of Invoice', ('Date of Invoice',), re.compile(r'Date of Invoice\s*[:\-]?\s*([\d\-]+)'), 80, ""),
+    ('Shipped to', ('Shipped to',), re.compile(r'Shipped to\s*[:\-]?\s*([\s\S]+?)\s*FSSAI'), None, ""),
+    LINE_ITEMS,
+    # FSSAI comes in both "FSSAI NO. 123" and "FSSAI - 123" formats
+    ('FSSAI', ('FSSAI',), re.compile(r'FSSAI\s*NO\.?\s*[-]?\s*([\d]+)|FSSAI\s*[-]?\s*([\d]+)'), 80, ""),
+    ('Transport', ('Transport',), re.compile(r'Transport\s*[:\-]?\s*([\s\S]+?)\s+Despatch Date'), None, ""),
+    ('Vehicle No', ('Vehicle No.',), re.compile(r'Vehicle No\.\s*[:\-]?\s*([\w\d]+)'), 80, ""),
+    ('Licence No', ('Licence No',), re.compile(r'Licence No\s*[:\-]?\s*([\w\d]+)'), 80, ""),
+    ('Mobile No', ('Mobile No',), re.compile(r'Mobile No\s*[:\-]?\s*([\d]+)'), 80, ""),
+    ('PAN NO', ('PAN NO',), re.compile(r'PAN NO\s*[:\-]?\s*([\w\d]+)'), 80, ""),
+    ('TAN NO', ('TAN NO',), re.compile(r'TAN NO\s*[:\-]?\s*([\w\d\-]+)'), 80, ""),
+    ('STD', ('STD',), re.compile(r'STD\s*[:\-]?\s*([\d\-]+)'), 80, ""),
+    ('Place of Supply', ('Place of Supply',), re.compile(
+        r'Place of Supply\s*[:\-]?\s*([\w\s\(\)\d]+)(?=\s+Date of Invoice)'), None, ""),
+]
+
+FIELD_LABELS = sorted({label for spec in FIELD_SPECS if spec for label in spec[1]})
+
+# Function to find the first position of every field label in the text.
+# One str.find per label beats a single regex alternation pass over the text by
+# several times, since each find is a C-level substring search.
+def build_label_index(text):
+    index = {}
+    for label in FIELD_LABELS:
+        position = text.find(label)
+        if position != -1:
+            index[label] = position
+    return index
+
+# Function to return the last GSTIN in the text, same as GSTIN_PATTERN.findall(text)[-1].
+# A GSTIN is a whole 15 character word with "Z" in 14th place, so only the few
+# uppercase Z's in the text need checking, starting from the end.
+def find_last_gstin(text):
+    position = text.rfind("Z")
+    while position != -1:
+        start = position - 13
+        if start >= 0:
+            match = GSTIN_PATTERN.match(text, start)
+            if match is not None:
+                return match.group()
+        position = text.rfind("Z", 0, position)
+    return ""
+
+# Function to search a pattern from its label, trying a small window first.
+# A windowed match that stops short of the window edge is exactly what a search over
+# the rest of the text would return; anything else is retried without the window.
+def search_from_label(pattern, text, start, window):
+    if window is not None and start + window < len(text):
+        end = start + window
+        match = pattern.search(text, start, end)
+        if match is not None and match.end() < end:
+            return match
+    return pattern.search(text, start)
+
+def extract_line_items(text, details):
+    goods_description_match = GOODS_PATTERN.findall(text)
+
+    if goods_description_match:
+        for column in LINE_ITEM_COLUMNS:
+            details[column] = []
+
+        for match in goods_description_match:
+            if len(match) == 6:
+                goods, hsn, bags, pack, quintal, rate = match
+                quintal = quintal.replace(",", "")
+                rate = rate.replace(",", "")
+                amount = round(float(quintal) * float(rate), 2)
+                details['Goods Description'].append(goods)
+                details['HSN/SAC'].append(hsn)
+                details['Bags'].append(bags)
+                details['Pack'].append(pack)
+                details['Quintal'].append(quintal)
+                details['Rate'].append(rate)
+                details['Amount'].append(amount)
+
 # Function to extract relevant details using regex
 def extract_details(text):
     details = {}
 
     try:
-        gstin_pattern = r"\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[A-Z0-9]{1}[Z]{1}[A-Z0-9]{1}\b"
-        gstin_matches = re.findall(gstin_pattern, text)
-        details['GSTIN'] = gstin_matches[-1] if gstin_matches else ""
-
-        details['GSTIN NO'] = re.search(r'GSTIN\s*NO\s*[:\-]?\s*([\w\d]+)', text).group(1) if re.search(r'GSTIN\s*NO\s*[:\-]?\s*([\w\d]+)', text) else ""
-        
-        company_name_match = re.search(
-            r'^(?:BILL OF SUPPLY|TAX INVOICE)\s*[\r\n]?(M/s\s+[A-Z][A-Z0-9 &,-\.]+|[A-Z][A-Z0-9 &,-\.]+)',
-            text,
-            re.MULTILINE
-        )
-        
-        if company_name_match:
-            details['Company Name'] = company_name_match.group(1).strip()
-        else:
-            details['Company Name'] = "N/A"  # Default if no match is found
-
-
-        details['Invoice No'] = re.search(r'Invoice No\.\s*[:\-]?\s*(\d+)', text).group(1) if re.search(r'Invoice No\.\s*[:\-]?\s*(\d+)', text) else ""
-        details['Date of Invoice'] = re.search(r'Date of Invoice\s*[:\-]?\s*([\d\-]+)', text).group(1) if re.search(r'Date of Invoice\s*[:\-]?\s*([\d\-]+)', text) else ""
-
-        shipped_to_match = re.search(r'Shipped to\s*[:\-]?\s*([\s\S]+?)\s*FSSAI', text)
-        details['Shipped to'] = shipped_to_match.group(1).strip() if shipped_to_match else ""
-
-        goods_description_match = re.findall(r'\d+\.\s+(.*?)\s+(\d{8})\s+([\d\.]+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+([\d,]+)', text)
-
-        if goods_description_match:
-            details['Goods Description'] = []
-            details['HSN/SAC'] = []
-            details['Bags'] = []
-            details['Pack'] = []
-            details['Quintal'] = []
-            details['Rate'] = []
-            details['Amount'] = []
-            
-            for match in goods_description_match:
-                if len(match) == 6:  
-                    goods, hsn, bags, pack, quintal, rate = match
-                    quintal = quintal.replace(",", "")
-                    rate = rate.replace(",", "")
-                    amount = round(float(quintal) * float(rate), 2)
-                    details['Goods Description'].append(goods)
-                    details['HSN/SAC'].append(hsn)
-                    details['Bags'].append(bags)
-                    details['Pack'].append(pack)
-                    details['Quintal'].append(quintal)
-                    details['Rate'].append(rate)
-                    details['Amount'].append(amount)
-
-        # Updated regex pattern for FSSAI to accommodate both formats
-        fssai_match = re.search(r'FSSAI\s*NO\.?\s*[-]?\s*([\d]+)|FSSAI\s*[-]?\s*([\d]+)', text)
-        if fssai_match:
-            details['FSSAI'] = fssai_match.group(1) or fssai_match.group(2)
-        else:
-            details['FSSAI'] = ""
-
-        # Other fields extraction remains unchanged...
-        details['Transport'] = re.search(r'Transport\s*[:\-]?\s*([\s\S]+?)\s+Despatch Date', text).group(1).strip() if re.search(r'Transport\s*[:\-]?\s*([\s\S]+?)\s+Despatch Date', text) else ""
-        details['Vehicle No'] = re.search(r'Vehicle No\.\s*[:\-]?\s*([\w\d]+)', text).group(1) if re.search(r'Vehicle No\.\s*[:\-]?\s*([\w\d]+)', text) else ""
-        details['Licence No'] = re.search(r'Licence No\s*[:\-]?\s*([\w\d]+)', text).group(1) if re.search(r'Licence No\s*[:\-]?\s*([\w\d]+)', text) else ""
-        details['Mobile No'] = re.search(r'Mobile No\s*[:\-]?\s*([\d]+)', text).group(1) if re.search(r'Mobile No\s*[:\-]?\s*([\d]+)', text) else ""
-        
-        # Continue extracting other fields...
-        details['PAN NO'] = re.search(r'PAN NO\s*[:\-]?\s*([\w\d]+)', text).group(1) if re.search(r'PAN NO\s*[:\-]?\s*([\w\d]+)', text) else ""
-        details['TAN NO'] = re.search(r'TAN NO\s*[:\-]?\s*([\w\d\-]+)', text).group(1) if re.search(r'TAN NO\s*[:\-]?\s*([\w\d\-]+)', text) else ""
-        details['STD'] = re.search(r'STD\s*[:\-]?\s*([\d\-]+)', text).group(1) if re.search(r'STD\s*[:\-]?\s*([\d\-]+)', text) else ""
-        details['Place of Supply'] = re.search(r'Place of Supply\s*[:\-]?\s*([\w\s\(\)\d]+)(?=\s+Date of Invoice)', text).group(1).strip() if re.search(r'Place of Supply\s*[:\-]?\s*([\w\s\(\)\d]+)(?=\s+Date of Invoice)', text) else ""
+        details['GSTIN'] = find_last_gstin(text)
+
+        label_index = build_label_index(text)
+
+        for spec in FIELD_SPECS:
+            if spec is LINE_ITEMS:
+                extract_line_items(text, details)
+                continue
+
+            field, labels, pattern, window, default = spec
+            starts = [label_index[label] for label in labels if label in label_index]
+            match = search_from_label(pattern, text, min(starts), window) if starts else None
+            details[field] = match.group(match.lastindex).strip() if match else default
 
     except Exception as e:
         print(f"Error extracting data: {e}")
 
     return details
 
-# Function to write extracted details to an Excel file
+# Function to write extracted details to an Excel file, one invoice at a time
 def write_to_excel(all_details, output_path):
-    all_data_frames = []
-
-    for details in all_details:
-        goods_description = details.get('Goods Description', [])
-        hsn_sac = details.get('HSN/SAC', [])
-        bags = details.get('Bags', [])
-        pack = details.get('Pack', [])
-        quintal = details.get('Quintal', [])
-        rate = details.get('Rate', [])
-        amount = details.get('Amount', [])
-
-        goods_df = pd.DataFrame({
-            'Goods Description': goods_description,
-            'HSN/SAC': hsn_sac,
-            'Bags': bags,
-            'Pack': pack,
-            'Quintal': quintal,
-            'Rate': rate,
-            'Amount': amount,
-        })
-
-        for column in ['Company Name', 'Invoice No', 'FSSAI', 'Date of Invoice', 'GSTIN NO', 'GSTIN', 
-                       'PAN NO', 'TAN NO', 'STD', 'Shipped to', 'Transport', 
-                       'Place of Supply', 'Vehicle No', 'Licence No', 'Mobile No']:
-            value = details.get(column, "")
-            goods_df[column] = value  # Broadcast single value to all rows
-
-        all_data_frames.append(goods_df)
-
-    # Concatenate all DataFrames into one
-    final_df = pd.concat(all_data_frames, ignore_index=True)
-
-    # Replace empty values with a dash in specified columns
-    final_df = replace_empty_with_dash(final_df, ['Transport', 'Place of Supply', 'Vehicle No', 'Licence No', 'Mobile No'])
-
-    # Save to Excel
-    final_df.to_excel(output_path, index=False)
+    with open_sink(output_path, "xlsx") as sink:
+        for details in all_details:
+            sink.write_details(details)
     print(f"Data written to {output_path}")
 
-# Main execution
-def main():
-    print("Please select the PDF files:")
-    Tk().withdraw()  # Hides the root window
-    pdf_paths = askopenfilenames(filetypes=[("PDF files", "*.pdf")])  # Allow multiple file selection
+def _extract_pdf(pdf_path, ocr_workers, cache, trace, backend, ocr_engine, ner_fallback, stop_early=False,
+                 fingerprint=False, ocr_preprocess=None, templates=None, learn_templates=True, low_memory=None,
+                 memory=None):
+    if not templates:
+        return _extract_generic(pdf_path, ocr_workers, cache, trace, backend, ocr_engine, ner_fallback, stop_early,
+                                fingerprint, ocr_preprocess, low_memory, memory)
+
+    # Imported here: templates builds on this module
+    from templates import get_registry
+    registry = get_registry(templates, learn_templates)
+    # Scanned pages the template probe rendered, for the generic path to OCR as they are,
+    # and the first page of a layout no template knows yet, to learn it from
+    page_images = {}
+    unknown_layout = {}
+    # The template, the generic path and learning all read the one open document
+    with trace.span("open"):
+        doc = open_document(pdf_path, backend)
+    with doc:
+        match = registry.extract(doc, trace, ocr_engine, ocr_workers, cache, ocr_preprocess, page_images,
+                                 unknown_layout)
+        if match is not None and not match.verify:
+            trace.template = match.template_id
+            trace.pages, trace.ocr_pages, trace.skipped_pages = match.pages, match.ocr_pages, match.skipped_pages
+            if fingerprint:
+                trace.fingerprint = text_fingerprint(match.text)
+            company = match.details.get('Company Name', "")
+            trace.vendor = company if company not in ("", "N/A") else match.details.get('GSTIN NO', "")
+            return match.details
+
+        details = _extract_generic(pdf_path, ocr_workers, cache, trace, backend, ocr_engine, ner_fallback,
+                                   stop_early, fingerprint, ocr_preprocess, low_memory, memory, page_images, doc)
+        if match is not None:
+            # Every so often a template hit is checked against the generic result
+            registry.confirm(match, details)
+        elif unknown_layout and not trace.ocr_pages:
+            registry.learn(doc, pdf_path, details, unknown_layout, backend)
+    return details
+
+# Function to run the generic path on a document: hybrid text, then the regexes
+def _extract_generic(pdf_path, ocr_workers, cache, trace, backend, ocr_engine, ner_fallback, stop_early=False,
+                     fingerprint=False, ocr_preprocess=None, low_memory=None, memory=None, page_images=None,
+                     doc=None):
+    text, trace.pages, trace.ocr_pages = extract_hybrid_text(pdf_path, ocr_workers=ocr_workers, cache=cache,
+                                                             trace=trace, backend=backend, ocr_engine=ocr_engine,
+                                                             stop_early=stop_early, preprocess=ocr_preprocess,
+                                                             low_memory=low_memory, memory=memory,
+                                                             page_images=page_images, doc=doc)
+    if trace.ocr_pages:
+        print(f"OCR used on {trace.ocr_pages} of {trace.pages} page(s) of {pdf_path}")
+    if trace.skipped_pages:
+        print(f"Stopped after {trace.pages} of {trace.pages + trace.skipped_pages} page(s) of {pdf_path}")
+    if fingerprint:
+        trace.fingerprint = text_fingerprint(text)
+    return parse_text(text, trace, ner_fallback)
+
+# Function to compute the MinHash of a document's text for duplicate detection
+def text_fingerprint(text):
+    from dedup import minhash_signature, signature_to_hex
+    return signature_to_hex(minhash_signature(text))
+
+# Function to parse a document's text into details, with the NER fallback when asked for
+def parse_text(text, trace=NULL_TRACE, ner_fallback=False):
+    with trace.span("parse"):
+        details = extract_details(text)
+
+    if ner_fallback:
+        # Imported here: cascade builds on this module
+        from cascade import get_cascade
+        cascade = get_cascade()
+        ner_documents = cascade.stats.ner_documents
+        with trace.span("ner"):
+            trace.ner_fields = cascade.fill_missing(text, details)
+        trace.ner_used = cascade.stats.ner_documents > ner_documents
+
+    company = details.get('Company Name', "")
+    trace.vendor = company if company not in ("", "N/A") else details.get('GSTIN NO', "")
+    return details
 
+# Function to extract the details of a single PDF (runs inside a worker process).
+# Returns the stage timings and peak memory of the document along with its details.
+def process_pdf(pdf_path, ocr_workers=1, cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES,
+                profile_dir=None, backend=DEFAULT_BACKEND, ocr_engine=DEFAULT_ENGINE, ner_fallback=False,
+                stop_early=False, fingerprint=False, ocr_preprocess=None, templates=None, learn_templates=True,
+                low_memory=None, max_rss_mb=None):
+    trace = DocumentTrace(pdf_path)
+    memory = MemoryMonitor(max_rss_mb)
+    try:
+        cache = get_cache(cache_dir, cache_max_bytes) if cache_dir else None
+        if profile_dir:
+            details = profile_call(profile_dir, pdf_path, _extract_pdf, pdf_path, ocr_workers, cache, trace,
+                                   backend, ocr_engine, ner_fallback, stop_early, fingerprint, ocr_preprocess,
+                                   templates, learn_templates, low_memory, memory)
+        else:
+            details = _extract_pdf(pdf_path, ocr_workers, cache, trace, backend, ocr_engine, ner_fallback,
+                                   stop_early, fingerprint, ocr_preprocess, templates, learn_templates,
+                                   low_memory, memory)
+        trace.peak_rss_mb, trace.peak_rss_sampled = memory.peak_mb(), memory.sampled
+        return pdf_path, details, None, trace.to_dict()
+    except Exception as e:
+        trace.peak_rss_mb, trace.peak_rss_sampled = memory.peak_mb(), memory.sampled
+        if isinstance(e, MemoryError):
+            # Give the pages of the failed document back before the worker takes the next one
+            release_memory()
+        # A broken PDF must not take the whole batch down with it
+        return pdf_path, None, f"{type(e).__name__}: {e}", trace.to_dict()
+    finally:
+        memory.close()
+
+# Function to expand directories, globs and plain paths into a sorted list of PDFs
+def collect_pdf_paths(inputs):
+    pdf_paths = []
+    seen = set()
+
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "**", "*.pdf"), recursive=True)
+            matches += glob.glob(os.path.join(item, "**", "*.PDF"), recursive=True)
+        elif glob.has_magic(item):
+            matches = glob.glob(item, recursive=True)
+        else:
+            matches = [item]
+
+        for path in sorted(matches):
+            key = os.path.normcase(os.path.abspath(path))
+            if key not in seen:
+                seen.add(key)
+                pdf_paths.append(path)
+
+    return pdf_paths
+
+# Function to run process_pdf over many files, results come back in input order.
+# With a sink, each invoice is written as soon as it is ready and not kept in memory.
+def run_batch(pdf_paths, workers=None, ocr_workers=None, cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES,
+              sink=None, stats=None, profile_dir=None, backend=None, ocr_engine=None,
+              ner_fallback=False, on_result=None, stop_early=False, dedup=None, daemon=None, ocr_preprocess=None,
+              templates=None, learn_templates=True, low_memory=None, max_rss_mb=None):
     all_details = []
+    failures = []
+
+    workers = workers or os.cpu_count() or 1
+    # Left unset (None), OCR threads, backend and engine are the daemon's own with --daemon
+    daemon_settings = {"ocr_workers": ocr_workers, "backend": backend, "ocr_engine": ocr_engine}
+    if ocr_workers is None:
+        # Share the cores between document workers and their OCR threads
+        ocr_workers = max(1, (os.cpu_count() or 1) // workers)
+    options = {"ocr_workers": ocr_workers, "cache_dir": cache_dir, "cache_max_bytes": cache_max_bytes,
+               "profile_dir": profile_dir, "backend": backend or DEFAULT_BACKEND,
+               "ocr_engine": ocr_engine or DEFAULT_ENGINE,
+               "ner_fallback": ner_fallback, "stop_early": stop_early, "fingerprint": dedup is not None,
+               "ocr_preprocess": ocr_preprocess, "templates": templates, "learn_templates": learn_templates,
+               "low_memory": low_memory, "max_rss_mb": max_rss_mb}
+    worker = partial(process_pdf, **options)
+
+    executor = None
+    if daemon:
+        # The resident daemon runs process_pdf with its libraries already loaded
+        from daemon import submit
+        daemon_options = {name: value for name, value in options.items()
+                          if daemon_settings.get(name, value) is not None}
+        results = submit(pdf_paths, daemon_options, address=None if daemon is True else daemon)
+    elif workers == 1:
+        results = map(worker, pdf_paths)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(worker, pdf_paths, chunksize=1)
 
-    for pdf_path in pdf_paths:
-        print(f"Processing {pdf_path}...")
-        
-        text = extract_full_text(pdf_path)
-        
-        if not text.strip():
-            print("No text found in the PDF. Using OCR for text extraction.")
-            text = extract_text_from_image(pdf_path)
+    try:
+        for index, (pdf_path, details, error, trace) in enumerate(results, start=1):
+            fingerprint = trace.pop("fingerprint", None)
+            duplicate = None
+            if not error and dedup is not None:
+                duplicate = dedup.check(pdf_path, details, fingerprint)
+
+            if error:
+                print(f"[{index}/{len(pdf_paths)}] Failed {pdf_path}: {error}")
+                failures.append((pdf_path, error))
+            elif duplicate is not None:
+                # Reported by the deduplicator instead of written
+                print(f"[{index}/{len(pdf_paths)}] Duplicate ({duplicate.kind}) {pdf_path} "
+                      f"of {duplicate.duplicate_of}")
+            else:
+                print(f"[{index}/{len(pdf_paths)}] Processed {pdf_path}")
+                if sink is not None:
+                    started = time.perf_counter()
+                    sink.write_details(details, pdf_path)
+                    trace["stages"]["write"] += time.perf_counter() - started
+                else:
+                    all_details.append(details)
+
+            if stats is not None:
+                stats.add(trace)
+            if on_result is not None:
+                on_result(pdf_path, details, error)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return all_details, failures
+
+def select_pdf_paths_with_dialog():
+    from tkinter import Tk
+    from tkinter.filedialog import askopenfilenames
 
-        details = extract_details(text)
-        
-        all_details.append(details)
+    print("Please select the PDF files:")
+    Tk().withdraw()  # Hides the root window
+    return list(askopenfilenames(filetypes=[("PDF files", "*.pdf")]))  # Allow multiple file selection
+
+# Function to turn the command line options into run_batch keyword arguments
+def batch_options(args):
+    return {
+        "workers": args.workers,
+        "ocr_workers": args.ocr_workers,
+        "cache_dir": None if args.no_cache else args.cache_dir,
+        "cache_max_bytes": args.cache_size_mb * 1024 * 1024,
+        "profile_dir": args.profile,
+        "backend": args.backend,
+        "ocr_engine": args.ocr_engine,
+        "ner_fallback": args.ner_fallback,
+        "stop_early": args.stop_early,
+        "daemon": args.daemon,
+        "ocr_preprocess": ocr_preprocessor(args),
+        "templates": args.templates,
+        "learn_templates": not args.no_learn,
+        "low_memory": args.low_memory,
+        "max_rss_mb": args.max_rss,
+    }
+
+# Function to build the OCR preprocessor asked for on the command line, or None
+def ocr_preprocessor(args):
+    if not args.ocr_preprocess:
+        return None
+    from ocr_preprocess import OcrPreprocessor
+    return OcrPreprocessor(dpi=args.ocr_dpi, deskew=not args.no_deskew, roi=args.ocr_roi)
+
+# Function to check --ocr-roi as it is parsed; ocr_preprocess (and NumPy) is only imported
+# for boxes
+def ocr_roi_argument(value):
+    if value in ("auto", "page"):
+        return value
+    from ocr_preprocess import roi_argument
+    return roi_argument(value)
+
+# Function to open the output of a run: the file sink, plus the SQLite store with --db
+def open_output(args, append=False):
+    sink = open_sink(args.output, args.format, append=append)
+    if not args.db:
+        return sink
+    from result_store import StoreSink
+    return TeeSink([sink, StoreSink(args.db)])
+
+# Function to open the output of a run teed with its journal. A resumed run writes to the
+# journal (and --db) only: its output is rebuilt from the journal at the end.
+def open_journaled_output(args, journal):
+    if journal is None:
+        return open_output(args)
+    if not args.resume:
+        return TeeSink([open_output(args), journal.sink()])
+    if not args.db:
+        return journal.sink()
+    from result_store import StoreSink
+    return TeeSink([journal.sink(), StoreSink(args.db)])
+
+# Function to rebuild --output from the last journaled result of every file
+def consolidate_journal(args):
+    from journal import consolidate, journal_path
+    path = journal_path(args)
+    if not os.path.exists(path):
+        print(f"No journal at {path}")
+        return 1
+    invoices, rows = consolidate(path, args.output, args.format)
+    print(f"Consolidated {invoices} invoice(s), {rows} row(s) from {path} into {args.output}")
+    return 0
+
+# Function to open the duplicate index of a run, or None without --dedup
+def open_dedup(args):
+    if not args.dedup:
+        return None
+    from dedup import Deduplicator
+    return Deduplicator(args.dedup_db, report_path=args.dedup_report, threshold=args.dedup_threshold,
+                        require_match=not args.dedup_similarity_only)
+
+# Function to run a batch with the command line options, on the staged pipeline if asked for
+def run_files(pdf_paths, args, **kwargs):
+    if args.pipeline:
+        # Imported here: pipeline builds on this module
+        from pipeline import run_pipeline
+        return run_pipeline(pdf_paths, parse_workers=args.parse_workers, queue_size=args.queue_size,
+                            **batch_options(args), **kwargs)
+    return run_batch(pdf_paths, **batch_options(args), **kwargs)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Extract invoice details from PDF bills.")
+    parser.add_argument("inputs", nargs="*",
+                        help="PDF files, directories or glob patterns. Opens a file dialog when omitted.")
+    parser.add_argument("-o", "--output", default="consolidated_invoice_details.xlsx",
+                        help="Path of the consolidated output file.")
+    parser.add_argument("-f", "--format", choices=SINK_FORMATS, default=None,
+                        help="Output format (default: from the output file extension). "
+                             "csv and jsonl are flushed after every invoice. All formats have the same "
+                             "columns, except that parquet adds 'Date of Invoice Parsed' (a timestamp) "
+                             "after 'Date of Invoice', which is the date as written everywhere.")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(),
+                        help="Number of worker processes (1 runs everything in this process).")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help=f"PDF library used to read text layers and render pages for OCR "
+                             f"(default: {DEFAULT_BACKEND}, or the daemon's with --daemon).")
+    parser.add_argument("--ocr-workers", type=int, default=None,
+                        help="OCR threads per worker process (default: cores divided by --workers).")
+    parser.add_argument("--ocr-engine", choices=ENGINE_CHOICES, default=None,
+                        help="tesserocr keeps Tesseract loaded in each OCR thread; pytesseract runs the "
+                             "tesseract command per page. auto (the default, or the daemon's engine with "
+                             "--daemon) picks tesserocr when it is installed.")
+    parser.add_argument("--ocr-preprocess", action="store_true",
+                        help="Before OCR, render scanned pages at --ocr-dpi and convert them to grayscale, "
+                             "threshold (Otsu), deskew and crop them to --ocr-roi.")
+    parser.add_argument("--ocr-dpi", type=int, default=300,
+                        help="Resolution pages are rendered at for --ocr-preprocess.")
+    parser.add_argument("--ocr-roi", type=ocr_roi_argument, default="auto",
+                        help="Regions of a page sent to OCR with --ocr-preprocess: auto (the blocks of text, "
+                             "without the blank space around them), page, or boxes in page fractions as "
+                             "left,top,right,bottom;... e.g. 0,0,1,0.55 for the header and line items.")
+    parser.add_argument("--no-deskew", action="store_true", help="Skip the deskew step of --ocr-preprocess.")
+    parser.add_argument("--low-memory", nargs="?", type=int, const=1, default=None, metavar="PAGES",
+                        help="Read, render and OCR at most PAGES pages ahead (default 1) and release each "
+                             "page once done, for very long scanned PDFs.")
+    parser.add_argument("--max-rss", type=int, default=None, metavar="MB",
+                        help="Fail a document once its worker's resident memory stays over MB, "
+                             "instead of the worker being OOM-killed.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory for cached PDF text and OCR output.")
+    parser.add_argument("--cache-size-mb", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Evict least recently used cache entries above this size.")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always re-extract text, ignoring and not filling the cache.")
+    parser.add_argument("--ner-fallback", action="store_true",
+                        help="Run invoice_ner_model on documents where regex left Invoice No, GSTIN "
+                             "or Date of Invoice empty, and fill in what it finds.")
+    parser.add_argument("--stats", default=None,
+                        help="Write time per stage, per document and per vendor to this .json or .csv file.")
+    parser.add_argument("--profile", default=None, metavar="DIR",
+                        help="Run every document under cProfile and save <pdf>.<pid>.prof files in DIR. "
+                             "For py-spy, use --workers 1 so the whole run stays in one process.")
+    parser.add_argument("--db", default=None,
+                        help="Also store every invoice in this SQLite database (headers and line items, "
+                             "indexed for lookups; query it with result_store.py).")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Hold back invoices already seen in this or an earlier run: the same "
+                             "(GSTIN, Invoice No, Date of Invoice), or a re-scan with nearly the same text. "
+                             "Flagged pairs go to --dedup-report instead of the output.")
+    parser.add_argument("--dedup-db", default=".extraction_dedup.db",
+                        help="Index of the invoices seen so far (default: .extraction_dedup.db).")
+    parser.add_argument("--dedup-report", default="duplicate_invoices.csv",
+                        help="CSV the flagged duplicate pairs are appended to.")
+    parser.add_argument("--dedup-threshold", type=float, default=0.85,
+                        help="Estimated text similarity (0-1) above which two invoices are near-duplicates.")
+    parser.add_argument("--dedup-similarity-only", action="store_true",
+                        help="Flag near-duplicates on text similarity alone, without also requiring the "
+                             "same Invoice No or total.")
+    parser.add_argument("--daemon", nargs="?", const=True, default=None, metavar="ADDRESS",
+                        help="Send the files to a running daemon (python daemon.py start), which keeps the "
+                             "libraries and model loaded. Falls back to extracting here if none is running.")
+    parser.add_argument("--stop-early", action="store_true",
+                        help="Stop reading a PDF, and OCR-ing its pages, once every header field and the end "
+                             "of the line-item table (Grand Total) have been found. The pages after that are "
+                             "only checked for a later GSTIN, from the last page back, so the result is the "
+                             "same as a full read. Saves most of the work on long text-layer bills; scanned "
+                             "pages after the stop are OCR-ed back to the last one with a GSTIN.")
+    parser.add_argument("--templates", nargs="?", const=".extraction_templates.db", default=None, metavar="DB",
+                        help="Extract bills of known supplier layouts with their learned template (word "
+                             "positions, and OCR of only the regions that matter on scans), and learn the "
+                             "layout of new suppliers from their first text-layer bill. List them with "
+                             "python templates.py list.")
+    parser.add_argument("--no-learn", action="store_true",
+                        help="With --templates, use the known templates but don't learn new ones.")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Run loading, OCR, parsing and writing as separate overlapping stages with "
+                             "bounded queues between them. --workers sets the loading processes and "
+                             "--ocr-workers the OCR threads.")
+    parser.add_argument("--parse-workers", type=int, default=1,
+                        help="Parsing processes for --pipeline (raise this with --ner-fallback).")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="Documents that may wait in front of each --pipeline stage.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only process PDFs that are new or changed since the last run and append "
+                             "their rows to --output instead of rewriting it. A changed file's old rows "
+                             "are cut out of csv and jsonl output first; with xlsx they stay, and the "
+                             "change is reported.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep polling the inputs and process new PDFs as they arrive (implies --incremental).")
+    parser.add_argument("--manifest", default=None,
+                        help="Record of processed files for --incremental (default: <output>.manifest.json).")
+    parser.add_argument("--interval", type=float, default=30.0, help="Seconds between polls in --watch mode.")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="With --incremental or --resume, retry files that failed before.")
+    parser.add_argument("--journal", default=None,
+                        help="Per-file journal of results, synced after every file "
+                             "(default: <output>.journal.jsonl).")
+    parser.add_argument("--no-journal", action="store_true", help="Don't keep a journal of results.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip the files already in the journal and rebuild --output from it.")
+    parser.add_argument("--consolidate", action="store_true",
+                        help="Rebuild --output from the journal without extracting anything.")
+    return parser.parse_args(argv)
 
-    excel_path = "consolidated_invoice_details.xlsx"
-    write_to_excel(all_details, excel_path)
-    print(f"Extracted and consolidated data saved to {excel_path}")
+# Main execution
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.daemon:
+        from daemon import is_running
+        if not is_running(None if args.daemon is True else args.daemon):
+            print("No extraction daemon running; extracting here.")
+            args.daemon = None
+
+    # With --daemon the daemon resolves the engine, its own unless one was asked for.
+    # Without an engine, text-layer PDFs are still extracted; only pages that need OCR fail.
+    if not args.daemon:
+        args.ocr_engine = args.ocr_engine or DEFAULT_ENGINE
+        try:
+            args.ocr_engine = resolve_engine(args.ocr_engine)
+        except RuntimeError as e:
+            print(f"Warning: {e}; scanned pages will fail, text-layer PDFs are extracted as usual.")
+
+    if args.incremental or args.watch:
+        if not args.inputs:
+            print("--incremental and --watch need input directories, files or globs.")
+            return 2
+        from incremental import run_incremental
+        return run_incremental(args)
+
+    if args.consolidate:
+        return consolidate_journal(args)
+    if args.resume and args.no_journal:
+        print("--resume needs the journal; drop --no-journal.")
+        return 2
+
+    if args.inputs:
+        pdf_paths = collect_pdf_paths(args.inputs)
+    else:
+        pdf_paths = select_pdf_paths_with_dialog()
+
+    if not pdf_paths:
+        print("No PDF files to process.")
+        return 1
+
+    journal = None
+    if not args.no_journal:
+        from journal import Journal, journal_path
+        journal = Journal(journal_path(args), resume=args.resume)
+    if args.resume:
+        pending = journal.pending(pdf_paths, retry_failed=args.retry_failed)
+        print(f"Resuming: {len(pdf_paths) - len(pending)} of {len(pdf_paths)} file(s) already in {journal.path}")
+        pdf_paths = pending
+
+    stats = RunStats(keep_documents=bool(args.stats))
+    dedup = open_dedup(args)
+    failures = []
+    try:
+        if pdf_paths:
+            with open_journaled_output(args, journal) as sink:
+                _, failures = run_files(pdf_paths, args, sink=sink, stats=stats, dedup=dedup,
+                                        on_result=journal.on_result if journal is not None else None)
+    finally:
+        if dedup is not None:
+            dedup.close()
+        if journal is not None:
+            journal.close()
+    processed = len(pdf_paths) - len(failures)
+    if args.resume:
+        # The output of a resumed run is rebuilt from the journal, earlier runs included
+        consolidate_journal(args)
+    else:
+        print(f"Extracted and consolidated data of {processed} file(s) saved to {args.output}")
+
+    stats.print_summary()
+    if dedup is not None:
+        dedup.print_summary()
+    if args.stats:
+        stats.write(args.stats)
+        print(f"Run statistics saved to {args.stats}")
+
+    if failures:
+        print(f"{len(failures)} of {len(pdf_paths)} file(s) failed:")
+        for pdf_path, error in failures:
+            print(f"  {pdf_path}: {error}")
+
+    return 1 if failures and not processed else 0
 
 if __name__ == "__main__":
-    main()
+    raise SystemExit(main())
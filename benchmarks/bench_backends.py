@@ -0,0 +1,80 @@
+# Compares the PDF backends on the same corpus: throughput of text extraction and
+# page rendering, and whether extract_details gets the same fields out of both.
+#
+#   python benchmarks/bench_backends.py --corpus path/to/pdfs
+#   python benchmarks/bench_backends.py -n 100 --pages 3
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from Extraction import extract_details
+from pdf_backends import open_document, BACKENDS
+from generate_invoices import generate_corpus
+
+
+def read_corpus(paths, backend, render=False):
+    texts = []
+    pages = 0
+    started = time.perf_counter()
+    for path in paths:
+        with open_document(path, backend) as doc:
+            page_texts = []
+            for page_number in range(len(doc)):
+                page_texts.append(doc.page_text(page_number))
+                if render:
+                    doc.render(page_number)
+            pages += len(doc)
+        texts.append("".join(page_texts))
+    return texts, pages, time.perf_counter() - started
+
+
+# Function to list the fields extract_details reads differently from the two texts
+def field_differences(text_a, text_b):
+    details_a, details_b = extract_details(text_a), extract_details(text_b)
+    return sorted(field for field in set(details_a) | set(details_b)
+                  if details_a.get(field) != details_b.get(field))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark and cross-check the PDF backends.")
+    parser.add_argument("--corpus", help="Directory of PDFs (default: a generated corpus).")
+    parser.add_argument("-n", "--count", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--render", action="store_true", help="Also render every page, as OCR would.")
+    parser.add_argument("--reference", default="pdfplumber", choices=sorted(BACKENDS))
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            paths = sorted(glob.glob(os.path.join(args.corpus, "*.pdf")))
+        else:
+            paths = [path for path, _, _ in generate_corpus(tmp, args.count, args.pages)]
+
+        results = {}
+        for backend in sorted(BACKENDS):
+            texts, pages, seconds = read_corpus(paths, backend, args.render)
+            results[backend] = texts
+            print(f"{backend:<11} {seconds:8.3f}s  {len(paths) / seconds:8.1f} docs/s  {pages / seconds:8.1f} pages/s")
+
+    reference = results[args.reference]
+    for backend, texts in results.items():
+        if backend == args.reference:
+            continue
+        mismatched = 0
+        for path, text_a, text_b in zip(paths, reference, texts):
+            differences = field_differences(text_a, text_b)
+            if differences:
+                mismatched += 1
+                print(f"  {os.path.basename(path)}: {backend} differs on {', '.join(differences)}")
+        print(f"{backend} vs {args.reference}: {len(paths) - mismatched}/{len(paths)} documents "
+              f"with identical extract_details output")
+
+
+if __name__ == "__main__":
+    main()
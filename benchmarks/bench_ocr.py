@@ -0,0 +1,147 @@
+# OCR benchmark: time per page and field accuracy of scanned invoices, with and without
+# the NumPy preprocessing of ocr_preprocess.py.
+#
+#   python benchmarks/bench_ocr.py -n 20 --max-skew 2.5 --roi auto
+#
+# Every invoice is written twice from the same lines: as a text PDF, whose regex details
+# are the ground truth, and as a scan turned by a random skew. The scans are OCR-ed as
+# before (72 DPI render, no preprocessing) and with preprocessing, and each run reports
+# seconds per page, the share of it spent preprocessing, and how many header fields and
+# line items come out equal to the truth. Results go to benchmarks/results/ocr-<label>.json.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import Extraction
+from output_sinks import HEADER_COLUMNS, LINE_ITEM_COLUMNS
+from pdf_backends import open_document
+from ocr_preprocess import OcrPreprocessor
+from generate_invoices import invoice_lines, write_invoice_pdf
+from bench_pipeline import RESULTS_DIR, tesseract_available, _git_commit
+
+
+# Function to write the text and scanned copies of each invoice; returns [(text pdf, scan pdf, skew)]
+def generate_pairs(output_dir, count, pages, line_items, max_skew, seed=0):
+    rng = random.Random(seed)
+    pairs = []
+    for number in range(count):
+        lines = invoice_lines(rng, 100 + number, line_items, pages)
+        skew = round(rng.uniform(-max_skew, max_skew), 2)
+        text_path = os.path.join(output_dir, f"invoice_{number:05d}.pdf")
+        scan_path = os.path.join(output_dir, f"invoice_{number:05d}_scan.pdf")
+        write_invoice_pdf(text_path, lines, pages)
+        write_invoice_pdf(scan_path, lines, pages, scanned=True, skew=skew)
+        pairs.append((text_path, scan_path, skew))
+    return pairs
+
+
+# Function to score OCR-ed details against the truth: matching header fields, and line
+# items whose every column matches
+def field_accuracy(details, truth):
+    headers = [column for column in HEADER_COLUMNS if truth.get(column) not in (None, "", "N/A")]
+    header_hits = sum(details.get(column) == truth[column] for column in headers)
+    truth_items = list(zip(*(truth.get(column, []) for column in LINE_ITEM_COLUMNS)))
+    items = set(zip(*(details.get(column, []) for column in LINE_ITEM_COLUMNS)))
+    item_hits = sum(item in items for item in truth_items)
+    return header_hits, len(headers), item_hits, len(truth_items)
+
+
+# Function to OCR every scan with one preprocessor (None: the plain 72 DPI path)
+def run_ocr(pairs, truths, preprocess):
+    page_seconds = []
+    preprocess_seconds = 0.0
+    header_hits = header_total = item_hits = item_total = 0
+
+    for (_, scan_path, _), truth in zip(pairs, truths):
+        page_texts = []
+        with open_document(scan_path) as doc:
+            for page_number in range(len(doc)):
+                started = time.perf_counter()
+                image = doc.render(page_number, Extraction.render_resolution(preprocess))
+                if preprocess is not None:
+                    prepared = time.perf_counter()
+                    image = preprocess(image)
+                    preprocess_seconds += time.perf_counter() - prepared
+                page_texts.append(Extraction.ocr_page_image(image))
+                page_seconds.append(time.perf_counter() - started)
+
+        hits = field_accuracy(Extraction.extract_details("".join(page_texts)), truth)
+        header_hits += hits[0]
+        header_total += hits[1]
+        item_hits += hits[2]
+        item_total += hits[3]
+
+    total = sum(page_seconds)
+    return {
+        "pages": len(page_seconds),
+        "seconds_per_page": round(total / len(page_seconds), 4),
+        "median_seconds_per_page": round(statistics.median(page_seconds), 4),
+        "preprocess_share": round(preprocess_seconds / total, 3) if total else 0.0,
+        "header_accuracy": round(header_hits / header_total, 4) if header_total else None,
+        "line_item_accuracy": round(item_hits / item_total, 4) if item_total else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark OCR speed and accuracy with and without preprocessing.")
+    parser.add_argument("-n", "--count", type=int, default=10, help="Invoices to generate.")
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--line-items", type=int, default=5)
+    parser.add_argument("--max-skew", type=float, default=2.0, help="Largest scan skew in degrees.")
+    parser.add_argument("--dpi", type=int, default=300, help="Render resolution with preprocessing.")
+    parser.add_argument("--roi", default="auto", help="Regions sent to OCR (see Extraction.py --ocr-roi).")
+    parser.add_argument("--label", default=None, help="Name of the saved result (default: git commit).")
+    args = parser.parse_args(argv)
+
+    if not tesseract_available():
+        print("tesseract is not installed; nothing to benchmark")
+        return 2
+
+    modes = {
+        "baseline": None,
+        "preprocessed": OcrPreprocessor(dpi=args.dpi, roi="page"),
+        "preprocessed_roi": OcrPreprocessor(dpi=args.dpi, roi=args.roi),
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        pairs = generate_pairs(tmp, args.count, args.pages, args.line_items, args.max_skew)
+        truths = [Extraction.extract_details(Extraction.extract_full_text(text_path)) for text_path, _, _ in pairs]
+        print(f"Corpus: {len(pairs)} scanned invoice(s), skew up to {args.max_skew} degrees\n")
+
+        results = {}
+        for name, preprocess in modes.items():
+            results[name] = run_ocr(pairs, truths, preprocess)
+            result = results[name]
+            print(f"{name:<17} {result['seconds_per_page']:7.3f}s/page  "
+                  f"preprocess {result['preprocess_share']:6.1%}  "
+                  f"headers {result['header_accuracy'] or 0:6.1%}  line items {result['line_item_accuracy'] or 0:6.1%}")
+
+    commit = _git_commit()
+    result = {
+        "label": args.label or commit or time.strftime("%Y%m%d-%H%M%S"),
+        "git_commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {"documents": args.count, "pages": args.pages, "line_items": args.line_items,
+                   "max_skew": args.max_skew, "dpi": args.dpi, "roi": args.roi},
+        "ocr": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    result_path = os.path.join(RESULTS_DIR, f"ocr-{result['label']}.json")
+    with open(result_path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults saved to {result_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,242 @@
+# Stage-by-stage benchmark of the extraction pipeline:
+#
+#   python benchmarks/bench_pipeline.py -n 200 --pages 2 --scanned-ratio 0.3
+#
+# Each run is saved to benchmarks/results/<label>.json and compared with the
+# newest earlier result; the exit code is 1 when a stage's throughput drops
+# by more than --threshold.
+import os
+import sys
+import gc
+import json
+import time
+import glob
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import Extraction
+from pdf_backends import open_document
+from generate_invoices import generate_corpus
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+MODEL_DIR = os.path.join(REPO_ROOT, "model", "invoice_ner_model")
+
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Function to time one stage; a second, traced run gives the peak Python heap of the stage
+# (tracemalloc slows code down, so it never runs during the timed pass)
+def run_stage(name, fn, docs, pages, measure_memory=True):
+    gc.collect()
+    started = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - started
+
+    stage = {
+        "seconds": round(seconds, 6),
+        "docs": docs,
+        "pages": pages,
+        "docs_per_s": round(docs / seconds, 3) if seconds else None,
+        "pages_per_s": round(pages / seconds, 3) if seconds else None,
+    }
+
+    if measure_memory:
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        stage["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 3)
+        tracemalloc.stop()
+
+    print(f"{name:<10} {seconds:9.3f}s  {stage['docs_per_s'] or 0:10.1f} docs/s  "
+          f"{stage['pages_per_s'] or 0:10.1f} pages/s  peak {stage.get('peak_mb', '-')} MB")
+    return stage, result
+
+
+def tesseract_available():
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+
+def run_benchmarks(corpus, repeat=1, measure_memory=True, with_ner=True):
+    text_docs = [(path, pages) for path, pages, scanned in corpus if not scanned]
+    scanned_docs = [(path, pages) for path, pages, scanned in corpus if scanned]
+    stages = {}
+    texts = []
+    text_pages = 0
+
+    if text_docs:
+        stage, texts = run_stage(
+            "text", lambda: [Extraction.extract_full_text(path) for path, _ in text_docs],
+            len(text_docs), sum(pages for _, pages in text_docs), measure_memory)
+        stages["extract_full_text"] = stage
+        text_pages += stage["pages"]
+
+    if scanned_docs:
+        if tesseract_available():
+            stage, ocr_texts = run_stage(
+                "ocr", lambda: [Extraction.extract_text_from_image(path) for path, _ in scanned_docs],
+                len(scanned_docs), sum(pages for _, pages in scanned_docs), measure_memory)
+            stages["extract_text_from_image"] = stage
+            texts = texts + ocr_texts
+            text_pages += stage["pages"]
+        else:
+            print("ocr        skipped (tesseract not installed)")
+
+    if not texts:
+        return stages
+
+    pages = text_pages * repeat
+    stage, all_details = run_stage(
+        "details", lambda: [Extraction.extract_details(text) for text in texts * repeat],
+        len(texts) * repeat, pages, measure_memory)
+    stages["extract_details"] = stage
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output_path = os.path.join(tmp, "bench.xlsx")
+        stage, _ = run_stage("excel", lambda: Extraction.write_to_excel(all_details, output_path),
+                             len(all_details), pages, measure_memory)
+        stages["write_to_excel"] = stage
+
+    if with_ner:
+        try:
+            import spacy
+        except ImportError:
+            print("ner        skipped (spacy not installed)")
+            return stages
+
+        started = time.perf_counter()
+        nlp = spacy.load(MODEL_DIR)
+        stages["ner_load"] = {"seconds": round(time.perf_counter() - started, 6)}
+        print(f"ner load   {stages['ner_load']['seconds']:9.3f}s")
+
+        # Same preprocessing as model/training.py
+        ner_texts = [text.replace("\n", " ") for text in texts]
+        stage, _ = run_stage("ner", lambda: list(nlp.pipe(ner_texts)),
+                             len(ner_texts), text_pages, measure_memory)
+        stages["ner"] = stage
+
+    return stages
+
+
+# Function to find the newest saved result other than the one just written
+def latest_result(exclude=None):
+    # startup-*.json and ocr-*.json come from bench_startup.py and bench_ocr.py, which have
+    # no stages to compare
+    paths = [path for path in glob.glob(os.path.join(RESULTS_DIR, "*.json"))
+             if path != exclude and not os.path.basename(path).startswith(("startup-", "ocr-"))]
+    return max(paths, key=os.path.getmtime) if paths else None
+
+
+# Function to print throughput changes against an earlier result; returns the regressed stages
+def compare_results(current, previous, threshold=0.10):
+    regressions = []
+    print(f"\nCompared with {previous.get('label')} ({previous.get('git_commit')}):")
+
+    for name, stage in current["stages"].items():
+        before = previous.get("stages", {}).get(name)
+        if not before:
+            continue
+
+        if stage.get("docs_per_s") and before.get("docs_per_s"):
+            change = stage["docs_per_s"] / before["docs_per_s"] - 1
+        elif stage.get("seconds") and before.get("seconds"):
+            change = before["seconds"] / stage["seconds"] - 1
+        else:
+            continue
+
+        flag = "  REGRESSION" if change < -threshold else ""
+        print(f"  {name:<24} {change:+7.1%}{flag}")
+        if flag:
+            regressions.append(name)
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the invoice extraction pipeline stage by stage.")
+    parser.add_argument("--corpus", help="Directory of PDFs to use instead of a generated corpus "
+                                         "(files named *_scan.pdf count as scanned).")
+    parser.add_argument("-n", "--count", type=int, default=20, help="Invoices to generate.")
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--line-items", type=int, default=5)
+    parser.add_argument("--scanned-ratio", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="Times extract_details runs over the extracted texts.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced peak-memory runs.")
+    parser.add_argument("--no-ner", action="store_true", help="Skip the spaCy model.")
+    parser.add_argument("--label", default=None, help="Name of the saved result (default: git commit).")
+    parser.add_argument("--compare", default=None,
+                        help="Result file to compare against (default: the newest saved result).")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Throughput drop that counts as a regression.")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.corpus:
+            corpus = []
+            for path in sorted(glob.glob(os.path.join(args.corpus, "*.pdf"))):
+                with open_document(path) as doc:
+                    corpus.append((path, len(doc), path.endswith("_scan.pdf")))
+        else:
+            corpus = generate_corpus(tmp, args.count, args.pages, args.line_items, args.scanned_ratio)
+
+        print(f"Corpus: {len(corpus)} document(s), {sum(p for _, p, _ in corpus)} page(s)\n")
+        stages = run_benchmarks(corpus, args.repeat, not args.no_memory, not args.no_ner)
+
+    commit = _git_commit()
+    result = {
+        "label": args.label or commit or time.strftime("%Y%m%d-%H%M%S"),
+        "git_commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "corpus": {"source": args.corpus or "generated", "documents": len(corpus),
+                   "pages": sum(p for _, p, _ in corpus),
+                   "scanned": sum(1 for _, _, scanned in corpus if scanned),
+                   "line_items": args.line_items, "repeat": args.repeat},
+        "stages": stages,
+        "max_rss_mb": _max_rss_mb(),
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    result_path = os.path.join(RESULTS_DIR, f"{result['label']}.json")
+    with open(result_path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults saved to {result_path}")
+
+    previous_path = args.compare or latest_result(exclude=result_path)
+    if previous_path:
+        with open(previous_path) as f:
+            regressions = compare_results(result, json.load(f), args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
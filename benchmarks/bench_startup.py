@@ -0,0 +1,118 @@
+# Startup benchmark: what a script that hands Extraction.py one file pays per call.
+#
+#   python benchmarks/bench_startup.py --repeat 5 [--ner]
+#
+# Times, in fresh interpreters, the import of Extraction, a one-file run, and the same
+# run sent to a resident daemon (python daemon.py start). The median of --repeat runs
+# is saved to benchmarks/results/startup-<label>.json.
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from generate_invoices import generate_corpus
+from bench_pipeline import RESULTS_DIR, MODEL_DIR, _git_commit
+
+
+def time_command(command, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(command, cwd=REPO_ROOT, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return {"median_s": round(statistics.median(timings), 4), "min_s": round(min(timings), 4),
+            "runs": len(timings)}
+
+
+def wait_for_daemon(address, timeout=120):
+    from daemon import is_running
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if is_running(address):
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def run_benchmarks(pdf_path, output_path, repeat, with_ner):
+    python = sys.executable
+    extraction = os.path.join(REPO_ROOT, "Extraction.py")
+    one_file = [python, extraction, pdf_path, "-o", output_path, "--no-cache", "-w", "1"]
+    if with_ner:
+        one_file.append("--ner-fallback")
+    results = {}
+
+    def run(name, command):
+        results[name] = time_command(command, repeat)
+        print(f"{name:<16} {results[name]['median_s']:8.3f}s median  {results[name]['min_s']:8.3f}s min")
+
+    run("import", [python, "-c", "import Extraction"])
+    run("help", [python, extraction, "--help"])
+    run("one_file", one_file)
+
+    address = os.path.join(tempfile.gettempdir(), f"bench-extraction-{os.getpid()}.sock")
+    if sys.platform == "win32":
+        address = rf"\\.\pipe\bench-extraction-{os.getpid()}"
+    daemon_command = [python, os.path.join(REPO_ROOT, "daemon.py"), "start", "--address", address]
+    if with_ner:
+        daemon_command.append("--ner-fallback")
+
+    started = time.perf_counter()
+    daemon = subprocess.Popen(daemon_command, cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_daemon(address):
+            print("Daemon did not start; skipping the daemon run")
+            return results
+        results["daemon_start"] = {"median_s": round(time.perf_counter() - started, 4), "min_s": None, "runs": 1}
+        print(f"{'daemon_start':<16} {results['daemon_start']['median_s']:8.3f}s")
+        run("one_file_daemon", one_file + ["--daemon", address])
+    finally:
+        subprocess.run([python, os.path.join(REPO_ROOT, "daemon.py"), "stop", "--address", address],
+                       cwd=REPO_ROOT, stdout=subprocess.DEVNULL)
+        daemon.wait(timeout=30)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the start-up cost of one-file runs.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--ner", action="store_true", help="Include --ner-fallback (needs the trained model).")
+    parser.add_argument("--label", default=None, help="Name of the saved result (default: git commit).")
+    args = parser.parse_args(argv)
+
+    if args.ner and not os.path.isdir(MODEL_DIR):
+        print(f"No model at {MODEL_DIR}; run without --ner")
+        return 2
+
+    with tempfile.TemporaryDirectory() as tmp:
+        (pdf_path, _, _), = generate_corpus(tmp, 1, 1, 5, 0.0)
+        results = run_benchmarks(pdf_path, os.path.join(tmp, "out.csv"), args.repeat, args.ner)
+
+    commit = _git_commit()
+    result = {
+        "label": args.label or commit or time.strftime("%Y%m%d-%H%M%S"),
+        "git_commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "ner": args.ner,
+        "startup": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    result_path = os.path.join(RESULTS_DIR, f"startup-{result['label']}.json")
+    with open(result_path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults saved to {result_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,159 @@
+import os
+import random
+import argparse
+import fitz  # PyMuPDF
+
+# Synthetic supplier bills laid out like "tani 21.pdf", so the regexes in
+# Extraction.extract_details find the same fields on them.
+
+COMPANIES = ["M/s SAI RICE MILL", "TANISHQ AGRO INDUSTRIES", "M/s SHREE BALAJI TRADERS",
+             "GURUKRUPA FOOD PRODUCTS", "M/s MAHALAXMI AGRO", "VIDARBHA GRAIN CORPORATION"]
+BUYERS = ["AVENUE SUPERMARTS LTD. (TURBHE)", "AVENUE SUPERMARTS LTD.(VADUNAVGHAR)",
+          "AVENUE SUPERMARTS LTD (RAMCHANDRAPURAM)", "RELIANCE RETAIL LTD. (NAGPUR)"]
+GOODS = ["RICE", "WHEAT", "TOOR DAL", "CHANA DAL", "MOONG DAL", "JOWAR"]
+TRANSPORTS = ["SAIKRUPA LORRY ARRENGERS", "KANAKADURGA TRANSPORT", "SHIV SHAKTI ROADLINES"]
+STATES = [("Maharashtra", 27), ("Telangana", 36), ("Karnataka", 29)]
+
+LINES_PER_PAGE = 60
+
+
+def _gstin(rng, state_code):
+    letters = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    return (f"{state_code:02d}" + "".join(rng.choice(letters) for _ in range(5))
+            + f"{rng.randrange(10000):04d}" + rng.choice(letters) + str(rng.randrange(1, 10)) + "Z"
+            + rng.choice(letters + "0123456789"))
+
+
+def _indian_amount(value):
+    whole, fraction = f"{value:.2f}".split(".")
+    if len(whole) > 3:
+        head, tail = whole[:-3], whole[-3:]
+        groups = []
+        while len(head) > 2:
+            groups.insert(0, head[-2:])
+            head = head[:-2]
+        if head:
+            groups.insert(0, head)
+        whole = ",".join(groups + [tail])
+    return f"{whole}.{fraction}"
+
+
+# Function to build the text lines of one invoice, padded out to the requested page count
+def invoice_lines(rng, invoice_no, line_items, pages):
+    state, state_code = rng.choice(STATES)
+    title = rng.choice(["BILL OF SUPPLY", "TAX INVOICE"])
+    company = rng.choice(COMPANIES)
+    # A supplier keeps its GSTIN from bill to bill
+    supplier_gstin = _gstin(random.Random(company), 27)
+    buyer_gstin = _gstin(rng, state_code)
+    buyer = rng.choice(BUYERS)
+    day, month = rng.randrange(1, 29), rng.randrange(1, 13)
+    date = f"{day:02d}-{month:02d}-2023"
+    fssai = str(rng.randrange(10 ** 13, 10 ** 14))
+
+    lines = [
+        "Subject to Mul Jurisdiction",
+        title,
+        company,
+        "At Rajoli, Tah Mul-441224",
+        "Dist - CHANDRAPUR (M.S)",
+        f"GSTIN NO : {supplier_gstin} MOBILE NO :94{rng.randrange(10 ** 8):08d}",
+        f"FSSAI : {rng.randrange(10 ** 13, 10 ** 14)}",
+        f"PAN NO : {supplier_gstin[2:11]} STD :07174-220370",
+        f"TAN NO : NGPVO-{rng.randrange(10000):04d}A",
+        f"Invoice No. : {invoice_no} Place of Supply : {state} ({state_code})",
+        f"Date of Invoice : {date} (05:28 PM) Reverse Charge : N",
+        "Billed to : Shipped to :",
+        f"{buyer} {buyer}",
+        "C/40 T.T.C. INDUSTRIAL AREA, C/40 T.T.C. INDUSTRIAL AREA,",
+        f"FSSAI NO. {fssai} FSSAI NO. {fssai}",
+        f"GSTIN : {buyer_gstin} GSTIN : {buyer_gstin}",
+        "S.N. DESCRIPTION OF GOODS HSN/SAC BAGS PACK QUINTAL RATE AMOUNT",
+    ]
+
+    total = 0.0
+    for number in range(1, line_items + 1):
+        bags = rng.randrange(20, 800)
+        quintal = round(bags * 0.26, 2)
+        rate = rng.choice([4800, 5500, 5750, 6200])
+        amount = quintal * rate
+        total += amount
+        lines.append(f"{number}. {rng.choice(GOODS)} 1006{rng.randrange(10000):04d} {bags} 0.260 "
+                     f"{quintal:.2f} {_indian_amount(rate)} {_indian_amount(amount)}")
+
+    lines += [
+        f"Grand Total {_indian_amount(total)}",
+        f"Transport : {rng.choice(TRANSPORTS)} Despatch Date : {date}",
+        f"Vehicle No. : MH{rng.randrange(10, 50)}GR{rng.randrange(10000):04d} Total Qtl : 150.02",
+        f"Licence No : {rng.randrange(1000, 9999)}",
+        f"Mobile No : 83{rng.randrange(10 ** 8):08d}",
+    ]
+
+    # Extra pages carry terms and conditions, as long bills do
+    while len(lines) < pages * LINES_PER_PAGE - LINES_PER_PAGE // 2:
+        lines.append(f"Terms {len(lines)}: goods once sold will not be taken back. E.&O.E.")
+    return lines
+
+
+# Function to write one invoice PDF; scanned ones have their pages rasterised into images,
+# turned by `skew` degrees as a page fed crooked into a scanner would be
+def write_invoice_pdf(path, lines, pages, scanned=False, dpi=150, skew=0.0):
+    doc = fitz.open()
+    for page_number in range(pages):
+        page = doc.new_page(width=595, height=842)
+        chunk = lines[page_number * LINES_PER_PAGE:(page_number + 1) * LINES_PER_PAGE]
+        page.insert_text((36, 40), "\n".join(chunk), fontsize=8.5, lineheight=1.45)
+
+    if scanned:
+        scan = fitz.open()
+        for page in doc:
+            pix = page.get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+            scan_page = scan.new_page(width=page.rect.width, height=page.rect.height)
+            if skew:
+                from PIL import Image
+                image = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+                image = image.rotate(skew, resample=Image.BICUBIC, fillcolor=255)
+                pix = fitz.Pixmap(fitz.csGRAY, pix.width, pix.height, image.tobytes(), False)
+            scan_page.insert_image(scan_page.rect, pixmap=pix)
+        doc.close()
+        doc = scan
+
+    doc.save(path, deflate=True)
+    doc.close()
+
+
+# Function to generate a corpus; returns [(path, pages, scanned)]
+def generate_corpus(output_dir, count=20, pages=1, line_items=5, scanned_ratio=0.0, seed=0):
+    os.makedirs(output_dir, exist_ok=True)
+    rng = random.Random(seed)
+    corpus = []
+
+    for number in range(count):
+        scanned = rng.random() < scanned_ratio
+        lines = invoice_lines(rng, 100 + number, line_items, pages)
+        path = os.path.join(output_dir, f"invoice_{number:05d}{'_scan' if scanned else ''}.pdf")
+        write_invoice_pdf(path, lines, pages, scanned=scanned)
+        corpus.append((path, pages, scanned))
+
+    return corpus
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic invoice PDFs for benchmarking.")
+    parser.add_argument("output_dir")
+    parser.add_argument("-n", "--count", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=1)
+    parser.add_argument("--line-items", type=int, default=5)
+    parser.add_argument("--scanned-ratio", type=float, default=0.0,
+                        help="Fraction of invoices written as scanned images without a text layer.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    corpus = generate_corpus(args.output_dir, args.count, args.pages, args.line_items,
+                             args.scanned_ratio, args.seed)
+    scanned = sum(1 for _, _, is_scanned in corpus if is_scanned)
+    print(f"Wrote {len(corpus)} invoice(s) ({scanned} scanned) to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
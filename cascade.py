@@ -0,0 +1,156 @@
+# Regex first, NER only where regex came back empty.
+#
+# extract_details is cheap but only knows the layouts its patterns were written for;
+# invoice_ner_model covers the same labels at a much higher cost per document. The
+# cascade runs the regex pass on everything and sends the model only the documents
+# that are missing a required field, and of those only a window after the field's
+# label when the label is present. Model results fill empty fields and never
+# overwrite what regex found.
+from collections import Counter
+
+from Extraction import extract_details, build_label_index, FIELD_SPECS
+from output_sinks import LINE_ITEM_COLUMNS
+
+REQUIRED_FIELDS = ('Invoice No', 'GSTIN', 'Date of Invoice')
+
+# Values extract_details uses for "not found"
+EMPTY_VALUES = ("", "N/A")
+
+FIELD_LABELS = {spec[0]: spec[1] for spec in FIELD_SPECS if spec}
+FIELD_LABELS['GSTIN'] = ('GSTIN',)
+
+
+def is_empty(value):
+    return value is None or value == [] or (isinstance(value, str) and value.strip() in EMPTY_VALUES)
+
+
+class CascadeStats:
+    def __init__(self):
+        self.documents = 0
+        self.ner_documents = 0
+        self.ner_windows = 0
+        self.ner_whole_documents = 0
+        self.missing_after_regex = Counter()
+        self.filled_by_ner = Counter()
+        self.missing_after_ner = Counter()
+
+    def to_dict(self):
+        return {
+            "documents": self.documents,
+            "ner_documents": self.ner_documents,
+            "ner_rate": self.ner_documents / self.documents if self.documents else 0.0,
+            "ner_windows": self.ner_windows,
+            "ner_whole_documents": self.ner_whole_documents,
+            "missing_after_regex": dict(self.missing_after_regex),
+            "filled_by_ner": dict(self.filled_by_ner),
+            "missing_after_ner": dict(self.missing_after_ner),
+        }
+
+    def print_summary(self):
+        print(f"NER fallback ran on {self.ner_documents} of {self.documents} document(s) "
+              f"({self.ner_windows} window(s), {self.ner_whole_documents} whole document(s))")
+        for field, count in self.missing_after_regex.most_common():
+            print(f"  {field:<16} missing after regex {count:5d}, filled by NER {self.filled_by_ner[field]:5d}")
+
+
+class CascadingExtractor:
+    def __init__(self, required_fields=REQUIRED_FIELDS, model_dir=None, window_chars=400,
+                 batch_size=32, n_process=1):
+        self.required_fields = tuple(required_fields)
+        self.model_dir = model_dir
+        self.window_chars = window_chars
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.stats = CascadeStats()
+
+    def missing_fields(self, details):
+        return [field for field in self.required_fields if is_empty(details.get(field))]
+
+    # Function to pick the text the model should see for the missing fields: a window after
+    # each field's label, or the whole document when a label is nowhere in the text
+    def ner_windows(self, text, missing):
+        label_index = build_label_index(text)
+        starts = set()
+        for field in missing:
+            positions = [label_index[label] for label in FIELD_LABELS.get(field, ()) if label in label_index]
+            if not positions:
+                return [text]
+            starts.add(min(positions))
+        return [text[start:start + self.window_chars] for start in sorted(starts)]
+
+    def _run_ner(self, texts):
+        from model.inference import extract_entities, MODEL_DIR
+        return list(extract_entities(texts, batch_size=self.batch_size, n_process=self.n_process,
+                                     model_dir=self.model_dir or MODEL_DIR))
+
+    # Function to decide which windows of a document need the model (none if nothing is missing)
+    def plan(self, text, details):
+        self.stats.documents += 1
+        missing = self.missing_fields(details)
+        if not missing:
+            return []
+
+        self.stats.ner_documents += 1
+        self.stats.missing_after_regex.update(missing)
+        windows = self.ner_windows(text, missing)
+        if len(windows) == 1 and windows[0] is text:
+            self.stats.ner_whole_documents += 1
+        else:
+            self.stats.ner_windows += len(windows)
+        return windows
+
+    # Function to extract many documents: one regex pass each, then a single batched
+    # model call over the windows of every document that still has gaps
+    def extract_many(self, texts):
+        results = [extract_details(text) for text in texts]
+        jobs = []  # (document index, window text)
+
+        for index, (text, details) in enumerate(zip(texts, results)):
+            jobs.extend((index, window) for window in self.plan(text, details))
+
+        if jobs:
+            entities = self._run_ner([window for _, window in jobs])
+            for (index, _), fields in zip(jobs, entities):
+                self.merge(results[index], fields)
+
+            for index in sorted({index for index, _ in jobs}):
+                self.stats.missing_after_ner.update(self.missing_fields(results[index]))
+
+        return results
+
+    def extract(self, text):
+        return self.extract_many([text])[0]
+
+    # Function to run the model on an already regex-parsed document; returns the fields it filled
+    def fill_missing(self, text, details):
+        windows = self.plan(text, details)
+        if not windows:
+            return []
+
+        before = {field for field in FIELD_LABELS if is_empty(details.get(field))}
+        for fields in self._run_ner(windows):
+            self.merge(details, fields)
+        self.stats.missing_after_ner.update(self.missing_fields(details))
+        return sorted(field for field in before if not is_empty(details.get(field)))
+
+    # Function to fill the empty header fields of details from the model output (first window wins).
+    # Line items stay as regex found them, so their columns keep the same length.
+    def merge(self, details, ner_fields):
+        for field, value in ner_fields.items():
+            if field in LINE_ITEM_COLUMNS:
+                continue
+            if is_empty(details.get(field)) and not is_empty(value):
+                details[field] = value
+                if field in self.required_fields:
+                    self.stats.filled_by_ner[field] += 1
+        return details
+
+
+_extractors = {}
+
+# Function to get one extractor per process and settings, so the model loads once per worker
+def get_cascade(required_fields=REQUIRED_FIELDS, **options):
+    key = (tuple(required_fields), tuple(sorted(options.items())))
+    if key not in _extractors:
+        _extractors[key] = CascadingExtractor(required_fields, **options)
+    return _extractors[key]
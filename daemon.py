@@ -0,0 +1,235 @@
+# Resident extraction daemon.
+#
+# A one-off run of Extraction.py spends most of its time importing pdfplumber and the
+# OCR engine and, with --ner-fallback, loading invoice_ner_model. The daemon does that
+# once and then serves extraction jobs over a local socket (a Unix socket, or a named
+# pipe on Windows), so scripts that handle one or two files at a time get warm
+# libraries on every call:
+#
+#   python daemon.py start --ner-fallback &
+#   python Extraction.py bill.pdf --daemon
+#   python daemon.py status
+#   python daemon.py stop
+#
+# Connections are authenticated with a random key kept in a file only the user can read.
+import os
+import sys
+import time
+import getpass
+import secrets
+import argparse
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+KEY_PATH = os.path.join(os.path.expanduser("~"), ".invoice_extraction_daemon.key")
+
+
+def default_address():
+    user = getpass.getuser()
+    if sys.platform == "win32":
+        return rf"\\.\pipe\invoice-extraction-{user}"
+    return os.path.join(tempfile.gettempdir(), f"invoice-extraction-{user}.sock")
+
+
+# Function to read the shared key, creating it (readable by the user only) the first time
+def load_key(create=False):
+    if not os.path.exists(KEY_PATH):
+        if not create:
+            return None
+        fd = os.open(KEY_PATH, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    with open(KEY_PATH) as f:
+        return f.read().strip().encode()
+
+
+class ExtractionDaemon:
+    def __init__(self, address=None, jobs=1, ocr_engine="auto", ocr_workers=None, backend=None,
+                 ner_fallback=False):
+        self.address = address or default_address()
+        self.started = time.time()
+        self.served = 0
+        self.ocr_engine = ocr_engine
+        self.ocr_workers = ocr_workers or os.cpu_count() or 1
+        self.backend = backend
+        self.ner_fallback = ner_fallback
+        # Documents extracted at the same time; the OCR pool already spreads pages over the cores
+        self._slots = threading.BoundedSemaphore(jobs)
+        self._stop = threading.Event()
+
+    # Function to import and load everything a job needs before the first one arrives
+    def warm_up(self):
+        started = time.perf_counter()
+        import Extraction
+        from pdf_backends import DEFAULT_BACKEND
+        from ocr_engines import get_ocr_pool, resolve_engine
+
+        self.backend = self.backend or DEFAULT_BACKEND
+        # Backends import their library on first open; do it now
+        if self.backend == "pymupdf":
+            import fitz  # noqa: F401
+        else:
+            import pdfplumber  # noqa: F401
+        try:
+            self.ocr_engine = resolve_engine(self.ocr_engine)
+        except RuntimeError as e:
+            # Text-layer PDFs don't need one; the engine is looked for again when a page does
+            print(f"Warning: {e}; scanned pages will fail, text-layer PDFs are extracted as usual.")
+        else:
+            pool = get_ocr_pool(self.ocr_engine, self.ocr_workers)
+            pool.submit(lambda engine: engine).result()
+        Extraction.ocr_settings(self.ocr_engine)
+
+        if self.ner_fallback:
+            from cascade import get_cascade
+            from model.inference import load_model, MODEL_DIR
+            get_cascade()
+            load_model(MODEL_DIR)
+        print(f"Warmed up in {time.perf_counter() - started:.2f}s")
+
+    def _handle(self, conn):
+        from Extraction import process_pdf
+
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except EOFError:
+                    return
+
+                op = request.get("op")
+                if op == "ping":
+                    conn.send({"pid": os.getpid(), "uptime": time.time() - self.started, "served": self.served,
+                               "ocr_engine": self.ocr_engine, "backend": self.backend,
+                               "ner_fallback": self.ner_fallback})
+                elif op == "extract":
+                    # The client sends only what was asked for; the rest are the daemon's settings
+                    options = dict(request.get("options", {}))
+                    options.setdefault("ocr_workers", self.ocr_workers)
+                    options.setdefault("backend", self.backend)
+                    options.setdefault("ocr_engine", self.ocr_engine)
+                    options["ner_fallback"] = options.get("ner_fallback") or self.ner_fallback
+                    # One reply per document, as soon as it is done
+                    for pdf_path in request["paths"]:
+                        with self._slots:
+                            result = process_pdf(pdf_path, **options)
+                        self.served += 1
+                        conn.send(("result",) + result)
+                    conn.send(("done",))
+                elif op == "shutdown":
+                    conn.send({"stopping": True})
+                    self._stop.set()
+                    # Wake the accept() call so serve_forever can return
+                    try:
+                        Client(self.address, authkey=load_key()).close()
+                    except (OSError, AuthenticationError):
+                        pass
+                    return
+                else:
+                    conn.send({"error": f"unknown op {op!r}"})
+
+    def serve_forever(self):
+        if sys.platform != "win32" and os.path.exists(self.address):
+            if is_running(self.address):
+                raise RuntimeError(f"A daemon is already listening on {self.address}")
+            os.remove(self.address)  # left behind by a daemon that was killed
+
+        self.warm_up()
+        listener = Listener(self.address, authkey=load_key(create=True))
+        print(f"Listening on {self.address} (pid {os.getpid()})")
+        try:
+            while not self._stop.is_set():
+                try:
+                    conn = listener.accept()
+                except (OSError, AuthenticationError) as e:
+                    print(f"Rejected connection: {e}")
+                    continue
+                if self._stop.is_set():
+                    conn.close()
+                    break
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+        print("Daemon stopped.")
+
+
+def connect(address=None):
+    key = load_key()
+    if key is None:
+        raise ConnectionRefusedError("No daemon key; start one with: python daemon.py start")
+    return Client(address or default_address(), authkey=key)
+
+
+def is_running(address=None):
+    try:
+        with connect(address) as conn:
+            conn.send({"op": "ping"})
+            conn.recv()
+        return True
+    except (OSError, EOFError, AuthenticationError):
+        return False
+
+
+# Function to run process_pdf on the daemon for each path; yields the same
+# (pdf_path, details, error, trace) tuples, in order, under the caller's own paths.
+# Paths are made absolute because the daemon has its own working directory.
+def submit(pdf_paths, options=None, address=None):
+    options = dict(options or {})
+    for name in ("cache_dir", "profile_dir", "templates"):
+        if options.get(name):
+            options[name] = os.path.abspath(options[name])
+
+    with connect(address) as conn:
+        conn.send({"op": "extract", "paths": [os.path.abspath(path) for path in pdf_paths], "options": options})
+        for pdf_path in pdf_paths:
+            reply = conn.recv()
+            if reply[0] != "result":
+                raise RuntimeError(f"Unexpected reply from the daemon: {reply!r}")
+            _, _, details, error, trace = reply
+            yield pdf_path, details, error, trace
+        conn.recv()  # ("done",)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Keep the extraction libraries and model loaded between runs.")
+    parser.add_argument("command", choices=("start", "stop", "status"))
+    parser.add_argument("--address", default=None, help=f"Socket to listen on (default: {default_address()}).")
+    parser.add_argument("--jobs", type=int, default=1, help="Documents extracted at the same time.")
+    parser.add_argument("--ocr-engine", default="auto")
+    parser.add_argument("--ocr-workers", type=int, default=None)
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--ner-fallback", action="store_true", help="Load invoice_ner_model at start.")
+    args = parser.parse_args(argv)
+
+    if args.command == "start":
+        daemon = ExtractionDaemon(args.address, args.jobs, args.ocr_engine, args.ocr_workers, args.backend,
+                                  args.ner_fallback)
+        try:
+            daemon.serve_forever()
+        except RuntimeError as e:
+            print(e)
+            return 1
+        except KeyboardInterrupt:
+            print("Daemon stopped.")
+        return 0
+
+    try:
+        with connect(args.address) as conn:
+            conn.send({"op": "ping" if args.command == "status" else "shutdown"})
+            reply = conn.recv()
+    except (OSError, EOFError, AuthenticationError):
+        print("No daemon running.")
+        return 1
+
+    if args.command == "status":
+        print(f"Daemon pid {reply['pid']}, up {reply['uptime']:.0f}s, {reply['served']} document(s) served, "
+              f"OCR {reply['ocr_engine']}, backend {reply['backend']}, NER {'on' if reply['ner_fallback'] else 'off'}")
+    else:
+        print("Daemon stopping.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
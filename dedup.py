@@ -0,0 +1,266 @@
+# Duplicate and near-duplicate invoice detection.
+#
+# Exact duplicates are caught by a hash key on (GSTIN, Invoice No, Date of Invoice),
+# with the supplier's GSTIN NO used when present since invoice numbers are per supplier.
+# Re-scans and OCR variants of a bill already seen are caught by MinHash over character
+# shingles of the extracted text, with LSH banding: each document is looked up in
+# LSH_BANDS index buckets instead of being compared with the whole history, so the
+# cost per document stays flat as the history grows to hundreds of thousands of
+# invoices. Candidates from the buckets are confirmed on their estimated Jaccard
+# similarity. Invoices of the same supplier share most of their template text, so by
+# default a candidate must also match on the invoice number or the total, whichever of
+# them the invoice has; with require_match=False (--dedup-similarity-only) the similarity
+# alone decides.
+#
+# The history lives in SQLite next to the results, and flagged invoices are written
+# to a report instead of the output.
+import os
+import re
+import csv
+import zlib
+import sqlite3
+import hashlib
+
+import numpy as np
+
+SHINGLE_CHARS = 5
+NUM_PERMUTATIONS = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+DEFAULT_THRESHOLD = 0.85
+# Shingle hashes permuted at a time: NUM_PERMUTATIONS x this many uint64 is 4 MB
+SHINGLE_CHUNK = 4096
+
+DEFAULT_DEDUP_DB = ".extraction_dedup.db"
+REPORT_COLUMNS = ["kind", "similarity", "pdf_path", "duplicate_of", "gstin", "invoice_no", "date_of_invoice"]
+
+_MERSENNE_PRIME = (1 << 31) - 1
+# Fixed seed: signatures are stored and must stay comparable between runs
+_random = np.random.RandomState(20231)
+_PERM_A = _random.randint(1, _MERSENNE_PRIME, NUM_PERMUTATIONS).astype(np.uint64)
+_PERM_B = _random.randint(0, _MERSENNE_PRIME, NUM_PERMUTATIONS).astype(np.uint64)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoice_keys (
+    key TEXT PRIMARY KEY,
+    pdf_path TEXT
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    pdf_path TEXT,
+    invoice_no TEXT,
+    total REAL,
+    signature BLOB
+);
+CREATE INDEX IF NOT EXISTS documents_pdf_path ON documents (pdf_path);
+CREATE INDEX IF NOT EXISTS documents_invoice_no ON documents (invoice_no);
+CREATE INDEX IF NOT EXISTS documents_total ON documents (total);
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    band INTEGER,
+    bucket INTEGER,
+    document_id INTEGER,
+    PRIMARY KEY (band, bucket, document_id)
+) WITHOUT ROWID;
+"""
+
+
+# Lowercased, with whitespace runs collapsed, so layout differences between scans don't count
+def normalise_text(text):
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+# Function to compute the MinHash signature (NUM_PERMUTATIONS uint32 values) of a text
+def minhash_signature(text):
+    text = normalise_text(text)
+    shingles = {text[i:i + SHINGLE_CHARS] for i in range(max(1, len(text) - SHINGLE_CHARS + 1))}
+    hashes = np.fromiter((zlib.crc32(shingle.encode()) & _MERSENNE_PRIME for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    # a * h + b stays below 2**63 because a, b and h are all below 2**31. The shingles go
+    # through in chunks with a running minimum, so memory stays bounded on long texts.
+    signature = np.full(NUM_PERMUTATIONS, _MERSENNE_PRIME, dtype=np.uint64)
+    for start in range(0, len(hashes), SHINGLE_CHUNK):
+        permuted = (np.outer(_PERM_A, hashes[start:start + SHINGLE_CHUNK]) + _PERM_B[:, None]) % _MERSENNE_PRIME
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.astype(np.uint32)
+
+
+def signature_to_hex(signature):
+    return signature.tobytes().hex()
+
+
+def signature_from_bytes(data):
+    return np.frombuffer(data, dtype=np.uint32)
+
+
+def similarity(signature, other):
+    return float(np.mean(signature == other))
+
+
+# One bucket id per band; 7 bytes so it fits a signed SQLite integer
+def band_buckets(signature):
+    return [int.from_bytes(hashlib.blake2b(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes(),
+                                           digest_size=7).digest(), "big")
+            for band in range(LSH_BANDS)]
+
+
+def invoice_key(details):
+    gstin = details.get('GSTIN NO') or details.get('GSTIN') or ""
+    invoice_no = details.get('Invoice No', "")
+    date = details.get('Date of Invoice', "")
+    if not invoice_no or not date or not gstin:
+        return None
+    return hashlib.sha1(f"{gstin.upper()}|{invoice_no.strip()}|{date.strip()}".encode()).hexdigest()
+
+
+def invoice_total(details):
+    try:
+        return round(sum(float(amount) for amount in details.get('Amount', [])), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+class Duplicate:
+    def __init__(self, kind, duplicate_of, similarity=1.0):
+        self.kind = kind
+        self.duplicate_of = duplicate_of
+        self.similarity = similarity
+
+
+class Deduplicator:
+    def __init__(self, path=DEFAULT_DEDUP_DB, report_path=None, threshold=DEFAULT_THRESHOLD, commit_every=200,
+                 require_match=True):
+        self.path = path
+        self.threshold = threshold
+        self.require_match = require_match
+        self.commit_every = commit_every
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.flagged = []
+        self._uncommitted = 0
+
+        self._report = None
+        if report_path:
+            new_report = not os.path.exists(report_path) or os.path.getsize(report_path) == 0
+            self._report = open(report_path, "a", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._report)
+            if new_report:
+                self._writer.writerow(REPORT_COLUMNS)
+
+    # Candidates are the documents sharing at least one LSH bucket, looked up on the bucket
+    # table's primary key, then narrowed to those with the same invoice number or total.
+    # An empty invoice number or a zero total matches nothing, so it is left out of that
+    # filter, and without either the similarity alone decides.
+    def _near_duplicate(self, pdf_path, signature, buckets, details):
+        sql = ("SELECT DISTINCT d.id, d.pdf_path, d.signature FROM lsh_buckets b "
+               "JOIN documents d ON d.id = b.document_id WHERE ("
+               + " OR ".join(["(b.band = ? AND b.bucket = ?)"] * len(buckets)) + ")")
+        params = [value for band, bucket in enumerate(buckets) for value in (band, bucket)]
+
+        if self.require_match:
+            invoice_no = details.get('Invoice No', "")
+            total = invoice_total(details)
+            matches = []
+            if invoice_no:
+                matches.append("d.invoice_no = ?")
+                params.append(invoice_no)
+            if total:
+                matches.append("d.total = ?")
+                params.append(total)
+            if matches:
+                sql += " AND (" + " OR ".join(matches) + ")"
+
+        candidates = {document_id: (other_path, data)
+                      for document_id, other_path, data in self.conn.execute(sql, params)}
+
+        best = None
+        for other_path, data in candidates.values():
+            if other_path == pdf_path:
+                continue
+            score = similarity(signature, signature_from_bytes(data))
+            if score >= self.threshold and (best is None or score > best.similarity):
+                best = Duplicate("near", other_path, score)
+        return best
+
+    # Function to check an invoice against everything seen so far and remember it.
+    # Returns None for a new invoice, or a Duplicate naming the earlier file it repeats.
+    # The same file processed again (same path) is not its own duplicate.
+    def check(self, pdf_path, details, signature_hex=None):
+        key = invoice_key(details)
+        known_key = False
+        if key is not None:
+            row = self.conn.execute("SELECT pdf_path FROM invoice_keys WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] != pdf_path:
+                return self._flag(pdf_path, details, Duplicate("exact", row[0]))
+            known_key = row is not None
+
+        signature = buckets = None
+        if signature_hex:
+            signature = signature_from_bytes(bytes.fromhex(signature_hex))
+            buckets = band_buckets(signature)
+            duplicate = self._near_duplicate(pdf_path, signature, buckets, details)
+            if duplicate is not None:
+                return self._flag(pdf_path, details, duplicate)
+            if self.conn.execute("SELECT 1 FROM documents WHERE pdf_path = ?", (pdf_path,)).fetchone():
+                signature = None
+
+        if key is not None and not known_key:
+            self.conn.execute("INSERT INTO invoice_keys (key, pdf_path) VALUES (?, ?)", (key, pdf_path))
+        if signature is not None:
+            cursor = self.conn.execute(
+                "INSERT INTO documents (pdf_path, invoice_no, total, signature) VALUES (?, ?, ?, ?)",
+                (pdf_path, details.get('Invoice No', ""), invoice_total(details), signature.tobytes()))
+            self.conn.executemany("INSERT OR IGNORE INTO lsh_buckets (band, bucket, document_id) VALUES (?, ?, ?)",
+                                  [(band, bucket, cursor.lastrowid) for band, bucket in enumerate(buckets)])
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self.commit()
+        return None
+
+    # Function to forget what was seen of a file, before a changed version of it is checked
+    def forget(self, pdf_path):
+        for document_id, data in self.conn.execute(
+                "SELECT id, signature FROM documents WHERE pdf_path = ?", (pdf_path,)).fetchall():
+            self.conn.executemany("DELETE FROM lsh_buckets WHERE band = ? AND bucket = ? AND document_id = ?",
+                                  [(band, bucket, document_id)
+                                   for band, bucket in enumerate(band_buckets(signature_from_bytes(data)))])
+        self.conn.execute("DELETE FROM documents WHERE pdf_path = ?", (pdf_path,))
+        self.conn.execute("DELETE FROM invoice_keys WHERE pdf_path = ?", (pdf_path,))
+        self.commit()
+
+    def _flag(self, pdf_path, details, duplicate):
+        row = [duplicate.kind, round(duplicate.similarity, 3), pdf_path, duplicate.duplicate_of,
+               details.get('GSTIN NO') or details.get('GSTIN', ""), details.get('Invoice No', ""),
+               details.get('Date of Invoice', "")]
+        self.flagged.append(row)
+        if self._report is not None:
+            self._writer.writerow(row)
+            self._report.flush()
+        return duplicate
+
+    def commit(self):
+        self.conn.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+        if self._report is not None:
+            self._report.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def print_summary(self):
+        if not self.flagged:
+            print("No duplicate invoices found.")
+            return
+        exact = sum(1 for row in self.flagged if row[0] == "exact")
+        print(f"Held back {len(self.flagged)} duplicate invoice(s): {exact} exact, "
+              f"{len(self.flagged) - exact} near-duplicate")
+        for kind, score, pdf_path, duplicate_of, *_ in self.flagged:
+            print(f"  {pdf_path} -> {duplicate_of} ({kind}, {score:.2f})")
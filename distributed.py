@@ -0,0 +1,480 @@
+# Distributed batch runs: several machines (or containers, or just processes) pull PDFs
+# from one shared work queue, extract them with the usual process_pdf path, and leave
+# one result per document in the queue; a merge step writes the consolidated sheet.
+#
+#   python distributed.py submit /mnt/shared/queue /mnt/shared/inbox --stop-early   # prints the batch id
+#   python distributed.py work /mnt/shared/queue -w 8        # on every node
+#   python distributed.py status /mnt/shared/queue --batch <id>
+#   python distributed.py merge /mnt/shared/queue --batch <id> -o consolidated_invoice_details.xlsx
+#
+# Every submit is a batch of its own. merge and status take one with --batch; without it
+# they cover every job the queue has held.
+#
+# The queue is either
+#   - a SQLite file (*.db, *.sqlite): jobqueue.JobQueue, for nodes on one host or
+#     containers sharing a local volume (SQLite in WAL mode must not be used over NFS/SMB)
+#   - a directory: DirectoryQueue below, for nodes on different hosts sharing a network
+#     file system. Claims and results are atomic renames; a lease is the age of the
+#     claimed file, which its worker touches while it works.
+#
+# Either way a claimed job whose worker dies goes back to the queue once its lease runs
+# out, up to --max-attempts times. PDF paths are stored absolute, so the inbox must be
+# mounted at the same path on every node. Trying it on one machine is just a matter of
+# starting `work` in a few terminals, or once with -w N: every process claims on its own
+# and behaves like a separate node.
+import os
+import json
+import glob
+import time
+import uuid
+import heapq
+import random
+import argparse
+import threading
+import multiprocessing
+
+from jobqueue import JobQueue, worker_name, STATUSES, DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+# Seconds an idle worker waits before looking at the queue again
+DEFAULT_POLL_SECONDS = 5.0
+# Queued job names a directory queue worker claims from between listings
+CLAIM_WINDOW = 64
+
+
+# Function to write a JSON file so readers only ever see it complete
+def _write_json(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Work queue on a shared directory, with the same methods as JobQueue:
+#
+#   queued/<id>.<attempts>.json             waiting to be claimed
+#   running/<id>.<attempts>.<worker>.json   claimed; the lease runs from the file's last change
+#   done/<id>.json, failed/<id>.json        the job with its details or error
+#   batches/<batch id>.<stamp>.json         the ids of the jobs one submit added to a batch
+#
+# A job file is written once, when enqueued; its state is the directory it is in and its
+# name. Whoever renames it first owns the move, so two workers can't claim the same job
+# and a requeued job can't be finished by the worker that lost it. Every submit writes
+# its own batch file, so concurrent submits to one batch never overwrite each other.
+#
+# Listing a directory of a network file system costs a round trip per few hundred names,
+# so a worker doesn't list queued/ for every claim: it keeps the CLAIM_WINDOW oldest
+# names of its last listing, shuffled so workers don't all race for the same file, and
+# lists again once they are used up. Expired leases are looked for at most once per
+# lease interval.
+class DirectoryQueue:
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        for status in STATUSES + ("batches",):
+            os.makedirs(self._dir(status), exist_ok=True)
+        self._candidates = []
+        self._next_requeue = 0.0
+
+    def _dir(self, status):
+        return os.path.join(self.path, status)
+
+    # Worker names carry the host name; keep them free of the dots that separate the fields
+    @staticmethod
+    def _owner(worker):
+        return worker.replace(".", "_").replace(":", "_").replace(os.sep, "_")
+
+    def enqueue_many(self, pdf_paths, options=None, batch_id=None):
+        # Ids sort in the order jobs were enqueued, across batches too
+        stamp = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        batch_id = batch_id or stamp
+        ids = []
+        for index, pdf_path in enumerate(pdf_paths):
+            job_id = f"{stamp}-{index:07d}"
+            tmp_path = os.path.join(self.path, f"{job_id}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"id": job_id, "batch_id": batch_id, "pdf_path": pdf_path, "options": options or {},
+                           "created_at": time.time()}, f, ensure_ascii=False)
+            ids.append(job_id)
+        # The batch is listed before its jobs can be claimed, so none finishes unlisted
+        _write_json(os.path.join(self._dir("batches"), f"{self._owner(batch_id)}.{stamp}.json"), ids)
+        for job_id in ids:
+            os.replace(os.path.join(self.path, f"{job_id}.tmp"), os.path.join(self._dir("queued"), f"{job_id}.0.json"))
+        return ids
+
+    # Function to get the ids of a batch's jobs, from every submit to it; None stands for every job
+    def _batch_ids(self, batch_id):
+        if batch_id is None:
+            return None
+        ids = set()
+        prefix = os.path.join(glob.escape(self._dir("batches")), glob.escape(self._owner(batch_id)))
+        # A queue from before per-submit batch files holds one <batch id>.json
+        for path in glob.glob(f"{prefix}.*.json") + glob.glob(f"{prefix}.json"):
+            ids.update(_read_json(path))
+        return ids
+
+    def enqueue(self, pdf_path, options=None, batch_id=None):
+        return self.enqueue_many([pdf_path], options, batch_id)[0]
+
+    # A rename counts as a change (ctime) on POSIX file systems, so a lease starts the
+    # moment its job is claimed; renew() touches the file
+    def _lease_started(self, path):
+        stat = os.stat(path)
+        return max(stat.st_mtime, stat.st_ctime)
+
+    # Function to put the jobs of dead workers back in the queue, or fail them once they
+    # have used up their attempts
+    def _requeue_expired(self, now):
+        for name in os.listdir(self._dir("running")):
+            path = os.path.join(self._dir("running"), name)
+            try:
+                if self._lease_started(path) + self.lease_seconds >= now:
+                    continue
+            except FileNotFoundError:
+                continue
+            job_id, attempts, _, _ = name.split(".", 3)
+            try:
+                if int(attempts) >= self.max_attempts:
+                    failed_path = os.path.join(self._dir("failed"), f"{job_id}.json")
+                    os.rename(path, failed_path)
+                    job = _read_json(failed_path)
+                    job.update(status="failed", attempts=int(attempts), finished_at=now,
+                               error=f"Lease expired {attempts} time(s); giving up")
+                    _write_json(failed_path, job)
+                else:
+                    os.rename(path, os.path.join(self._dir("queued"), f"{job_id}.{attempts}.json"))
+            except FileNotFoundError:
+                # Someone else got there first
+                continue
+
+    # Function to take the next names to claim from: the oldest of the queue, in random order
+    def _list_candidates(self):
+        names = heapq.nsmallest(CLAIM_WINDOW, (name for name in os.listdir(self._dir("queued"))
+                                               if name.endswith(".json")))
+        random.shuffle(names)
+        return names
+
+    def claim(self, worker=None, lease_seconds=None):
+        worker = worker or worker_name()
+        now = time.time()
+        if now >= self._next_requeue:
+            self._requeue_expired(now)
+            self._next_requeue = now + self.lease_seconds
+        listed = False
+        while True:
+            if not self._candidates:
+                if listed:
+                    return None
+                self._candidates = self._list_candidates()
+                listed = True
+                continue
+            name = self._candidates.pop()
+            job_id, attempts, _ = name.split(".")
+            attempts = int(attempts) + 1
+            path = os.path.join(self._dir("running"), f"{job_id}.{attempts}.{self._owner(worker)}.json")
+            try:
+                os.rename(os.path.join(self._dir("queued"), name), path)
+            except FileNotFoundError:
+                continue  # another worker claimed it
+            os.utime(path)
+            job = _read_json(path)
+            job.update(status="running", attempts=attempts, worker=worker, started_at=time.time())
+            return job
+
+    def _running_path(self, job_id, worker):
+        paths = glob.glob(os.path.join(glob.escape(self._dir("running")), f"{job_id}.*.{self._owner(worker)}.json"))
+        return paths[0] if paths else None
+
+    def renew(self, job_id, worker, lease_seconds=None):
+        path = self._running_path(job_id, worker)
+        if path is None:
+            return False
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, job_id, worker, details, trace=None):
+        return self._finish(job_id, worker, "done", details=details, trace=trace)
+
+    def fail(self, job_id, worker, error, trace=None):
+        return self._finish(job_id, worker, "failed", error=error, trace=trace)
+
+    # The result is published before the claim is dropped: a worker that dies in between
+    # leaves a job that is run again, never one that is lost
+    def _finish(self, job_id, worker, status, details=None, trace=None, error=None):
+        path = self._running_path(job_id, worker)
+        if path is None:
+            return False
+        try:
+            job = _read_json(path)
+        except FileNotFoundError:
+            return False
+        job.update(status=status, attempts=int(os.path.basename(path).split(".")[1]), worker=worker,
+                   details=details, trace=trace, error=error, finished_at=time.time())
+        _write_json(os.path.join(self._dir(status), f"{job_id}.json"), job)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def finished(self, batch_id=None):
+        ids = self._batch_ids(batch_id)
+        names = sorted(set(os.listdir(self._dir("done"))) | set(os.listdir(self._dir("failed"))))
+        for name in names:
+            if not name.endswith(".json") or (ids is not None and name.split(".")[0] not in ids):
+                continue
+            for status in ("done", "failed"):
+                try:
+                    yield _read_json(os.path.join(self._dir(status), name))
+                    break
+                except FileNotFoundError:
+                    continue
+
+    def counts(self, batch_id=None):
+        ids = self._batch_ids(batch_id)
+        return {status: sum(name.endswith(".json") and (ids is None or name.split(".")[0] in ids)
+                            for name in os.listdir(self._dir(status)))
+                for status in STATUSES}
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Function to open the queue at a path: a SQLite file by its extension, a directory otherwise
+def open_queue(path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    if path.lower().endswith(SQLITE_EXTENSIONS) or os.path.isfile(path):
+        return JobQueue(path, lease_seconds, max_attempts)
+    return DirectoryQueue(path, lease_seconds, max_attempts)
+
+
+# Function to keep renewing a job's lease while it is worked on
+def _keep_lease(queue, job, worker, stop):
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.renew(job["id"], worker):
+            return
+
+
+# Options of a job as stored in the queue: JSON only, so OCR preprocessing goes as its settings
+def job_options(args):
+    options = {"backend": args.backend, "ocr_engine": args.ocr_engine, "stop_early": args.stop_early,
+               "ner_fallback": args.ner_fallback, "low_memory": args.low_memory, "max_rss_mb": args.max_rss}
+    if args.ocr_preprocess:
+        from ocr_preprocess import OcrPreprocessor
+        options["ocr_preprocess"] = OcrPreprocessor(dpi=args.ocr_dpi, deskew=not args.no_deskew,
+                                                    roi=args.ocr_roi).settings()
+    return options
+
+
+# Function to turn stored job options back into process_pdf arguments on the node
+def _process_options(options, engines):
+    options = dict(options)
+    engine = options.get("ocr_engine", "auto")
+    if engine not in engines:
+        from ocr_engines import resolve_engine
+        engines[engine] = resolve_engine(engine)
+    options["ocr_engine"] = engines[engine]
+    if options.get("ocr_preprocess"):
+        from ocr_preprocess import OcrPreprocessor
+        options["ocr_preprocess"] = OcrPreprocessor(**options["ocr_preprocess"])
+    return options
+
+
+# Function run by each worker process: claim, extract, record, until the queue is drained
+# (nothing queued and nothing running that could still come back), or forever with watch
+def work_loop(queue_path, index, node_options, lease_seconds, max_attempts, poll_seconds, watch):
+    from Extraction import process_pdf
+    queue = open_queue(queue_path, lease_seconds, max_attempts)
+    worker = worker_name(index)
+    engines = {}
+    processed = 0
+    try:
+        while True:
+            job = queue.claim(worker)
+            if job is None:
+                counts = queue.counts()
+                if not watch and not counts["queued"] and not counts["running"]:
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            stop = threading.Event()
+            renewer = threading.Thread(target=_keep_lease, args=(queue, job, worker, stop), daemon=True)
+            renewer.start()
+            try:
+                options = {**node_options, **_process_options(job["options"] or {}, engines)}
+                _, details, error, trace = process_pdf(job["pdf_path"], **options)
+            except Exception as e:
+                details, error, trace = None, f"{type(e).__name__}: {e}", None
+            finally:
+                stop.set()
+                renewer.join()
+
+            if error:
+                recorded = queue.fail(job["id"], worker, error, trace)
+                print(f"[{worker}] Failed {job['pdf_path']}: {error}")
+            else:
+                recorded = queue.complete(job["id"], worker, details, trace)
+                print(f"[{worker}] Processed {job['pdf_path']}")
+            if not recorded:
+                print(f"[{worker}] Lease of {job['pdf_path']} was taken over; result dropped")
+            processed += recorded
+    finally:
+        queue.close()
+    print(f"[{worker}] Done, {processed} document(s)")
+
+
+def run_workers(args):
+    node_options = {"ocr_workers": args.ocr_workers or 1, "cache_dir": args.cache_dir}
+    loop_args = (node_options, args.lease, args.max_attempts, args.poll, args.watch)
+    if args.workers == 1:
+        work_loop(args.queue, 0, *loop_args)
+        return 0
+
+    processes = [multiprocessing.Process(target=work_loop, args=(args.queue, index, *loop_args))
+                 for index in range(args.workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Claimed jobs go back to the queue when their leases run out
+        for process in processes:
+            process.terminate()
+    return 0
+
+
+def submit(args):
+    from Extraction import collect_pdf_paths
+    pdf_paths = [os.path.abspath(path) for path in collect_pdf_paths(args.inputs)]
+    if not pdf_paths:
+        print("No PDF files to submit.")
+        return 1
+    batch_id = args.batch or f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    with open_queue(args.queue, args.lease, args.max_attempts) as queue:
+        queue.enqueue_many(pdf_paths, job_options(args), batch_id)
+        counts = queue.counts()
+    print(f"Queued {len(pdf_paths)} file(s) in {args.queue} as batch {batch_id} ({counts['queued']} waiting)")
+    print(f"Merge them with: python distributed.py merge {args.queue} --batch {batch_id}")
+    return 0
+
+
+# Function to write the consolidated output from the finished jobs (of --batch, or all of
+# them), in the order they were submitted
+def merge(args):
+    from output_sinks import open_sink, TeeSink
+    with open_queue(args.queue, args.lease, args.max_attempts) as queue:
+        counts = queue.counts(args.batch)
+        if not any(counts.values()):
+            print(f"No jobs in batch {args.batch}" if args.batch else "The queue is empty")
+            return 1
+        if counts["queued"] or counts["running"]:
+            print(f"Warning: {counts['queued']} queued and {counts['running']} running job(s) are not merged")
+        sink = open_sink(args.output, args.format)
+        if args.db:
+            from result_store import StoreSink
+            sink = TeeSink([sink, StoreSink(args.db)])
+        failures = []
+        invoices = 0
+        with sink:
+            for job in queue.finished(args.batch):
+                if job["status"] == "done":
+                    sink.write_details(job["details"], job["pdf_path"])
+                    invoices += 1
+                else:
+                    failures.append((job["pdf_path"], job["error"]))
+            rows = sink.rows_written
+    print(f"Merged {invoices} invoice(s), {rows} row(s) into {args.output}")
+    if failures:
+        print(f"{len(failures)} file(s) failed:")
+        for pdf_path, error in failures:
+            print(f"  {pdf_path}: {error}")
+    return 0
+
+
+def status(args):
+    with open_queue(args.queue, args.lease, args.max_attempts) as queue:
+        counts = queue.counts(args.batch)
+    if args.batch:
+        print(f"Batch {args.batch}: ", end="")
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+    return 0
+
+
+def main(argv=None):
+    from Extraction import ocr_roi_argument
+    from ocr_engines import ENGINE_CHOICES, DEFAULT_ENGINE
+    from output_sinks import SINK_FORMATS
+    from pdf_backends import BACKENDS, DEFAULT_BACKEND
+
+    parser = argparse.ArgumentParser(description="Share a batch of PDFs between machines through a work queue.")
+    parser.add_argument("command", choices=("submit", "work", "merge", "status"))
+    parser.add_argument("queue", help="Shared queue: a directory, or a SQLite file (*.db) for one host.")
+    parser.add_argument("inputs", nargs="*", help="PDF files, directories or glob patterns to submit.")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="Seconds a claimed job stays with a worker that stops renewing it.")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help="Claims of a job before it is failed.")
+    parser.add_argument("--batch", default=None,
+                        help="Batch id: given to the submitted files (default: a new one), or the only "
+                             "batch merged or counted (default: every job in the queue).")
+    # submit: how every node extracts
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=DEFAULT_BACKEND)
+    parser.add_argument("--ocr-engine", choices=ENGINE_CHOICES, default=DEFAULT_ENGINE)
+    parser.add_argument("--stop-early", action="store_true")
+    parser.add_argument("--ner-fallback", action="store_true")
+    parser.add_argument("--ocr-preprocess", action="store_true", help="See Extraction.py --ocr-preprocess.")
+    parser.add_argument("--ocr-dpi", type=int, default=300)
+    parser.add_argument("--ocr-roi", type=ocr_roi_argument, default="auto")
+    parser.add_argument("--no-deskew", action="store_true")
+    parser.add_argument("--low-memory", nargs="?", type=int, const=1, default=None, metavar="PAGES",
+                        help="See Extraction.py --low-memory.")
+    parser.add_argument("--max-rss", type=int, default=None, metavar="MB", help="See Extraction.py --max-rss.")
+    # work: resources of this node
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes on this node.")
+    parser.add_argument("--ocr-workers", type=int, default=None)
+    parser.add_argument("--cache-dir", default=None, help="Text cache of this node.")
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_SECONDS, help="Seconds between looks at an empty queue.")
+    parser.add_argument("--watch", action="store_true", help="Keep waiting for new jobs instead of exiting when done.")
+    # merge
+    parser.add_argument("-o", "--output", default="consolidated_invoice_details.xlsx")
+    parser.add_argument("-f", "--format", choices=SINK_FORMATS, default=None)
+    parser.add_argument("--db", default=None, help="Also store the merged invoices in this SQLite database.")
+    args = parser.parse_args(argv)
+
+    if args.command == "submit":
+        if not args.inputs:
+            print("submit needs input directories, files or globs.")
+            return 2
+        return submit(args)
+    if args.command == "work":
+        if not os.path.exists(args.queue):
+            print(f"No queue at {args.queue}")
+            return 1
+        return run_workers(args)
+    if not os.path.exists(args.queue):
+        print(f"No queue at {args.queue}")
+        return 1
+    if args.command == "merge":
+        return merge(args)
+    return status(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
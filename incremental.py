@@ -0,0 +1,302 @@
+# Incremental and watch-folder runs.
+#
+# A manifest records every PDF that has been processed, keyed by absolute path, with
+# its mtime, size and sha256. A run only extracts files that are new and appends their
+# rows to the existing output, so a day's inbox costs only the files that arrived since
+# the last run. An unchanged mtime and size skip a file without reading it; a touched
+# file whose hash still matches is skipped too.
+#
+# A file whose content changed after its rows were written is extracted again. With csv
+# and jsonl output the manifest records where each file's rows sit in the output (a byte
+# span), so the old rows are cut out before the new ones are appended, and with --db the
+# file's invoices go from the store too. xlsx output and files recorded without a span
+# can't be rewritten that way; changes to them are reported and left alone (rebuild the
+# output with a full run to pick them up). A file that failed or had no rows is simply
+# extracted again.
+#
+# Every file is recorded as soon as its rows are flushed: csv and jsonl output is flushed
+# after every invoice, and so is the manifest, to a log next to it (<manifest>.log) that
+# is folded into the manifest when the run ends. A crash mid-run then neither extracts a
+# file twice nor forgets one whose rows are in the output. xlsx output is only written
+# when it is closed, so with it the manifest is saved at the end of the run as well.
+import os
+import json
+import time
+import shutil
+
+from Extraction import collect_pdf_paths, run_files, open_output, open_dedup
+from instrumentation import RunStats
+from text_cache import file_digest
+
+DEFAULT_MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_FORMAT = 1
+
+# Files modified more recently than this are assumed to still be copying into the inbox
+SETTLE_SECONDS = 2.0
+
+# Output formats whose rows are on disk as soon as each invoice is written
+FLUSHED_FORMATS = ("csv", "jsonl")
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.log_path = path + ".log"
+        self.files = {}
+        # Changed files already reported, so watch mode reports each one once
+        self.reported_changes = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") == MANIFEST_FORMAT:
+                self.files = data["files"]
+        # Files recorded by a run that ended before it could save; a crash leaves at
+        # most one partial last line, which is skipped
+        if os.path.exists(self.log_path):
+            with open(self.log_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        key, entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.files[key] = entry
+        self._log = None
+
+    # Function to decide whether pdf_path needs extracting. Returns (needed, stat, digest);
+    # digest is only computed when mtime or size moved.
+    def check(self, pdf_path, retry_failed=False):
+        key = os.path.abspath(pdf_path)
+        stat = os.stat(pdf_path)
+        entry = self.files.get(key)
+        if entry is None:
+            return True, stat, None
+        if entry["status"] == "failed" and retry_failed:
+            return True, stat, None
+        if entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+            return False, stat, entry["sha256"]
+
+        digest = file_digest(pdf_path)
+        if digest != entry["sha256"]:
+            return True, stat, digest
+        # Touched or copied again, same content
+        entry["mtime_ns"] = stat.st_mtime_ns
+        entry["size"] = stat.st_size
+        return False, stat, digest
+
+    # Function to tell whether pdf_path has rows in the output already
+    def has_rows(self, pdf_path):
+        entry = self.files.get(os.path.abspath(pdf_path))
+        return entry is not None and entry["status"] == "done" and entry["rows"] > 0
+
+    # Function to tell whether the rows of pdf_path can be cut out of the output
+    def has_span(self, pdf_path):
+        entry = self.files.get(os.path.abspath(pdf_path))
+        return entry is not None and bool(entry.get("span"))
+
+    # Function to record a processed file. A file removed while it was being extracted is
+    # recorded without mtime and size; span is where its rows sit in the output, as byte
+    # offsets. With durable=True the entry is synced to the log before returning.
+    def record(self, pdf_path, status, rows=0, error=None, digest=None, durable=False, span=None):
+        try:
+            stat = os.stat(pdf_path)
+            mtime_ns, size = stat.st_mtime_ns, stat.st_size
+            digest = digest or file_digest(pdf_path)
+        except OSError:
+            mtime_ns = size = None
+        key = os.path.abspath(pdf_path)
+        self.files[key] = {
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "sha256": digest,
+            "status": status,
+            "rows": rows,
+            "error": error,
+            "span": span,
+            "processed_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        if durable:
+            if self._log is None:
+                self._log = open(self.log_path, "a", encoding="utf-8")
+            self._log.write(json.dumps([key, self.files[key]], ensure_ascii=False) + "\n")
+            self._log.flush()
+            os.fsync(self._log.fileno())
+
+    # Function to cut the rows of pdf_paths out of the output, from their recorded spans,
+    # and move up the spans of the rows behind them. The files are then rowless, so the
+    # next check extracts them again.
+    def drop_rows(self, pdf_paths, output_path):
+        keys = [os.path.abspath(pdf_path) for pdf_path in pdf_paths if self.has_span(pdf_path)]
+        spans = sorted(tuple(self.files[key]["span"]) for key in keys)
+        if not spans:
+            return
+        tmp_path = f"{output_path}.tmp"
+        with open(output_path, "rb") as source, open(tmp_path, "wb") as target:
+            position = 0
+            for start, end in spans:
+                _copy_bytes(source, target, start - position)
+                source.seek(end)
+                position = end
+            shutil.copyfileobj(source, target)
+        os.replace(tmp_path, output_path)
+
+        for key in keys:
+            self.files[key].update(rows=0, span=None)
+        for entry in self.files.values():
+            if entry.get("span"):
+                start, end = entry["span"]
+                removed = sum(span_end - span_start for span_start, span_end in spans if span_end <= start)
+                entry["span"] = [start - removed, end - removed]
+        self.save()
+
+    # Written to a temp file and renamed so a crash never leaves half a manifest; the log
+    # is only removed once everything in it is in the manifest
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"format": MANIFEST_FORMAT, "files": self.files}, f, indent=1)
+        os.replace(tmp_path, self.path)
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+
+
+def _copy_bytes(source, target, length, chunk_size=1 << 20):
+    while length > 0:
+        chunk = source.read(min(chunk_size, length))
+        if not chunk:
+            break
+        target.write(chunk)
+        length -= len(chunk)
+
+
+def manifest_path(args):
+    return args.manifest or args.output + DEFAULT_MANIFEST_SUFFIX
+
+
+# Function to list the PDFs among the inputs that are new or changed since the manifest
+# was written, and apart from them the changed ones whose rows are in the output
+def pending_pdf_paths(inputs, manifest, retry_failed=False, settle_seconds=SETTLE_SECONDS):
+    pending = []
+    changed = []
+    digests = {}
+    now = time.time()
+    for pdf_path in collect_pdf_paths(inputs):
+        try:
+            needed, stat, digest = manifest.check(pdf_path, retry_failed)
+        except OSError:
+            continue  # removed between listing and stat
+        if not needed or now - stat.st_mtime < settle_seconds:
+            continue
+        if manifest.has_rows(pdf_path):
+            changed.append(pdf_path)
+        pending.append(pdf_path)
+        digests[pdf_path] = digest
+    return pending, changed, digests
+
+
+# Function to take the old results of changed files out of the output, the --db store and
+# the duplicate index. Returns the changed files that can't be rewritten.
+def drop_changed(args, manifest, changed, durable, dedup):
+    if not durable or not os.path.exists(args.output):
+        return changed
+    kept = [pdf_path for pdf_path in changed if not manifest.has_span(pdf_path)]
+    dropped = [pdf_path for pdf_path in changed if manifest.has_span(pdf_path)]
+    if not dropped:
+        return kept
+    manifest.drop_rows(dropped, args.output)
+    if args.db:
+        from result_store import ResultStore
+        store = ResultStore(args.db)
+        for pdf_path in dropped:
+            store.delete_source(pdf_path)
+        store.close()
+    if dedup is not None:
+        for pdf_path in dropped:
+            dedup.forget(pdf_path)
+    print(f"Extracting {len(dropped)} changed file(s) again; their old rows are taken out of {args.output}")
+    return kept
+
+
+# Function to run one incremental pass: extract the pending files and append them to the output
+def run_once(args, manifest, settle_seconds=SETTLE_SECONDS):
+    pdf_paths, changed, digests = pending_pdf_paths(args.inputs, manifest, args.retry_failed, settle_seconds)
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    durable = fmt in FLUSHED_FORMATS
+    dedup = open_dedup(args) if pdf_paths else None
+
+    kept = set(drop_changed(args, manifest, changed, durable, dedup))
+    if kept:
+        pdf_paths = [pdf_path for pdf_path in pdf_paths if pdf_path not in kept]
+        unreported = sorted(kept - manifest.reported_changes)
+        if unreported:
+            print(f"{len(unreported)} file(s) changed after their rows were written, but their rows can't be "
+                  f"cut out of {args.output}, so the old ones stay (run without --incremental to rebuild it):")
+            for pdf_path in unreported:
+                print(f"  {pdf_path}")
+            manifest.reported_changes.update(unreported)
+    if not pdf_paths:
+        if dedup is not None:
+            dedup.close()
+        return 0, []
+
+    stats = RunStats(keep_documents=bool(args.stats))
+    try:
+        with open_output(args, append=True) as sink:
+            # Each file's rows follow the last one's; a new csv starts with its header
+            sink.flush()
+            offset = os.path.getsize(args.output) if durable else None
+
+            def on_result(pdf_path, details, error):
+                nonlocal offset
+                span = None
+                if durable:
+                    # --db buffers invoices; its rows have to be in too before the file counts as done
+                    sink.flush()
+                    end = os.path.getsize(args.output)
+                    span = [offset, end] if end > offset else None
+                    offset = end
+                if error is None:
+                    rows = len(details.get('Goods Description', []))
+                    manifest.record(pdf_path, "done", rows, digest=digests.get(pdf_path), durable=durable,
+                                    span=span)
+                else:
+                    manifest.record(pdf_path, "failed", error=error, digest=digests.get(pdf_path),
+                                    durable=durable)
+
+            _, failures = run_files(pdf_paths, args, sink=sink, stats=stats, on_result=on_result, dedup=dedup)
+    finally:
+        # Only after the sink is closed are the rows really in the output
+        manifest.save()
+        if dedup is not None:
+            dedup.close()
+
+    processed = len(pdf_paths) - len(failures)
+    print(f"Appended {processed} new or changed file(s) to {args.output}")
+    for pdf_path, error in failures:
+        print(f"  {pdf_path}: {error}")
+    if dedup is not None and dedup.flagged:
+        dedup.print_summary()
+    if args.stats:
+        stats.write(args.stats)
+    return processed, failures
+
+
+def run_incremental(args):
+    manifest = Manifest(manifest_path(args))
+
+    if not args.watch:
+        processed, failures = run_once(args, manifest, settle_seconds=0)
+        if not processed and not failures:
+            print("No new PDF files.")
+        return 1 if failures and not processed else 0
+
+    print(f"Watching {', '.join(args.inputs)} every {args.interval:g}s (Ctrl+C to stop)")
+    try:
+        while True:
+            run_once(args, manifest)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    return 0
@@ -0,0 +1,229 @@
+import os
+import csv
+import json
+import time
+import cProfile
+from contextlib import contextmanager
+
+# Pipeline stages, in the order they run for a document
+STAGES = ["open", "text", "render", "ocr", "parse", "ner", "write"]
+
+
+# Timings of one document: a span per stage and, for page-level stages, per page.
+# Spans may be recorded from OCR threads; list.append is atomic, so no lock is needed.
+class DocumentTrace:
+    def __init__(self, pdf_path):
+        self.pdf_path = pdf_path
+        self.spans = []
+        self.pages = 0
+        self.ocr_pages = 0
+        self.skipped_pages = 0
+        self.cached = False
+        self.vendor = ""
+        self.ner_used = False
+        self.ner_fields = []
+        # MinHash of the text (hex) when duplicate detection is on; taken out before stats.add
+        self.fingerprint = None
+        # Id of the vendor template that extracted the document, if one did
+        self.template = None
+        # Peak resident memory of the worker while extracting the document, in MB; sampled
+        # when it is the highest RSS seen between pages rather than the kernel's peak
+        self.peak_rss_mb = None
+        self.peak_rss_sampled = False
+
+    @contextmanager
+    def span(self, stage, page=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans.append((stage, page, time.perf_counter() - started))
+
+    def stage_totals(self):
+        totals = dict.fromkeys(STAGES, 0.0)
+        for stage, _, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def to_dict(self):
+        return {
+            "pdf_path": self.pdf_path,
+            "vendor": self.vendor,
+            "pages": self.pages,
+            "ocr_pages": self.ocr_pages,
+            "skipped_pages": self.skipped_pages,
+            "cached": self.cached,
+            "ner_used": self.ner_used,
+            "ner_fields": self.ner_fields,
+            "fingerprint": self.fingerprint,
+            "template": self.template,
+            "peak_rss_mb": self.peak_rss_mb,
+            "peak_rss_sampled": self.peak_rss_sampled,
+            "stages": self.stage_totals(),
+            "page_spans": [{"stage": stage, "page": page, "seconds": seconds}
+                           for stage, page, seconds in self.spans if page is not None],
+        }
+
+
+# A do-nothing stand-in so the extraction functions can always call trace.span(...)
+class NullTrace:
+    pages = 0
+    ocr_pages = 0
+    skipped_pages = 0
+    cached = False
+    vendor = ""
+    ner_used = False
+    ner_fields = []
+    fingerprint = None
+    template = None
+    peak_rss_mb = None
+    peak_rss_sampled = False
+
+    @contextmanager
+    def span(self, stage, page=None):
+        yield
+
+
+NULL_TRACE = NullTrace()
+
+
+# Function to run fn under cProfile and dump the stats to profile_dir/<pdf name>.prof.
+# Load them with pstats.Stats(*paths) or snakeviz.
+def profile_call(profile_dir, name, fn, *args, **kwargs):
+    os.makedirs(profile_dir, exist_ok=True)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(fn, *args, **kwargs)
+    finally:
+        base = os.path.splitext(os.path.basename(name))[0]
+        profiler.dump_stats(os.path.join(profile_dir, f"{base}.{os.getpid()}.prof"))
+
+
+# Summarises the per-document traces of a batch run as they arrive. The full traces (with
+# their page spans) are only kept with keep_documents, for write(); a summary alone costs
+# the same memory for ten documents as for a million.
+class RunStats:
+    def __init__(self, keep_documents=False):
+        self.keep_documents = keep_documents
+        self.documents = []
+        self.started = time.perf_counter()
+        self.document_count = 0
+        self.pages = self.ocr_pages = self.skipped_pages = 0
+        self.ocr_documents = self.ner_documents = self.template_documents = self.cached_documents = 0
+        self.stage_seconds = dict.fromkeys(STAGES, 0.0)
+        self.vendors = {}
+        self.ner_fields = {}
+        self.peak_rss_mb, self.peak_rss_document = None, None
+        self.peak_rss_sampled = False
+
+    def add(self, document):
+        self.document_count += 1
+        self.pages += document["pages"]
+        self.ocr_pages += document["ocr_pages"]
+        self.skipped_pages += document.get("skipped_pages", 0)
+        self.ocr_documents += 1 if document["ocr_pages"] else 0
+        self.ner_documents += 1 if document.get("ner_used") else 0
+        self.template_documents += 1 if document.get("template") else 0
+        self.cached_documents += 1 if document["cached"] else 0
+        if document.get("peak_rss_mb") and (self.peak_rss_mb is None or document["peak_rss_mb"] > self.peak_rss_mb):
+            self.peak_rss_mb, self.peak_rss_document = document["peak_rss_mb"], document["pdf_path"]
+            self.peak_rss_sampled = document.get("peak_rss_sampled", False)
+        for field in document.get("ner_fields", []):
+            self.ner_fields[field] = self.ner_fields.get(field, 0) + 1
+        document_seconds = sum(document["stages"].values())
+        for stage, seconds in document["stages"].items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+        vendor = self.vendors.setdefault(document["vendor"] or "(unknown)", {
+            "documents": 0, "pages": 0, "ocr_pages": 0, "seconds": 0.0})
+        vendor["documents"] += 1
+        vendor["pages"] += document["pages"]
+        vendor["ocr_pages"] += document["ocr_pages"]
+        vendor["seconds"] += document_seconds
+
+        if self.keep_documents:
+            self.documents.append(document)
+
+    def summary(self):
+        wall_seconds = time.perf_counter() - self.started
+        stage_seconds = dict(self.stage_seconds)
+        total_seconds = sum(stage_seconds.values())
+        vendors = {}
+        for name, vendor in self.vendors.items():
+            vendors[name] = {
+                **vendor,
+                "seconds_per_document": vendor["seconds"] / vendor["documents"],
+                "ocr_page_rate": vendor["ocr_pages"] / vendor["pages"] if vendor["pages"] else 0.0,
+                "share_of_time": vendor["seconds"] / total_seconds if total_seconds else 0.0,
+            }
+
+        documents, pages = self.document_count, self.pages
+        return {
+            "documents": documents,
+            "pages": pages,
+            "skipped_pages": self.skipped_pages,
+            "wall_seconds": wall_seconds,
+            "stage_seconds": stage_seconds,
+            "stage_share": {stage: seconds / total_seconds if total_seconds else 0.0
+                            for stage, seconds in stage_seconds.items()},
+            "ocr_document_rate": self.ocr_documents / documents if documents else 0.0,
+            "ocr_page_rate": self.ocr_pages / pages if pages else 0.0,
+            "ner_document_rate": self.ner_documents / documents if documents else 0.0,
+            "ner_filled_fields": dict(self.ner_fields),
+            "template_document_rate": self.template_documents / documents if documents else 0.0,
+            "peak_rss_mb": self.peak_rss_mb,
+            "peak_rss_document": self.peak_rss_document,
+            "peak_rss_sampled": self.peak_rss_sampled,
+            "cached_documents": self.cached_documents,
+            # Most expensive vendors first
+            "vendors": dict(sorted(vendors.items(), key=lambda item: item[1]["seconds"], reverse=True)),
+        }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "documents": self.documents}, f, indent=2)
+
+    # One row per document, with the seconds spent in each stage
+    def write_csv(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["pdf_path", "vendor", "pages", "ocr_pages", "cached", "ner_used", "total_seconds"]
+                            + [f"{stage}_seconds" for stage in STAGES] + ["peak_rss_mb", "peak_rss_sampled"])
+            for document in self.documents:
+                stages = document["stages"]
+                writer.writerow([document["pdf_path"], document["vendor"], document["pages"],
+                                 document["ocr_pages"], document["cached"], document.get("ner_used", False),
+                                 round(sum(stages.values()), 6)]
+                                + [round(stages.get(stage, 0.0), 6) for stage in STAGES]
+                                + [document.get("peak_rss_mb"), document.get("peak_rss_sampled", False)])
+
+    def write(self, path):
+        if not self.keep_documents:
+            raise ValueError("RunStats(keep_documents=True) is needed to write per-document stats")
+        if path.lower().endswith(".csv"):
+            self.write_csv(path)
+        else:
+            self.write_json(path)
+
+    def print_summary(self):
+        summary = self.summary()
+        total = sum(summary["stage_seconds"].values())
+        print(f"Time per stage ({summary['documents']} document(s), {summary['pages']} page(s), "
+              f"{summary['wall_seconds']:.2f}s wall):")
+        for stage in STAGES:
+            seconds = summary["stage_seconds"].get(stage, 0.0)
+            print(f"  {stage:<7} {seconds:9.3f}s  {summary['stage_share'][stage]:6.1%}")
+        print(f"  total   {total:9.3f}s")
+        print(f"OCR fallback: {summary['ocr_document_rate']:.1%} of documents, "
+              f"{summary['ocr_page_rate']:.1%} of pages")
+        if summary["skipped_pages"]:
+            print(f"Early stop: skipped {summary['skipped_pages']} page(s)")
+        if summary["peak_rss_mb"]:
+            sampled = ", sampled between pages" if summary["peak_rss_sampled"] else ""
+            print(f"Peak memory: {summary['peak_rss_mb']:.1f} MB ({summary['peak_rss_document']}{sampled})")
+        if summary["template_document_rate"]:
+            print(f"Vendor templates: {summary['template_document_rate']:.1%} of documents")
+        if summary["ner_document_rate"]:
+            filled = ", ".join(f"{field} {count}" for field, count in summary["ner_filled_fields"].items())
+            print(f"NER fallback: {summary['ner_document_rate']:.1%} of documents"
+                  + (f", filled {filled}" if filled else ""))
@@ -0,0 +1,199 @@
+# Persistent job queue on SQLite.
+#
+# Jobs survive a restart of whoever serves them. A worker claims the oldest queued job
+# with a lease; a job whose lease runs out (its worker crashed or was killed) goes back
+# to whoever claims next, up to max_attempts times. Claims happen inside BEGIN IMMEDIATE
+# transactions, so any number of threads or processes can share one queue file.
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    batch_id TEXT,
+    pdf_path TEXT NOT NULL,
+    options TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    details TEXT,
+    trace TEXT,
+    error TEXT,
+    uploaded INTEGER NOT NULL DEFAULT 0,
+    created_at REAL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+CREATE INDEX IF NOT EXISTS jobs_batch ON jobs (batch_id);
+"""
+
+STATUSES = ("queued", "running", "done", "failed")
+
+
+# Function to name the worker in the queue: host and pid, plus a suffix for threads
+def worker_name(suffix=None):
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    return f"{name}:{suffix}" if suffix is not None else name
+
+
+def _job_from_row(row):
+    job = dict(row)
+    for field in ("options", "details", "trace"):
+        if job.get(field) is not None:
+            job[field] = json.loads(job[field])
+    return job
+
+
+class JobQueue:
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Autocommit mode; transactions are opened explicitly where they matter
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        # Queues created before jobs knew whether their file was an upload
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)")]
+        if "uploaded" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN uploaded INTEGER NOT NULL DEFAULT 0")
+        self._lock = threading.Lock()
+
+    # uploaded marks files the queue owns: whoever finishes the job may delete them
+    def enqueue_many(self, pdf_paths, options=None, batch_id=None, uploaded=False):
+        now = time.time()
+        options_json = json.dumps(options or {})
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                ids = [self.conn.execute(
+                    "INSERT INTO jobs (batch_id, pdf_path, options, uploaded, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (batch_id, pdf_path, options_json, int(uploaded), now)).lastrowid for pdf_path in pdf_paths]
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return ids
+
+    def enqueue(self, pdf_path, options=None, batch_id=None, uploaded=False):
+        return self.enqueue_many([pdf_path], options, batch_id, uploaded)[0]
+
+    # Function to take the next job: an expired lease first (its worker is gone), then the
+    # oldest queued job. Returns the job as a dict, or None when there is nothing to do.
+    def claim(self, worker=None, lease_seconds=None):
+        worker = worker or worker_name()
+        now = time.time()
+        lease_expires = now + (lease_seconds or self.lease_seconds)
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT id, attempts FROM jobs WHERE status = 'running' AND lease_expires < ? "
+                    "ORDER BY id LIMIT 1", (now,)).fetchone()
+                while row is not None and row["attempts"] >= self.max_attempts:
+                    self.conn.execute(
+                        "UPDATE jobs SET status = 'failed', finished_at = ?, "
+                        "error = 'Lease expired ' || attempts || ' time(s); giving up' WHERE id = ?", (now, row["id"]))
+                    row = self.conn.execute(
+                        "SELECT id, attempts FROM jobs WHERE status = 'running' AND lease_expires < ? "
+                        "ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is None:
+                    row = self.conn.execute(
+                        "SELECT id, attempts FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    self.conn.execute("COMMIT")
+                    return None
+
+                job = self.conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "started_at = ? WHERE id = ? RETURNING *", (worker, lease_expires, now, row["id"])).fetchone()
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return _job_from_row(job)
+
+    # Function to extend the lease of a long job; False if the job was taken over meanwhile
+    def renew(self, job_id, worker, lease_seconds=None):
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time() + (lease_seconds or self.lease_seconds), job_id, worker))
+        return cursor.rowcount == 1
+
+    # Only the worker holding the lease may finish a job, so a late worker whose lease
+    # expired can't overwrite the result of the one that took over
+    def complete(self, job_id, worker, details, trace=None):
+        return self._finish(job_id, worker, "done", details=json.dumps(details, ensure_ascii=False),
+                            trace=json.dumps(trace) if trace is not None else None)
+
+    def fail(self, job_id, worker, error, trace=None):
+        return self._finish(job_id, worker, "failed", error=error,
+                            trace=json.dumps(trace) if trace is not None else None)
+
+    def _finish(self, job_id, worker, status, details=None, trace=None, error=None):
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, details = ?, trace = ?, error = ?, finished_at = ?, lease_expires = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, details, trace, error, time.time(), job_id, worker))
+        return cursor.rowcount == 1
+
+    def get(self, job_id):
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_from_row(row) if row is not None else None
+
+    def batch(self, batch_id):
+        with self._lock:
+            rows = self.conn.execute("SELECT * FROM jobs WHERE batch_id = ? ORDER BY id", (batch_id,)).fetchall()
+        return [_job_from_row(row) for row in rows]
+
+    # Function to yield the done and failed jobs (of one batch, or all of them) in id order,
+    # a page of rows at a time
+    def finished(self, batch_id=None, page_size=500):
+        sql = "SELECT * FROM jobs WHERE status IN ('done', 'failed') AND id > ?"
+        if batch_id is not None:
+            sql += " AND batch_id = ?"
+        last_id = 0
+        while True:
+            params = (last_id, batch_id, page_size) if batch_id is not None else (last_id, page_size)
+            with self._lock:
+                rows = self.conn.execute(sql + " ORDER BY id LIMIT ?", params).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield _job_from_row(row)
+            last_id = rows[-1]["id"]
+
+    def counts(self, batch_id=None):
+        sql = "SELECT status, COUNT(*) FROM jobs"
+        params = ()
+        if batch_id is not None:
+            sql += " WHERE batch_id = ?"
+            params = (batch_id,)
+        with self._lock:
+            rows = self.conn.execute(sql + " GROUP BY status", params).fetchall()
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,130 @@
+# Per-file result journal for resumable batch runs.
+#
+# Every result is appended to a JSON Lines journal (<output>.journal.jsonl) and synced
+# to disk as soon as its file is done, whether the invoice was written, held back as a
+# duplicate or failed. A crash, an OOM kill or a bad PDF late in a long run then costs
+# only the files that were in flight:
+#
+#   python Extraction.py inbox/ -o out.xlsx            # journals as it goes
+#   python Extraction.py inbox/ -o out.xlsx --resume   # skips journaled files, rebuilds out.xlsx
+#   python Extraction.py -o out.xlsx --consolidate     # only rebuilds out.xlsx from the journal
+#
+# The consolidated output is rebuilt from the journal, streaming it twice: once to find
+# the last record of every file (a retried file is journaled again), once to write them.
+import os
+import json
+import time
+
+from output_sinks import OutputSink, open_sink
+
+DEFAULT_JOURNAL_SUFFIX = ".journal.jsonl"
+DONE = "done"
+FAILED = "failed"
+DUPLICATE = "duplicate"
+
+
+def journal_path(args):
+    return args.journal or args.output + DEFAULT_JOURNAL_SUFFIX
+
+
+# Function to read the records of a journal in order. A crash in the middle of a write
+# leaves at most one partial last line, which is skipped.
+def read_records(path):
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+class Journal:
+    def __init__(self, path, resume=False):
+        self.path = path
+        # Last status of every journaled file, by absolute path
+        self.statuses = {}
+        if resume:
+            for record in read_records(path):
+                self.statuses[record["key"]] = record["status"]
+            self._drop_partial_line()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+        # Files written to the output since their last on_result call
+        self._written = set()
+
+    # A partial last line would glue itself to the next record; cut it off before appending
+    def _drop_partial_line(self):
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return
+        with open(self.path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b"\n":
+                return
+            f.seek(0)
+            data = f.read()
+            f.truncate(data.rfind(b"\n") + 1)
+
+    def append(self, pdf_path, status, details=None, error=None):
+        record = {"key": os.path.abspath(pdf_path), "pdf_path": pdf_path, "status": status,
+                  "details": details, "error": error, "at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.statuses[record["key"]] = status
+        if status == DONE:
+            self._written.add(pdf_path)
+
+    # Function to leave out the files a resumed run doesn't need to extract again
+    def pending(self, pdf_paths, retry_failed=False):
+        skip = (DONE, DUPLICATE) if retry_failed else (DONE, DUPLICATE, FAILED)
+        return [pdf_path for pdf_path in pdf_paths if self.statuses.get(os.path.abspath(pdf_path)) not in skip]
+
+    # Sink side: invoices that reach the output are journaled as done
+    def sink(self):
+        return JournalSink(self)
+
+    # run_batch/run_pipeline on_result hook: failures and held-back duplicates, which never
+    # reach the sink, are journaled here
+    def on_result(self, pdf_path, details, error):
+        if error is not None:
+            self.append(pdf_path, FAILED, error=error)
+        elif pdf_path not in self._written:
+            self.append(pdf_path, DUPLICATE, details)
+        self._written.discard(pdf_path)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class JournalSink(OutputSink):
+    def __init__(self, journal):
+        super().__init__(journal.path)
+        self.journal = journal
+
+    def write_details(self, details, source_path=None):
+        self.journal.append(source_path, DONE, details)
+
+
+# Function to rewrite the consolidated output from the journal: the last record of every
+# file, in the order those records were journaled. Returns (invoices, rows) written.
+def consolidate(path, output_path, fmt=None):
+    last_line = {}
+    for line_number, record in enumerate(read_records(path)):
+        last_line[record["key"]] = line_number
+
+    final_lines = set(last_line.values())
+    invoices = 0
+    with open_sink(output_path, fmt) as sink:
+        for line_number, record in enumerate(read_records(path)):
+            if line_number in final_lines and record["status"] == DONE:
+                sink.write_details(record["details"], record["pdf_path"])
+                invoices += 1
+        rows = sink.rows_written
+    return invoices, rows
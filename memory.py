@@ -0,0 +1,134 @@
+# Memory accounting for OCR of large scanned documents.
+#
+# A 200-page scanned ledger is one document to the batch, but pdfminer and MuPDF keep
+# what they parse of every page until the document is closed, and each page rendered
+# for OCR is tens of megabytes. Workers then get OOM-killed, which takes the process pool
+# and the rest of the batch down with them. With --low-memory pages are read, rendered
+# and released a small window at a time; with --max-rss a document that still grows a
+# worker past the ceiling fails on its own instead.
+#
+# RSS comes from /proc on Linux and from psutil elsewhere when it is installed. The peak
+# of each document is the kernel's high-water mark, reset when the document starts, but
+# that mark belongs to the whole process: when documents overlap in one process (daemon
+# --jobs, service threads) it is neither reset nor used, and the peak is the highest RSS
+# sampled after each page instead, marked as sampled.
+import gc
+import os
+import sys
+import threading
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+MB = 1024 * 1024
+
+# Documents being extracted in this process, and how many have started so far
+_documents_lock = threading.Lock()
+_active_documents = 0
+_started_documents = 0
+
+
+class MemoryLimitExceeded(MemoryError):
+    pass
+
+
+# Function to get the resident set size of this process in bytes (None when unknown)
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+
+# Function to get the peak resident set size in bytes: since the last reset_peak() on
+# Linux, since the process started elsewhere
+def peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Function to restart the peak measured by peak_rss(); returns False where that isn't possible
+def reset_peak():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# Function to hand freed memory back to the system: collect cycles, then ask glibc to
+# return the free parts of its heap (without it RSS rarely drops after a large page)
+def release_memory():
+    gc.collect()
+    if sys.platform.startswith("linux"):
+        try:
+            import ctypes
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+# Follows the memory of the worker while one document is extracted: check() after each
+# page raises MemoryLimitExceeded when the worker stays over max_rss_mb even after
+# releasing what it can, and peak_mb() is the document's peak. sampled tells whether that
+# peak is only the highest RSS seen by check(). close() once the document is done.
+class MemoryMonitor:
+    def __init__(self, max_rss_mb=None):
+        global _active_documents, _started_documents
+        self.max_rss = max_rss_mb * MB if max_rss_mb else None
+        with _documents_lock:
+            _active_documents += 1
+            _started_documents += 1
+            self._started = _started_documents
+            # Only a document alone in the process may restart the process-wide mark
+            self.exact_peak = _active_documents == 1 and reset_peak()
+        self.peak = current_rss() or 0
+        self.closed = False
+
+    # The mark is this document's as long as no other document started after it
+    @property
+    def sampled(self):
+        with _documents_lock:
+            return not (self.exact_peak and _started_documents == self._started)
+
+    def check(self, page_number=None):
+        rss = current_rss()
+        if rss is None:
+            return
+        self.peak = max(self.peak, rss)
+        if self.max_rss is None or rss <= self.max_rss:
+            return
+        release_memory()
+        rss = current_rss()
+        if rss > self.max_rss:
+            where = f" at page {page_number + 1}" if page_number is not None else ""
+            raise MemoryLimitExceeded(f"worker RSS {rss / MB:.0f} MB is over the {self.max_rss / MB:.0f} MB "
+                                      f"ceiling{where}")
+
+    def peak_mb(self):
+        peak = max(self.peak, current_rss() or 0) if self.sampled else peak_rss()
+        return round(peak / MB, 1) if peak else None
+
+    def close(self):
+        global _active_documents
+        if not self.closed:
+            self.closed = True
+            with _documents_lock:
+                _active_documents -= 1
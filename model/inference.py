@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import argparse
+import spacy
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "invoice_ner_model")
+
+# Components the invoice NER needs; anything else in a saved pipeline is excluded at load
+NEEDED_COMPONENTS = {"ner", "tok2vec", "transformer"}
+
+# Entity labels of invoice_ner_model -> the keys extract_details uses
+LABEL_TO_FIELD = {
+    "GOODS_DESCRIPTION": "Goods Description",
+    "HSN_SAC": "HSN/SAC",
+    "BAGS": "Bags",
+    "PACK": "Pack",
+    "QUINTAL": "Quintal",
+    "RATE": "Rate",
+    "AMOUNT": "Amount",
+    "COMPANY_NAME": "Company Name",
+    "INVOICE_NO": "Invoice No",
+    "FSSAI": "FSSAI",
+    "DATE_OF_INVOICE": "Date of Invoice",
+    "GSTIN_NO": "GSTIN NO",
+    "GSTIN": "GSTIN",
+    "PAN_NO": "PAN NO",
+    "TAN_NO": "TAN NO",
+    "STD": "STD",
+    "SHIPPED_TO": "Shipped to",
+    "TRANSPORT": "Transport",
+    "PLACE_OF_SUPPLY": "Place of Supply",
+    "VEHICLE_NO": "Vehicle No",
+    "LICENCE_NO": "Licence No",
+    "MOBILE_NO": "Mobile No",
+}
+
+# Fields extract_details returns as lists, one entry per line item
+LINE_ITEM_FIELDS = ["Goods Description", "HSN/SAC", "Bags", "Pack", "Quintal", "Rate", "Amount"]
+
+_models = {}
+
+# Function to load the saved model once per process, without the components NER doesn't use
+def load_model(model_dir=MODEL_DIR):
+    model_dir = os.path.abspath(model_dir)
+    if model_dir not in _models:
+        config = spacy.util.load_config(os.path.join(model_dir, "config.cfg"))
+        exclude = [name for name in config["nlp"]["pipeline"] if name not in NEEDED_COMPONENTS]
+        _models[model_dir] = spacy.load(model_dir, exclude=exclude)
+    return _models[model_dir]
+
+# The model was trained on single-line text (see training.py)
+def prepare_text(text):
+    return text.replace("\n", " ")
+
+# Function to turn a processed doc into a details-style dict: first entity for header fields,
+# every entity in order for line-item fields, numbers cleaned up the way extract_details does
+def doc_to_fields(doc):
+    fields = {}
+    for ent in doc.ents:
+        field = LABEL_TO_FIELD.get(ent.label_)
+        if field is None:
+            continue
+        value = ent.text.strip()
+
+        if field in LINE_ITEM_FIELDS:
+            if field in ("Quintal", "Rate", "Amount"):
+                value = value.replace(",", "")
+            if field == "Amount":
+                try:
+                    value = float(value)
+                except ValueError:
+                    pass
+            fields.setdefault(field, []).append(value)
+        elif field not in fields:
+            fields[field] = value
+    return fields
+
+# Function to run many texts through the model with nlp.pipe; yields one dict per text, in order.
+# n_process > 1 forks worker processes, which only pays off for large batches.
+def extract_entities(texts, batch_size=64, n_process=1, model_dir=MODEL_DIR):
+    nlp = load_model(model_dir)
+    for doc in nlp.pipe((prepare_text(text) for text in texts), batch_size=batch_size, n_process=n_process):
+        yield doc_to_fields(doc)
+
+def extract_entities_one(text, model_dir=MODEL_DIR):
+    return next(extract_entities([text], model_dir=model_dir))
+
+def read_text(path):
+    if path.lower().endswith(".pdf"):
+        import fitz  # PyMuPDF
+        with fitz.open(path) as doc:
+            return "".join(page.get_text() for page in doc)
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run invoice_ner_model over PDFs or text files.")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("-o", "--output", default="-", help="JSONL output file (default: stdout).")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--n-process", type=int, default=1)
+    parser.add_argument("--model", default=MODEL_DIR)
+    args = parser.parse_args(argv)
+
+    texts = (read_text(path) for path in args.paths)
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        results = extract_entities(texts, args.batch_size, args.n_process, args.model)
+        for path, fields in zip(args.paths, results):
+            out.write(json.dumps({"path": path, **fields}, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,18 @@
-import spacy
-import pytesseract
-import fitz  # PyMuPDF
-from spacy.training.example import Example
-import random
+# The first try-out of the invoice NER: train on the example below, then print what the
+# model finds in one PDF. Training is training.py's (a saved corpus, compounding
+# minibatches, the best epoch kept); this script only keeps the old entry points.
+import os
+import tempfile
 
-# Set the path to the Tesseract executable (change it to your local installation path)
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+from training import train_ner_model as train_on_corpus, extract_text_from_pdf
 
-# PDF Extraction Function: Extract text from a PDF file
-def extract_text_from_pdf(pdf_path):
-    # Open the provided PDF file
-    doc = fitz.open(pdf_path)
-    text = ""
-    
-    # Loop through all pages and extract text
-    for page in doc:
-        text += page.get_text()
-
-    return text
-
-# Train the NER model with invoice data
-def train_ner_model(train_data):
-    nlp = spacy.blank("en")  # Create a blank English model
-    ner = nlp.add_pipe("ner", last=True)  # Add the NER component to the pipeline
-
-    # Add the labels to the NER model
-    for _, annotations in train_data:
-        for ent in annotations.get("entities"):
-            ner.add_label(ent[2])
-
-    optimizer = nlp.begin_training()  # Start training
-    for i in range(100):  # Set the number of iterations
-        random.shuffle(train_data)  # Shuffle the training data
-        losses = {}
-        for text, annotations in train_data:
-            example = Example.from_dict(nlp.make_doc(text), annotations)
-            nlp.update([example], drop=0.5, losses=losses)  # Update the model
-        print(f"Iteration {i+1} - Losses: {losses}")
-
-    return nlp
+# Train the NER model with invoice data; the corpus is written to corpus_dir, or to a
+# temporary directory when none is given
+def train_ner_model(train_data, corpus_dir=None, **training_options):
+    if corpus_dir is not None:
+        return train_on_corpus(train_data, corpus_dir=corpus_dir, **training_options)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        return train_on_corpus(train_data, corpus_dir=os.path.join(tmp_dir, "corpus"), **training_options)
 
 # Function to extract the entities from the text using the trained NER model
 def extract_entities_with_ner(nlp_model, text):
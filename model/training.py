@@ -1,28 +1,128 @@
+import os
+import json
+import time
+import random
+import argparse
 import spacy
+from spacy.tokens import DocBin
 from spacy.training.example import Example
-import random
+from spacy.util import minibatch, compounding, filter_spans
 import fitz  # PyMuPDF
 
-def train_ner_model(train_data):
+# Function to turn (text, {"entities": [...]}) pairs into a DocBin, so the corpus is
+# tokenised and aligned once instead of on every epoch
+def make_docbin(train_data, nlp):
+    docbin = DocBin(store_user_data=False)
+    skipped = 0
+
+    for text, annotations in train_data:
+        doc = nlp.make_doc(text)
+        spans = []
+        for start, end, label in annotations.get("entities", []):
+            # Offsets off token boundaries are shrunk to the tokens wholly inside them
+            span = doc.char_span(start, end, label=label, alignment_mode="contract")
+            if span is None:
+                skipped += 1  # not even one whole token inside
+            else:
+                spans.append(span)
+        doc.ents = filter_spans(spans)
+        docbin.add(doc)
+
+    if skipped:
+        print(f"Skipped {skipped} entity span(s) without a whole token inside")
+    return docbin
+
+# Function to split the annotations into train/dev and save them as train.spacy and dev.spacy
+def save_corpus(train_data, corpus_dir, dev_fraction=0.2, seed=0):
+    nlp = spacy.blank("en")
+    data = list(train_data)
+    random.Random(seed).shuffle(data)
+
+    dev_size = int(len(data) * dev_fraction)
+    os.makedirs(corpus_dir, exist_ok=True)
+    make_docbin(data[dev_size:], nlp).to_disk(os.path.join(corpus_dir, "train.spacy"))
+    make_docbin(data[:dev_size], nlp).to_disk(os.path.join(corpus_dir, "dev.spacy"))
+    print(f"Saved {len(data) - dev_size} training and {dev_size} dev document(s) to {corpus_dir}")
+
+# Function to load a saved DocBin as Example objects (built once, reused every epoch)
+def load_examples(path, nlp):
+    if not os.path.exists(path):
+        return []
+    docs = DocBin().from_disk(path).get_docs(nlp.vocab)
+    return [Example(nlp.make_doc(doc.text), doc) for doc in docs]
+
+# Function to read annotations from a JSONL file of {"text": ..., "entities": [[start, end, label], ...]}
+def read_annotations(path):
+    train_data = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                train_data.append((record["text"], {"entities": [tuple(ent) for ent in record["entities"]]}))
+    return train_data
+
+# Dev sets smaller than this are too noisy to stop on
+MIN_DEV_DOCS = 10
+
+# Function to train the NER from a saved corpus with compounding minibatches, scoring the dev
+# set after each epoch and stopping once its F1 hasn't improved for `patience` epochs.
+# The weights of the best epoch are restored before returning. Without a dev set of at
+# least MIN_DEV_DOCS documents of its own all max_epochs run, since a model trained from
+# scratch scores 0 for its first epochs, and ties go to the later epoch.
+def train_from_corpus(corpus_dir, max_epochs=100, patience=10, drop=0.5,
+                      batch_start=4.0, batch_stop=32.0, batch_compound=1.001, seed=0):
+    random.seed(seed)
+    spacy.util.fix_random_seed(seed)  # thinc and numpy too, so runs repeat
     nlp = spacy.blank("en")  # Create a blank English model
     ner = nlp.add_pipe("ner", last=True)  # Add the NER component to the pipeline
 
+    train_examples = load_examples(os.path.join(corpus_dir, "train.spacy"), nlp)
+    dev_examples = load_examples(os.path.join(corpus_dir, "dev.spacy"), nlp)
+    if not train_examples:
+        raise ValueError(f"No training documents in {corpus_dir}")
+    early_stopping = len(dev_examples) >= MIN_DEV_DOCS
+    if not dev_examples:
+        print(f"No dev documents; scoring on the training set over all {max_epochs} epochs")
+        dev_examples = train_examples
+    elif not early_stopping:
+        print(f"Only {len(dev_examples)} dev document(s); no early stopping")
+
     # Add the labels to the NER model
-    for _, annotations in train_data:
-        for ent in annotations.get("entities"):
-            ner.add_label(ent[2])
+    for example in train_examples:
+        for ent in example.reference.ents:
+            ner.add_label(ent.label_)
+
+    optimizer = nlp.initialize(lambda: train_examples)
+    best_f1, best_epoch, best_weights = -1.0, 0, None
+    # Batch sizes keep growing across epochs instead of starting over at batch_start
+    batch_sizes = compounding(batch_start, batch_stop, batch_compound)
 
-    optimizer = nlp.begin_training()  # Start training
-    for i in range(100):  # Set the number of iterations
-        random.shuffle(train_data)  # Shuffle the training data
+    for epoch in range(1, max_epochs + 1):
+        random.shuffle(train_examples)
         losses = {}
-        for text, annotations in train_data:
-            example = Example.from_dict(nlp.make_doc(text), annotations)
-            nlp.update([example], drop=0.5, losses=losses)  # Update the model
-        print(f"Iteration {i+1} - Losses: {losses}")
+        started = time.perf_counter()
+        for batch in minibatch(train_examples, size=batch_sizes):
+            nlp.update(batch, drop=drop, sgd=optimizer, losses=losses)
+        seconds = time.perf_counter() - started
 
+        f1 = nlp.evaluate(dev_examples).get("ents_f") or 0.0
+        print(f"Epoch {epoch} - loss {losses.get('ner', 0.0):.2f} - dev F1 {f1:.3f} - "
+              f"{seconds:.2f}s ({len(train_examples) / seconds:.1f} docs/s)")
+
+        if f1 > best_f1 or (f1 == best_f1 and not early_stopping):
+            best_f1, best_epoch, best_weights = f1, epoch, nlp.to_bytes()
+        elif early_stopping and epoch - best_epoch >= patience:
+            print(f"Stopping early: no dev F1 improvement for {patience} epochs")
+            break
+
+    nlp.from_bytes(best_weights)
+    print(f"Best dev F1 {best_f1:.3f} at epoch {best_epoch}")
     return nlp
 
+def train_ner_model(train_data, corpus_dir="corpus", dev_fraction=0.2, **training_options):
+    save_corpus(train_data, corpus_dir, dev_fraction)
+    return train_from_corpus(corpus_dir, **training_options)
+
 def save_model(model, output_dir="invoice_ner_model"):
     model.to_disk(output_dir)  # Save the trained model to a directory
     print(f"Model saved to {output_dir}")
@@ -40,6 +140,18 @@ def extract_text_from_pdf(pdf_path):
 
 # Example of how to use it
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the invoice NER model.")
+    parser.add_argument("--data", help="JSONL annotations; defaults to the example below.")
+    parser.add_argument("--corpus-dir", default="corpus",
+                        help="Where train.spacy/dev.spacy are written and read.")
+    parser.add_argument("--reuse-corpus", action="store_true",
+                        help="Train from existing DocBins in --corpus-dir without rebuilding them.")
+    parser.add_argument("--max-epochs", type=int, default=100)
+    parser.add_argument("--patience", type=int, default=10)
+    parser.add_argument("--dev-fraction", type=float, default=0.2)
+    parser.add_argument("--pdf", default="tani 21.pdf", help="PDF to try the trained model on.")
+    args = parser.parse_args()
+
     # Define the training data with the correct sequence
     TRAINING_DATA = [
         (
@@ -74,13 +186,18 @@ if __name__ == "__main__":
     ]
 
     # Train the model with the data
-    trained_model = train_ner_model(TRAINING_DATA)
+    if args.reuse_corpus:
+        trained_model = train_from_corpus(args.corpus_dir, max_epochs=args.max_epochs, patience=args.patience)
+    else:
+        train_data = read_annotations(args.data) if args.data else TRAINING_DATA
+        trained_model = train_ner_model(train_data, corpus_dir=args.corpus_dir, dev_fraction=args.dev_fraction,
+                                        max_epochs=args.max_epochs, patience=args.patience)
 
     # Save the trained model
     save_model(trained_model)
 
     # Extract text from a PDF (example.pdf is the path to your PDF file)
-    pdf_text = extract_text_from_pdf("tani 21.pdf")
+    pdf_text = extract_text_from_pdf(args.pdf)
 
     # Ensure the entire text is concatenated into a single string before processing
     pdf_text = pdf_text.replace("\n", " ")  # Remove newlines and concatenate
@@ -0,0 +1,150 @@
+# OCR engines behind one interface, and a pool of long-lived OCR threads that keep
+# their engine loaded between pages and between documents.
+#
+# pytesseract starts a tesseract process and writes a temp image for every call.
+# tesserocr binds the Tesseract C++ API directly: the engine and its traineddata
+# are loaded once per thread, images are handed over in memory, and recognition
+# releases the GIL, so one thread per core keeps every core busy.
+#
+# Availability is checked without importing: pytesseract pulls in pandas when it is
+# installed, which would otherwise cost every run that never OCRs a page.
+import os
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_LANG = "eng"
+
+
+class PytesseractEngine:
+    name = "pytesseract"
+
+    def __init__(self, lang=DEFAULT_LANG):
+        import pytesseract
+        self._pytesseract = pytesseract
+        self.lang = lang
+
+    def image_to_string(self, image):
+        return self._pytesseract.image_to_string(image, lang=self.lang)
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def available():
+        return importlib.util.find_spec("pytesseract") is not None
+
+    @staticmethod
+    def version():
+        import pytesseract
+        try:
+            return str(pytesseract.get_tesseract_version())
+        except Exception:
+            return "unknown"
+
+
+class TesserocrEngine:
+    name = "tesserocr"
+
+    def __init__(self, lang=DEFAULT_LANG):
+        import tesserocr
+        self.lang = lang
+        self._api = tesserocr.PyTessBaseAPI(lang=lang)
+
+    def image_to_string(self, image):
+        self._api.SetImage(image)
+        return self._api.GetUTF8Text()
+
+    def close(self):
+        self._api.End()
+
+    @staticmethod
+    def available():
+        return importlib.util.find_spec("tesserocr") is not None
+
+    @staticmethod
+    def version():
+        import tesserocr
+        return tesserocr.tesseract_version().splitlines()[0]
+
+
+ENGINES = {
+    TesserocrEngine.name: TesserocrEngine,
+    PytesseractEngine.name: PytesseractEngine,
+}
+DEFAULT_ENGINE = "auto"
+ENGINE_CHOICES = ["auto"] + list(ENGINES)
+
+
+# Function to turn "auto" into the fastest engine that is installed
+def resolve_engine(name=DEFAULT_ENGINE):
+    if name == "auto":
+        for engine_class in ENGINES.values():
+            if engine_class.available():
+                return engine_class.name
+        raise RuntimeError("No OCR engine installed (install tesserocr or pytesseract)")
+    if name not in ENGINES:
+        raise ValueError(f"Unknown OCR engine: {name!r} (expected one of {', '.join(ENGINE_CHOICES)})")
+    if not ENGINES[name].available():
+        raise RuntimeError(f"OCR engine {name!r} is not installed")
+    return name
+
+
+def engine_version(name):
+    return ENGINES[resolve_engine(name)].version()
+
+
+# A fixed set of OCR threads, each owning one engine for its whole life.
+# Jobs are fn(engine, *args) so callers can wrap the OCR call with caching or timing.
+class OcrPool:
+    def __init__(self, engine=DEFAULT_ENGINE, workers=None, lang=DEFAULT_LANG):
+        self.engine_name = resolve_engine(engine)
+        self.workers = workers or os.cpu_count() or 1
+        self.lang = lang
+        self._local = threading.local()
+        self._engines = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+
+    def _engine(self):
+        engine = getattr(self._local, "engine", None)
+        if engine is None:
+            engine = ENGINES[self.engine_name](self.lang)
+            self._local.engine = engine
+            with self._lock:
+                self._engines.append(engine)
+        return engine
+
+    def _run(self, fn, args):
+        return fn(self._engine(), *args)
+
+    def submit(self, fn, *args):
+        return self._executor.submit(self._run, fn, args)
+
+    def image_to_string(self, image):
+        return self.submit(lambda engine, img: engine.image_to_string(img), image).result()
+
+    def close(self):
+        self._executor.shutdown()
+        for engine in self._engines:
+            engine.close()
+        self._engines = []
+
+
+_pools = {}
+# Engine each requested name resolved to; only a name that resolved is kept, so an
+# engine installed while a daemon runs is found on the next page
+_resolved = {}
+_pools_lock = threading.Lock()
+
+# Function to get the process-wide pool for an engine, created on first use.
+# Batch workers call this for every page to OCR, so the engines stay loaded across
+# files, and a name is only resolved (a module lookup) the first time.
+def get_ocr_pool(engine=DEFAULT_ENGINE, workers=None, lang=DEFAULT_LANG):
+    with _pools_lock:
+        if engine not in _resolved:
+            _resolved[engine] = resolve_engine(engine)
+        key = (_resolved[engine], workers or os.cpu_count() or 1, lang)
+        if key not in _pools:
+            _pools[key] = OcrPool(*key)
+        return _pools[key]
@@ -0,0 +1,213 @@
+# Page image preprocessing before OCR, vectorised with NumPy.
+#
+# Without it each scanned page goes to Tesseract as pdfplumber renders it: 72 DPI, in
+# colour, margins and blank space included. That is too coarse for small print and
+# makes Tesseract segment a whole page of mostly nothing. The preprocessor renders at
+# the DPI Tesseract is tuned for and then:
+#
+#   grayscale  ->  Otsu threshold  ->  deskew  ->  crop to regions
+#
+# Regions of interest are either found on the page ("auto": the bands of rows that
+# carry ink, stacked without the blank space between them) or given as boxes in page
+# fractions, e.g. the header block and the line-item table of a known layout. Either
+# way Tesseract gets one compact image with only the text that is parsed. Boxes are
+# fractions of the page as rendered, so they are cropped before deskewing, which turns
+# and grows the image; the crops are then turned by the skew of the whole page.
+import numpy as np
+
+DEFAULT_OCR_DPI = 300
+DEFAULT_MAX_SKEW = 5.0
+# Rows count as ink when at least this fraction of their pixels is dark
+INK_ROW_FRACTION = 0.002
+# Blank runs taller than this (in inches) split the page into separate regions
+REGION_GAP_INCHES = 0.25
+# White space kept around and between stacked regions (in inches)
+REGION_PADDING_INCHES = 0.08
+
+# ITU-R 601 luma weights in 256ths, so a weighted pixel still fits in 16 bits
+_LUMA_WEIGHTS = (77, 150, 29)
+
+
+# Function to get an 8-bit grayscale array from a PIL image
+def to_grayscale(image):
+    if image.mode == "L":
+        return np.asarray(image)
+    rgb = np.asarray(image if image.mode == "RGB" else image.convert("RGB"))
+    luma = np.zeros(rgb.shape[:2], dtype=np.uint16)
+    for channel, weight in enumerate(_LUMA_WEIGHTS):
+        luma += rgb[..., channel].astype(np.uint16) * np.uint16(weight)
+    return (luma >> 8).astype(np.uint8)
+
+
+# Function to pick the global threshold that best separates ink from paper (Otsu's method):
+# the gray level maximising the between-class variance of the histogram. Every other row
+# and column is plenty for a histogram.
+def otsu_threshold(gray):
+    histogram = np.bincount(gray[::2, ::2].ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256, dtype=np.float64)
+    weight_dark = np.cumsum(histogram)
+    weight_light = weight_dark[-1] - weight_dark
+    sum_dark = np.cumsum(histogram * levels)
+    mean_dark = sum_dark / np.maximum(weight_dark, 1)
+    mean_light = (sum_dark[-1] - sum_dark) / np.maximum(weight_light, 1)
+    between = weight_dark * weight_light * (mean_dark - mean_light) ** 2
+    return int(np.argmax(between))
+
+
+# Ink is 0, paper 255: the polarity Tesseract expects
+def binarize(gray, threshold=None):
+    if threshold is None:
+        threshold = otsu_threshold(gray)
+    return np.multiply(gray > threshold, 255, dtype=np.uint8)
+
+
+# Score of each angle: the variance of the row profile of the ink sheared by that angle.
+# Text lines line up with the rows at the right angle, which gives the sharpest profile.
+def _projection_scores(ys, xs, angles, height):
+    scores = []
+    for angle in angles:
+        rows = np.round(ys - xs * np.tan(np.radians(angle))).astype(np.int64)
+        rows -= rows.min()
+        scores.append(np.var(np.bincount(rows, minlength=height)))
+    return np.array(scores)
+
+
+# Function to estimate the skew of a binarized page: the counter-clockwise angle in degrees
+# that straightens it, searched coarse to fine over +/- max_angle on a quarter-size copy
+def estimate_skew(binary, max_angle=DEFAULT_MAX_SKEW):
+    small = binary[::4, ::4]
+    ys, xs = np.nonzero(small == 0)
+    if len(ys) < 50:
+        return 0.0
+    ys = ys.astype(np.float64)
+    xs = xs.astype(np.float64)
+
+    coarse = np.arange(-max_angle, max_angle + 0.25, 0.5)
+    best = coarse[np.argmax(_projection_scores(ys, xs, coarse, small.shape[0]))]
+    fine = np.arange(best - 0.5, best + 0.55, 0.1)
+    return float(fine[np.argmax(_projection_scores(ys, xs, fine, small.shape[0]))])
+
+
+# Function to rotate a page back by its skew
+def deskew(page, angle, binary=True):
+    if abs(angle) < 0.1:
+        return page
+    from PIL import Image
+    # Nearest neighbour keeps a binarized page black and white, and is several times faster
+    resample = Image.NEAREST if binary else Image.BICUBIC
+    return np.asarray(Image.fromarray(page).rotate(angle, resample=resample, expand=True, fillcolor=255))
+
+
+# Function to find the bands of rows that carry ink: [(top, bottom, left, right)] in pixels.
+# Bands closer than `min_gap` rows are merged, so a region is a block of text, not a line.
+def find_text_regions(binary, min_gap, padding=0):
+    ink = binary == 0
+    row_ink = ink.mean(axis=1) >= INK_ROW_FRACTION
+    rows = np.flatnonzero(row_ink)
+    if not len(rows):
+        return []
+
+    breaks = np.flatnonzero(np.diff(rows) > min_gap)
+    starts = np.concatenate(([rows[0]], rows[breaks + 1]))
+    ends = np.concatenate((rows[breaks], [rows[-1]]))
+    height, width = binary.shape
+    regions = []
+    for top, bottom in zip(starts, ends):
+        columns = np.flatnonzero(ink[top:bottom + 1].any(axis=0))
+        regions.append((max(0, top - padding), min(height, bottom + 1 + padding),
+                        max(0, columns[0] - padding), min(width, columns[-1] + 1 + padding)))
+    return regions
+
+
+# Function to turn boxes in page fractions (left, top, right, bottom) into pixel regions
+def boxes_to_regions(boxes, shape):
+    height, width = shape
+    regions = []
+    for left, top, right, bottom in boxes:
+        regions.append((int(top * height), int(np.ceil(bottom * height)),
+                        int(left * width), int(np.ceil(right * width))))
+    return regions
+
+
+# Function to paste regions one below the other, left aligned, on a white image
+def stack_regions(binary, regions, gap):
+    if not regions:
+        return binary
+    crops = [binary[top:bottom, left:right] for top, bottom, left, right in regions]
+    width = max(crop.shape[1] for crop in crops) + 2 * gap
+    height = sum(crop.shape[0] for crop in crops) + gap * (len(crops) + 1)
+    stacked = np.full((height, width), 255, dtype=np.uint8)
+    y = gap
+    for crop in crops:
+        stacked[y:y + crop.shape[0], gap:gap + crop.shape[1]] = crop
+        y += crop.shape[0] + gap
+    return stacked
+
+
+# Function to parse --ocr-roi: "auto", "page", or boxes "left,top,right,bottom;..." in page fractions
+def parse_roi(value):
+    if value in (None, "", "page"):
+        return None
+    if value == "auto":
+        return "auto"
+    boxes = []
+    for box in value.split(";"):
+        try:
+            left, top, right, bottom = (float(part) for part in box.split(","))
+        except ValueError:
+            left = right = top = bottom = None
+        if left is None or not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+            raise ValueError(f"Region {box!r} is not left,top,right,bottom fractions of the page")
+        boxes.append((left, top, right, bottom))
+    return boxes
+
+
+# Function to check --ocr-roi as argparse parses it, so a bad value is a usage error;
+# the value itself is passed on as given
+def roi_argument(value):
+    import argparse
+    try:
+        parse_roi(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+# Settings object handed down to the OCR threads; picklable, and its settings() are part
+# of the OCR cache key so changing any of them never returns stale text
+class OcrPreprocessor:
+    def __init__(self, dpi=DEFAULT_OCR_DPI, threshold=True, deskew=True, max_skew=DEFAULT_MAX_SKEW, roi="auto"):
+        self.dpi = dpi
+        self.threshold = threshold
+        self.deskew = deskew
+        self.max_skew = max_skew
+        self.roi = parse_roi(roi) if isinstance(roi, str) or roi is None else roi
+
+    # Pages are rendered at the target DPI
+    @property
+    def render_dpi(self):
+        return self.dpi
+
+    def settings(self):
+        return {"dpi": self.dpi, "threshold": self.threshold, "deskew": self.deskew,
+                "max_skew": self.max_skew, "roi": self.roi}
+
+    # Function to prepare one page rendered at render_dpi, returning a PIL grayscale image
+    # for the OCR engine
+    def __call__(self, image):
+        from PIL import Image
+        gray = to_grayscale(image)
+        page = binarize(gray) if self.threshold else gray
+        angle = estimate_skew(page if self.threshold else binarize(page), self.max_skew) if self.deskew else 0.0
+        padding = round(REGION_PADDING_INCHES * self.dpi)
+
+        if self.roi is None:
+            page = deskew(page, angle, binary=self.threshold)
+        elif self.roi == "auto":
+            page = deskew(page, angle, binary=self.threshold)
+            ink = page if self.threshold else binarize(page)
+            page = stack_regions(page, find_text_regions(ink, round(REGION_GAP_INCHES * self.dpi), padding), padding)
+        else:
+            page = stack_regions(page, boxes_to_regions(self.roi, page.shape), padding)
+            page = deskew(page, angle, binary=self.threshold)
+        return Image.fromarray(page)
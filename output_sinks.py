@@ -0,0 +1,226 @@
+import os
+import csv
+import json
+
+LINE_ITEM_COLUMNS = ['Goods Description', 'HSN/SAC', 'Bags', 'Pack', 'Quintal', 'Rate', 'Amount']
+HEADER_COLUMNS = ['Company Name', 'Invoice No', 'FSSAI', 'Date of Invoice', 'GSTIN NO', 'GSTIN',
+                  'PAN NO', 'TAN NO', 'STD', 'Shipped to', 'Transport',
+                  'Place of Supply', 'Vehicle No', 'Licence No', 'Mobile No']
+# Same column order as consolidated_invoice_details.xlsx
+OUTPUT_COLUMNS = LINE_ITEM_COLUMNS + HEADER_COLUMNS
+
+# Columns where a missing or junk value is written as "-"
+DASH_COLUMNS = ['Transport', 'Place of Supply', 'Vehicle No', 'Licence No', 'Mobile No']
+DASH_VALUES = {"", ".", "Total", "Advance"}
+
+SINK_FORMATS = ("xlsx", "csv", "jsonl", "parquet")
+
+# Function to turn one extract_details result into output rows, one per line item,
+# with the header fields repeated on every row (an invoice without line items has no rows)
+def details_to_rows(details):
+    line_items = [details.get(column, []) for column in LINE_ITEM_COLUMNS]
+    header = []
+    for column in HEADER_COLUMNS:
+        value = details.get(column, "")
+        if column in DASH_COLUMNS and value in DASH_VALUES:
+            value = "-"
+        header.append(value)
+
+    for item in zip(*line_items):
+        yield list(item) + header
+
+
+# Base class for streaming writers: rows go out as each invoice finishes instead of
+# being collected for one write at the end
+class OutputSink:
+    def __init__(self, path):
+        self.path = path
+        self.rows_written = 0
+
+    # source_path is the PDF the details came from; file formats don't record it
+    def write_details(self, details, source_path=None):
+        for row in details_to_rows(details):
+            self.write_row(row)
+            self.rows_written += 1
+        self.flush()
+
+    def write_row(self, row):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CsvSink(OutputSink):
+    def __init__(self, path, append=False):
+        super().__init__(path)
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self._file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        if write_header:
+            self._writer.writerow(OUTPUT_COLUMNS)
+
+    def write_row(self, row):
+        self._writer.writerow(row)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlSink(OutputSink):
+    def __init__(self, path, append=False):
+        super().__init__(path)
+        self._file = open(path, "a" if append else "w", encoding="utf-8")
+
+    def write_row(self, row):
+        self._file.write(json.dumps(dict(zip(OUTPUT_COLUMNS, row)), ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+# xlsx can't be appended to row by row by pandas; xlsxwriter's constant_memory mode
+# (or openpyxl's write_only mode as a fallback) keeps only the current row in memory.
+# The workbook is only complete once close() has run.
+class XlsxSink(OutputSink):
+    def __init__(self, path):
+        super().__init__(path)
+        try:
+            import xlsxwriter
+        except ImportError:
+            xlsxwriter = None
+
+        if xlsxwriter is not None:
+            self._workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False})
+            self._sheet = self._workbook.add_worksheet("Sheet1")
+            header_format = self._workbook.add_format({"bold": True, "border": 1, "align": "center"})
+            self._sheet.write_row(0, 0, OUTPUT_COLUMNS, header_format)
+            self._next_row = 1
+        else:
+            import openpyxl
+            self._workbook = openpyxl.Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet("Sheet1")
+            self._sheet.append(OUTPUT_COLUMNS)
+            self._next_row = None
+
+    def write_row(self, row):
+        if self._next_row is None:
+            self._sheet.append(row)
+        else:
+            self._sheet.write_row(self._next_row, 0, row)
+            self._next_row += 1
+
+    def close(self):
+        if self._next_row is None:
+            self._workbook.save(self.path)
+        else:
+            self._workbook.close()
+
+
+# Appends to an existing workbook. openpyxl has to load the sheet to do that, which is
+# still far cheaper than extracting the PDFs behind it again.
+class AppendingXlsxSink(OutputSink):
+    def __init__(self, path):
+        super().__init__(path)
+        import openpyxl
+        self._workbook = openpyxl.load_workbook(path)
+        self._sheet = self._workbook.worksheets[0]
+
+    def write_row(self, row):
+        self._sheet.append(row)
+
+    def close(self):
+        self._workbook.save(self.path)
+
+
+# Parquet is written in row groups, so only the current group is buffered, as compact
+# records. Columns are typed (records.arrow_schema): floats for Quintal, Rate and Amount,
+# dictionary-encoded text, which pandas reads back as categoricals, and one column the
+# other formats don't have: 'Date of Invoice Parsed', a timestamp next to the date as written.
+class ParquetSink(OutputSink):
+    def __init__(self, path, row_group_size=10000):
+        super().__init__(path)
+        import pyarrow.parquet as pq
+        from records import arrow_schema
+
+        self._schema = arrow_schema()
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._row_group_size = row_group_size
+        self._records = []
+        self._buffered_rows = 0
+
+    def write_details(self, details, source_path=None):
+        from records import InvoiceRecord
+        record = InvoiceRecord.from_details(details, source_path)
+        self._records.append(record)
+        self._buffered_rows += len(record)
+        self.rows_written += len(record)
+        if self._buffered_rows >= self._row_group_size:
+            self._write_buffer()
+
+    def _write_buffer(self):
+        if not self._buffered_rows:
+            return
+        from records import to_arrow
+        self._writer.write_table(to_arrow(self._records, self._schema))
+        self._records = []
+        self._buffered_rows = 0
+
+    def close(self):
+        self._write_buffer()
+        self._writer.close()
+
+
+# Writes every invoice to several sinks, e.g. the workbook and the SQLite store
+class TeeSink(OutputSink):
+    def __init__(self, sinks):
+        super().__init__(sinks[0].path)
+        self.sinks = sinks
+
+    def write_details(self, details, source_path=None):
+        for sink in self.sinks:
+            sink.write_details(details, source_path)
+        self.rows_written = self.sinks[0].rows_written
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+# Function to open the right sink for a path, going by the extension unless fmt is given.
+# With append=True rows are added after those already in the file.
+def open_sink(path, fmt=None, append=False):
+    if fmt is None:
+        fmt = os.path.splitext(path)[1].lstrip(".").lower() or "xlsx"
+    if fmt == "xlsx":
+        if append and os.path.exists(path):
+            return AppendingXlsxSink(path)
+        return XlsxSink(path)
+    if fmt == "csv":
+        return CsvSink(path, append=append)
+    if fmt == "jsonl":
+        return JsonlSink(path, append=append)
+    if fmt == "parquet":
+        if append and os.path.exists(path):
+            raise ValueError("Parquet files can't be appended to; use xlsx, csv or jsonl output")
+        return ParquetSink(path)
+    raise ValueError(f"Unsupported output format: {fmt!r} (expected one of {', '.join(SINK_FORMATS)})")
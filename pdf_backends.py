@@ -0,0 +1,123 @@
+# PDF loaders behind one interface, so a document is opened once and the same
+# handle serves both text extraction and page rendering for OCR.
+#
+#   with open_document(path, "pymupdf") as doc:
+#       for page_number in range(len(doc)):
+#           text = doc.page_text(page_number)
+#           image = doc.render(page_number)   # PIL image for Tesseract
+#           words = doc.page_words(page_number)   # [(x0, top, x1, bottom, text)] in page fractions
+#           doc.release(page_number)   # drop what was parsed for the page (long scans)
+
+DEFAULT_BACKEND = "pdfplumber"
+
+# pdfplumber's page.to_image() default, which the OCR path has always used
+DEFAULT_RESOLUTION = 72
+
+
+class PdfplumberDocument:
+    name = "pdfplumber"
+
+    def __init__(self, pdf_path):
+        import pdfplumber
+        self._pdf = pdfplumber.open(pdf_path)
+
+    def __len__(self):
+        return len(self._pdf.pages)
+
+    def page_text(self, page_number):
+        return self._pdf.pages[page_number].extract_text() or ""
+
+    # Words in reading order, with their boxes as fractions of the page size
+    def page_words(self, page_number):
+        page = self._pdf.pages[page_number]
+        width, height = float(page.width), float(page.height)
+        return [(word["x0"] / width, word["top"] / height, word["x1"] / width, word["bottom"] / height, word["text"])
+                for word in page.extract_words()]
+
+    def render(self, page_number, resolution=DEFAULT_RESOLUTION):
+        return self._pdf.pages[page_number].to_image(resolution=resolution).original
+
+    # pdfminer keeps every object it has parsed, the image streams of scanned pages
+    # included, until the document is closed; pages re-parse what they need
+    def release(self, page_number):
+        self._pdf.pages[page_number].close()
+        self._pdf.doc._cached_objs.clear()
+
+    def close(self):
+        self._pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def version():
+        import pdfplumber
+        return pdfplumber.__version__
+
+
+class PyMuPDFDocument:
+    name = "pymupdf"
+
+    def __init__(self, pdf_path):
+        import fitz  # PyMuPDF
+        self._fitz = fitz
+        self._doc = fitz.open(pdf_path)
+
+    def __len__(self):
+        return self._doc.page_count
+
+    # PyMuPDF keeps the column padding of the layout; collapsing it gives the same
+    # lines as pdfplumber, which is what the regexes in extract_details expect
+    def page_text(self, page_number):
+        text = self._doc[page_number].get_text(sort=True)
+        return "\n".join(" ".join(line.split()) for line in text.splitlines() if line.strip())
+
+    def page_words(self, page_number):
+        page = self._doc[page_number]
+        width, height = page.rect.width, page.rect.height
+        return [(x0 / width, top / height, x1 / width, bottom / height, text)
+                for x0, top, x1, bottom, text, *_ in page.get_text("words", sort=True)]
+
+    def render(self, page_number, resolution=DEFAULT_RESOLUTION):
+        from PIL import Image
+        pix = self._doc[page_number].get_pixmap(dpi=resolution, alpha=False)
+        return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+    # MuPDF keeps decoded images and fonts in a process-wide store; empty it
+    def release(self, page_number):
+        self._fitz.TOOLS.store_shrink(100)
+
+    def close(self):
+        self._doc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def version():
+        import fitz
+        return fitz.VersionBind
+
+
+BACKENDS = {
+    PdfplumberDocument.name: PdfplumberDocument,
+    PyMuPDFDocument.name: PyMuPDFDocument,
+}
+
+
+def open_document(pdf_path, backend=DEFAULT_BACKEND):
+    try:
+        document_class = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown PDF backend: {backend!r} (expected one of {', '.join(BACKENDS)})") from None
+    return document_class(pdf_path)
+
+
+def backend_version(backend=DEFAULT_BACKEND):
+    return BACKENDS[backend].version()
@@ -0,0 +1,329 @@
+# Staged batch pipeline on asyncio.
+#
+# run_batch runs every stage of a document back to back inside one worker, so a
+# worker waiting on the disk is not OCR-ing and nothing else runs while the
+# workbook is written. Here each stage has its own workers and a bounded queue in
+# front of it:
+#
+#   load (process pool)  ->  ocr (OCR thread pool)  ->  parse (process pool)  ->  write (one thread)
+#
+# load opens the PDF, reads the text layer and renders the pages that need OCR.
+# A full queue makes the stage before it wait, so a slow stage holds back the ones
+# feeding it instead of letting rendered pages pile up in memory, and throughput is
+# set by the slowest stage rather than the sum of all of them. Results are written
+# in input order, as run_batch does.
+import os
+import json
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from Extraction import (hybrid_cache_key, page_needs_ocr, ocr_page_image, parse_text, text_fingerprint,
+                        render_resolution, find_last_gstin, PageFieldTracker, DEFAULT_BACKEND, DEFAULT_ENGINE)
+from instrumentation import DocumentTrace
+from pdf_backends import open_document
+from ocr_engines import get_ocr_pool
+from text_cache import get_cache, DEFAULT_MAX_BYTES
+
+DEFAULT_QUEUE_SIZE = 4
+
+
+class PipelineJob:
+    def __init__(self, index, pdf_path):
+        self.index = index
+        self.pdf_path = pdf_path
+        self.trace = DocumentTrace(pdf_path)
+        self.page_texts = []
+        self.images = {}
+        self.text = None
+        self.cache_key = None
+        self.details = None
+        self.error = None
+
+
+# Load stage (runs in a worker process): the text layer of every page plus renders of
+# the pages without one. A cached document comes back with its text already set.
+# With stop_early the OCR stage decides where to stop, as extract_hybrid_text does, so the
+# text and its cache entry are the same on both paths. Only when the text layer alone is
+# complete before the first scanned page is it known here which scans can be needed: those
+# after the last text-layer page with a GSTIN, for the tracker's look back from the end.
+def load_document(job, cache_dir, cache_max_bytes, backend, ocr_engine, stop_early=False, ocr_preprocess=None):
+    trace = job.trace
+    cache = get_cache(cache_dir, cache_max_bytes) if cache_dir else None
+    if cache is not None:
+        job.cache_key = hybrid_cache_key(job.pdf_path, backend, ocr_engine, stop_early, ocr_preprocess)
+        cached = cache.get(job.cache_key)
+        if cached is not None:
+            entry = json.loads(cached)
+            trace.cached = True
+            trace.skipped_pages = entry.get("skipped_pages", 0)
+            job.text, trace.pages, trace.ocr_pages = entry["text"], entry["pages"], entry["ocr_pages"]
+            return job
+
+    with trace.span("open"):
+        doc = open_document(job.pdf_path, backend)
+    with doc:
+        for page_number in range(len(doc)):
+            with trace.span("text", page_number):
+                job.page_texts.append(doc.page_text(page_number))
+        scanned = [page_number for page_number, page_text in enumerate(job.page_texts) if page_needs_ocr(page_text)]
+        if stop_early and scanned:
+            stop = text_layer_stop(job.page_texts, scanned[0])
+            if stop is not None:
+                later = [page_number for page_number in range(stop + 1, len(doc))
+                         if page_number not in scanned and find_last_gstin(job.page_texts[page_number])]
+                scanned = [page_number for page_number in scanned if page_number > max(later, default=stop)]
+        for page_number in scanned:
+            with trace.span("render", page_number):
+                job.images[page_number] = doc.render(page_number, render_resolution(ocr_preprocess))
+
+    trace.pages = len(job.page_texts)
+    trace.ocr_pages = len(job.images)
+    return job
+
+
+# Function to give the page where the tracker is complete on the text layer alone, when
+# that is before the first scanned page; None otherwise
+def text_layer_stop(page_texts, first_scanned):
+    tracker = PageFieldTracker()
+    for page_number in range(first_scanned):
+        if tracker.feed(page_texts[page_number]):
+            return page_number
+    return None
+
+
+# Parse stage (runs in a worker process)
+def parse_document(job, ner_fallback, fingerprint=False):
+    if fingerprint:
+        job.trace.fingerprint = text_fingerprint(job.text)
+    job.details = parse_text(job.text, job.trace, ner_fallback)
+    return job
+
+
+class Pipeline:
+    def __init__(self, load_workers=None, ocr_workers=None, parse_workers=1, queue_size=DEFAULT_QUEUE_SIZE,
+                 cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, backend=DEFAULT_BACKEND,
+                 ocr_engine=DEFAULT_ENGINE, ner_fallback=False, stop_early=False, ocr_preprocess=None):
+        cpus = os.cpu_count() or 1
+        self.load_workers = load_workers or max(1, cpus // 2)
+        self.ocr_workers = ocr_workers or cpus
+        self.parse_workers = parse_workers or 1
+        self.queue_size = queue_size
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.backend = backend
+        self.ocr_engine = ocr_engine
+        self.ner_fallback = ner_fallback
+        self.stop_early = stop_early
+        self.ocr_preprocess = ocr_preprocess
+
+    def _fail(self, job, e):
+        job.error = f"{type(e).__name__}: {e}"
+        job.images = {}
+
+    async def _load(self, job):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._processes, load_document, job, self.cache_dir,
+                                          self.cache_max_bytes, self.backend, self.ocr_engine, self.stop_early,
+                                          self.ocr_preprocess)
+
+    async def _ocr(self, job):
+        if job.text is not None:
+            return job
+        cache = get_cache(self.cache_dir, self.cache_max_bytes) if self.cache_dir else None
+
+        def traced_ocr(engine, image, page_number):
+            with job.trace.span("ocr", page_number):
+                return ocr_page_image(image, cache, engine, self.ocr_preprocess)
+
+        # The engine is only looked for once a page needs it
+        def submit(page_number):
+            pool = get_ocr_pool(self.ocr_engine, self.ocr_workers)
+            return pool.submit(traced_ocr, job.images[page_number], page_number)
+
+        if self.stop_early:
+            await self._read_until_complete(job, submit)
+        else:
+            if job.images:
+                print(f"OCR used on {len(job.images)} of {len(job.page_texts)} page(s) of {job.pdf_path}")
+            pages = list(job.images)
+            futures = [asyncio.wrap_future(submit(page_number)) for page_number in pages]
+            for page_number, text in zip(pages, await asyncio.gather(*futures)):
+                job.page_texts[page_number] = text
+            job.text = "".join(job.page_texts)
+        job.images = {}
+        job.page_texts = []
+
+        if cache is not None:
+            cache.put(job.cache_key, json.dumps({"text": job.text, "pages": job.trace.pages,
+                                                 "ocr_pages": job.trace.ocr_pages,
+                                                 "skipped_pages": job.trace.skipped_pages}))
+        return job
+
+    # Function to read the pages in order, OCR-ing the scanned ones a few ahead, until the
+    # tracker is complete, and then add the page with the last GSTIN as extract_hybrid_text does
+    async def _read_until_complete(self, job, submit):
+        tracker = PageFieldTracker()
+        scanned = list(job.images)
+        futures = {}
+        page_texts = []
+        ocr_pages = 0
+        try:
+            for page_number, page_text in enumerate(job.page_texts):
+                if page_needs_ocr(page_text):
+                    for ahead in scanned[scanned.index(page_number):scanned.index(page_number) + self.ocr_workers]:
+                        if ahead not in futures:
+                            futures[ahead] = submit(ahead)
+                    page_text = await asyncio.wrap_future(futures.pop(page_number))
+                    ocr_pages += 1
+                page_texts.append(page_text)
+                if tracker.feed(page_text):
+                    break
+        finally:
+            # Stopped early: drop the OCR jobs that haven't started yet
+            for future in futures.values():
+                future.cancel()
+
+        pages = len(page_texts)
+        if pages < len(job.page_texts):
+            loop = asyncio.get_running_loop()
+            tail_text, tail_pages, tail_ocr_pages = await loop.run_in_executor(
+                None, tracker.last_gstin_text, list(enumerate(job.page_texts))[pages:],
+                lambda page_number: submit(page_number).result())
+            page_texts.append(tail_text)
+            pages += tail_pages
+            ocr_pages += tail_ocr_pages
+
+        if ocr_pages:
+            print(f"OCR used on {ocr_pages} of {pages} page(s) of {job.pdf_path}")
+        job.text = "".join(page_texts)
+        job.trace.pages, job.trace.ocr_pages = pages, ocr_pages
+        job.trace.skipped_pages = len(job.page_texts) - pages
+
+    async def _parse(self, job):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._processes, parse_document, job, self.ner_fallback,
+                                          self._dedup is not None)
+
+    # Function to run one stage: `workers` tasks take jobs from inbox and pass them on.
+    # Failed jobs skip the remaining stages but still reach the writer, so it can report them.
+    async def _stage(self, handle, inbox, outbox, workers, next_workers):
+        async def worker():
+            while True:
+                job = await inbox.get()
+                if job is None:
+                    return
+                if job.error is None:
+                    try:
+                        job = await handle(job)
+                    except Exception as e:
+                        self._fail(job, e)
+                await outbox.put(job)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        for _ in range(next_workers):
+            await outbox.put(None)
+
+    async def _feed(self, pdf_paths, outbox, workers, in_flight):
+        for index, pdf_path in enumerate(pdf_paths):
+            await in_flight.acquire()
+            await outbox.put(PipelineJob(index, pdf_path))
+        for _ in range(workers):
+            await outbox.put(None)
+
+    # Write stage: one thread owns the sink; jobs that finish early wait for their turn
+    async def _write(self, inbox, total, sink, stats, on_result, all_details, failures, in_flight):
+        loop = asyncio.get_running_loop()
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="write")
+        ready = {}
+        next_index = 0
+
+        def write(job):
+            duplicate = None
+            if not job.error and self._dedup is not None:
+                duplicate = self._dedup.check(job.pdf_path, job.details, job.trace.fingerprint)
+            job.trace.fingerprint = None
+
+            if job.error:
+                print(f"[{job.index + 1}/{total}] Failed {job.pdf_path}: {job.error}")
+                failures.append((job.pdf_path, job.error))
+            elif duplicate is not None:
+                print(f"[{job.index + 1}/{total}] Duplicate ({duplicate.kind}) {job.pdf_path} "
+                      f"of {duplicate.duplicate_of}")
+            else:
+                print(f"[{job.index + 1}/{total}] Processed {job.pdf_path}")
+                if sink is not None:
+                    with job.trace.span("write"):
+                        sink.write_details(job.details, job.pdf_path)
+                else:
+                    all_details.append(job.details)
+            if stats is not None:
+                trace = job.trace.to_dict()
+                trace.pop("fingerprint")
+                stats.add(trace)
+            if on_result is not None:
+                on_result(job.pdf_path, job.details, job.error)
+
+        try:
+            while True:
+                job = await inbox.get()
+                if job is None:
+                    break
+                ready[job.index] = job
+                while next_index in ready:
+                    await loop.run_in_executor(writer, write, ready.pop(next_index))
+                    in_flight.release()
+                    next_index += 1
+        finally:
+            writer.shutdown()
+
+    async def run_async(self, pdf_paths, sink=None, stats=None, on_result=None, dedup=None):
+        self._dedup = dedup
+        all_details = []
+        failures = []
+        queues = [asyncio.Queue(self.queue_size) for _ in range(4)]
+        # Caps the jobs between the feeder and the writer, including those waiting to be written in order
+        in_flight = asyncio.Semaphore(self.load_workers + self.ocr_workers + self.parse_workers
+                                      + 4 * self.queue_size)
+
+        self._processes = ProcessPoolExecutor(max_workers=self.load_workers + self.parse_workers)
+        try:
+            await asyncio.gather(
+                self._feed(pdf_paths, queues[0], self.load_workers, in_flight),
+                self._stage(self._load, queues[0], queues[1], self.load_workers, self.ocr_workers),
+                self._stage(self._ocr, queues[1], queues[2], self.ocr_workers, self.parse_workers),
+                self._stage(self._parse, queues[2], queues[3], self.parse_workers, 1),
+                self._write(queues[3], len(pdf_paths), sink, stats, on_result, all_details, failures, in_flight),
+            )
+        finally:
+            self._processes.shutdown()
+        return all_details, failures
+
+    def run(self, pdf_paths, sink=None, stats=None, on_result=None, dedup=None):
+        return asyncio.run(self.run_async(pdf_paths, sink, stats, on_result, dedup))
+
+
+# Function with the same arguments and results as Extraction.run_batch, on the staged pipeline.
+# workers sets the load stage; parse_workers and queue_size are specific to the pipeline.
+def run_pipeline(pdf_paths, workers=None, ocr_workers=None, cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES,
+                 sink=None, stats=None, profile_dir=None, backend=DEFAULT_BACKEND, ocr_engine=DEFAULT_ENGINE,
+                 ner_fallback=False, on_result=None, stop_early=False, dedup=None, daemon=None, parse_workers=1,
+                 queue_size=DEFAULT_QUEUE_SIZE, ocr_preprocess=None, templates=None, learn_templates=True,
+                 low_memory=None, max_rss_mb=None):
+    if profile_dir:
+        print("--profile is per document and only supported without --pipeline; ignoring it.")
+    if daemon:
+        print("--daemon runs whole documents and is not used with --pipeline; extracting here.")
+    if templates:
+        print("--templates decides per document before loading it and is not used with --pipeline; ignoring it.")
+    if low_memory or max_rss_mb:
+        print("--low-memory and --max-rss bound one document at a time and are not used with --pipeline; "
+              "ignoring them.")
+    pipeline = Pipeline(load_workers=workers, ocr_workers=ocr_workers, parse_workers=parse_workers,
+                        queue_size=queue_size, cache_dir=cache_dir, cache_max_bytes=cache_max_bytes,
+                        backend=backend or DEFAULT_BACKEND, ocr_engine=ocr_engine or DEFAULT_ENGINE,
+                        ner_fallback=ner_fallback, stop_early=stop_early, ocr_preprocess=ocr_preprocess)
+    started = time.perf_counter()
+    result = pipeline.run(pdf_paths, sink, stats, on_result, dedup)
+    print(f"Pipeline finished {len(pdf_paths)} file(s) in {time.perf_counter() - started:.2f}s")
+    return result
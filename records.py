@@ -0,0 +1,222 @@
+# Compact typed invoice records and the columnar frame built from them.
+#
+# extract_details returns a dict of strings plus seven parallel lists of line items; as
+# output rows every header field is then repeated as a Python string on every line item.
+# For large exports (a million rows is a month-end close) that is most of the memory and
+# most of the conversion time. Here an invoice is
+#
+#   InvoiceRecord  ->  InvoiceHeader (slotted, one string per field)
+#                  ->  LineItems (text lists, Quintal/Rate/Amount as float arrays)
+#
+# and the consolidated frame is built a column at a time: header fields are coded once
+# per invoice and broadcast by repeating the codes, repeated text becomes categoricals,
+# the invoice date a real date, and the "-" normalisation is applied to the distinct
+# values instead of to every row. 'Date of Invoice' stays the text as written, as in
+# every output format, and the parsed date goes next to it in 'Date of Invoice Parsed'
+# (NaT for a date in none of DATE_FORMATS).
+#
+#   records = [InvoiceRecord.from_details(details, pdf_path) for pdf_path, details in results]
+#   df = to_frame(records)    # pandas; to_arrow(records) for Parquet
+import re
+from array import array
+from datetime import datetime
+from itertools import chain
+from operator import attrgetter
+
+import numpy as np
+
+from output_sinks import LINE_ITEM_COLUMNS, HEADER_COLUMNS, OUTPUT_COLUMNS, DASH_COLUMNS, DASH_VALUES
+
+NUMERIC_COLUMNS = ['Quintal', 'Rate', 'Amount']
+DATE_COLUMNS = ['Date of Invoice']
+DATE_FORMATS = ("%d-%m-%Y", "%d-%m-%y", "%d/%m/%Y", "%Y-%m-%d")
+# Parsed date of each date column, right after it in the frame: the only columns the
+# frame (and Parquet) has that the other output formats don't
+PARSED_DATE_COLUMNS = {column: f"{column} Parsed" for column in DATE_COLUMNS}
+FRAME_COLUMNS = [name for column in OUTPUT_COLUMNS for name in (column, PARSED_DATE_COLUMNS.get(column)) if name]
+
+
+# Attribute name of a column: 'Date of Invoice' -> date_of_invoice
+def _attribute(column):
+    return re.sub(r"\W+", "_", column.lower()).strip("_")
+
+
+HEADER_ATTRIBUTES = {column: _attribute(column) for column in HEADER_COLUMNS}
+LINE_ITEM_ATTRIBUTES = {column: _attribute(column) for column in LINE_ITEM_COLUMNS}
+# 'Company Name' is the one field extract_details fills with something when it is missing
+HEADER_DEFAULTS = {'Company Name': "N/A"}
+
+
+def _to_float(value):
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).replace(",", ""))
+    except ValueError:
+        return float("nan")
+
+
+# Function to read a numeric column into a float array; the values are plain numbers
+# almost always, so the per-value fallback only runs when one isn't
+def _float_array(values):
+    try:
+        return array("d", map(float, values))
+    except (TypeError, ValueError):
+        return array("d", map(_to_float, values))
+
+
+class InvoiceHeader:
+    __slots__ = tuple(HEADER_ATTRIBUTES.values())
+
+    def __init__(self, **fields):
+        for attribute in self.__slots__:
+            setattr(self, attribute, fields.get(attribute, ""))
+
+    @classmethod
+    def from_details(cls, details):
+        header = cls.__new__(cls)
+        for column, attribute in HEADER_ATTRIBUTES.items():
+            value = details.get(column)
+            if value.__class__ is not str:
+                value = HEADER_DEFAULTS.get(column, "") if value is None else str(value)
+            setattr(header, attribute, value)
+        return header
+
+    def get(self, column):
+        return getattr(self, HEADER_ATTRIBUTES[column])
+
+
+_NUMERIC_LINE_ITEMS = [column in NUMERIC_COLUMNS for column in LINE_ITEM_COLUMNS]
+
+
+class LineItems:
+    __slots__ = tuple(LINE_ITEM_ATTRIBUTES.values())
+
+    @classmethod
+    def from_details(cls, details):
+        items = cls.__new__(cls)
+        columns = [details.get(column) or [] for column in LINE_ITEM_COLUMNS]
+        # Same rows as details_to_rows: as many as the shortest column
+        count = min(map(len, columns))
+        for attribute, numeric, values in zip(LINE_ITEM_ATTRIBUTES.values(), _NUMERIC_LINE_ITEMS, columns):
+            if len(values) != count:
+                values = values[:count]
+            # Text columns are regex groups already; the list is kept as it is
+            setattr(items, attribute, _float_array(values) if numeric else values)
+        return items
+
+    def column(self, column):
+        return getattr(self, LINE_ITEM_ATTRIBUTES[column])
+
+    def __len__(self):
+        return len(self.amount)
+
+
+class InvoiceRecord:
+    __slots__ = ("source_path", "header", "items")
+
+    def __init__(self, header, items, source_path=None):
+        self.header = header
+        self.items = items
+        self.source_path = source_path
+
+    @classmethod
+    def from_details(cls, details, source_path=None):
+        return cls(InvoiceHeader.from_details(details), LineItems.from_details(details), source_path)
+
+    def __len__(self):
+        return len(self.items)
+
+
+# Function to code values as (codes, categories), categories in order of first appearance.
+# Both passes are dict operations mapped in C, with no Python code per value.
+def _factorize(values):
+    categories = list(dict.fromkeys(values))
+    index = {value: code for code, value in enumerate(categories)}
+    codes = np.fromiter(map(index.__getitem__, values), dtype=np.int32, count=len(values))
+    return codes, categories
+
+
+def _parse_date(value):
+    for date_format in DATE_FORMATS:
+        try:
+            return np.datetime64(datetime.strptime(value, date_format).date(), "D")
+        except ValueError:
+            continue
+    return np.datetime64("NaT", "D")
+
+
+# Function to build the columns of the consolidated table from records, in FRAME_COLUMNS
+# order: float arrays for NUMERIC_COLUMNS, datetime64[s] arrays for PARSED_DATE_COLUMNS,
+# and (codes, categories) for every text column, the dates as written included
+def columnar(records):
+    headers = [record.header for record in records]
+    items = [record.items for record in records]
+    counts = np.fromiter(map(len, items), dtype=np.int64, count=len(items))
+    # The invoice each output row comes from
+    row_invoice = np.repeat(np.arange(len(records)), counts)
+    columns = {}
+
+    for column, attribute in LINE_ITEM_ATTRIBUTES.items():
+        values = map(attrgetter(attribute), items)
+        if column in NUMERIC_COLUMNS:
+            # The float arrays are joined as raw buffers, without a Python float per value
+            columns[column] = np.frombuffer(b"".join(values), dtype=np.float64)
+        else:
+            columns[column] = _factorize(list(chain.from_iterable(values)))
+
+    for column, attribute in HEADER_ATTRIBUTES.items():
+        values = list(map(attrgetter(attribute), headers))
+        if column in DASH_COLUMNS:
+            values = ["-" if value in DASH_VALUES else value for value in values]
+        codes, categories = _factorize(values)
+        if column in DATE_COLUMNS:
+            # Invoices share few dates; each distinct one is parsed once
+            dates = np.array([_parse_date(value) for value in categories], dtype="datetime64[D]")
+            columns[PARSED_DATE_COLUMNS[column]] = dates[codes][row_invoice].astype("datetime64[s]")
+        columns[column] = (codes[row_invoice], categories)
+
+    return {column: columns[column] for column in FRAME_COLUMNS}
+
+
+# Function to build the consolidated pandas DataFrame of a list of records
+def to_frame(records):
+    import pandas as pd
+    data = {}
+    for column, values in columnar(records).items():
+        if isinstance(values, tuple):
+            codes, categories = values
+            data[column] = pd.Categorical.from_codes(codes, categories=pd.Index(categories, dtype=object))
+        else:
+            data[column] = values
+    return pd.DataFrame(data, columns=FRAME_COLUMNS)
+
+
+# Arrow schema of the consolidated table; dictionary columns keep one copy of each value
+def arrow_schema():
+    import pyarrow as pa
+    fields = []
+    for column in FRAME_COLUMNS:
+        if column in NUMERIC_COLUMNS:
+            fields.append((column, pa.float64()))
+        elif column in PARSED_DATE_COLUMNS.values():
+            # A timestamp rather than date32, which pandas would read back as Python objects
+            fields.append((column, pa.timestamp("s")))
+        else:
+            fields.append((column, pa.dictionary(pa.int32(), pa.string())))
+    return pa.schema(fields)
+
+
+# Function to build a pyarrow Table of a list of records
+def to_arrow(records, schema=None):
+    import pyarrow as pa
+    schema = schema or arrow_schema()
+    arrays = []
+    for field, values in zip(schema, columnar(records).values()):
+        if isinstance(values, tuple):
+            codes, categories = values
+            arrays.append(pa.DictionaryArray.from_arrays(pa.array(codes, pa.int32()),
+                                                         pa.array(categories, pa.string())))
+        else:
+            arrays.append(pa.array(values, type=field.type, from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=schema)
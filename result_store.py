@@ -0,0 +1,341 @@
+# Embedded SQLite store for extract_details results.
+#
+# Invoice headers and line items live in two normalised tables. Lookups by GSTIN,
+# Invoice No, Date of Invoice and Company Name are served by indexes, so a query
+# like "every invoice of GSTIN X in July" reads a handful of index pages instead of
+# reloading a whole workbook. Dates are also stored as ISO yyyy-mm-dd so month and
+# range queries can use the (GSTIN, date) indexes.
+#
+#   python result_store.py invoices.db --gstin 27AAEPW8766H1ZY --month 2023-07
+#   python result_store.py invoices.db --invoice-no 210 --items --format json
+import os
+import re
+import csv
+import sys
+import json
+import time
+import sqlite3
+import calendar
+import argparse
+import datetime
+
+from output_sinks import OutputSink, LINE_ITEM_COLUMNS, HEADER_COLUMNS, DASH_COLUMNS, DASH_VALUES
+
+# details key -> column of the invoices table
+HEADER_FIELDS = {
+    'Company Name': "company_name",
+    'Invoice No': "invoice_no",
+    'FSSAI': "fssai",
+    'Date of Invoice': "invoice_date_raw",
+    'GSTIN NO': "gstin_no",
+    'GSTIN': "gstin",
+    'PAN NO': "pan_no",
+    'TAN NO': "tan_no",
+    'STD': "std",
+    'Shipped to': "shipped_to",
+    'Transport': "transport",
+    'Place of Supply': "place_of_supply",
+    'Vehicle No': "vehicle_no",
+    'Licence No': "licence_no",
+    'Mobile No': "mobile_no",
+}
+
+# details key -> column of the line_items table
+LINE_ITEM_FIELDS = {
+    'Goods Description': "goods_description",
+    'HSN/SAC': "hsn_sac",
+    'Bags': "bags",
+    'Pack': "pack",
+    'Quintal': "quintal",
+    'Rate': "rate",
+    'Amount': "amount",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    source_path TEXT,
+    processed_at TEXT,
+    invoice_date TEXT,
+    {header_columns}
+);
+CREATE TABLE IF NOT EXISTS line_items (
+    invoice_id INTEGER NOT NULL REFERENCES invoices(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    goods_description TEXT,
+    hsn_sac TEXT,
+    bags TEXT,
+    pack TEXT,
+    quintal REAL,
+    rate REAL,
+    amount REAL,
+    PRIMARY KEY (invoice_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS invoices_gstin_date ON invoices (gstin, invoice_date);
+CREATE INDEX IF NOT EXISTS invoices_gstin_no_date ON invoices (gstin_no, invoice_date);
+CREATE INDEX IF NOT EXISTS invoices_invoice_no ON invoices (invoice_no);
+CREATE INDEX IF NOT EXISTS invoices_date ON invoices (invoice_date);
+CREATE INDEX IF NOT EXISTS invoices_source ON invoices (source_path);
+CREATE INDEX IF NOT EXISTS invoices_company_date ON invoices (company_name, invoice_date);
+""".format(header_columns=",\n    ".join(f"{column} TEXT" for column in HEADER_FIELDS.values()))
+
+DATE_PATTERN = re.compile(r'(\d{1,2})-(\d{1,2})-(\d{2}|\d{4})$')
+MONTH_PATTERN = re.compile(r'(\d{4})-(\d{1,2})$')
+
+
+# Function to turn the dd-mm-yyyy (or dd-mm-yy) dates of the bills into ISO dates; None if unparseable
+def iso_date(value):
+    match = DATE_PATTERN.match(value.strip()) if value else None
+    if match is None:
+        return None
+    day, month, year = (int(part) for part in match.groups())
+    if year < 100:
+        year += 2000
+    try:
+        # Also turns away days the month doesn't have, like 31-02
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def to_float(value):
+    try:
+        return float(str(value).replace(",", ""))
+    except ValueError:
+        return None
+
+
+# Function to give the first and last ISO date of a "yyyy-mm" month; ValueError if it isn't one
+def month_range(month):
+    match = MONTH_PATTERN.match(month.strip())
+    if match is None or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"{month!r} is not a month; expected yyyy-mm, e.g. 2023-07")
+    year, month_number = (int(part) for part in match.groups())
+    last_day = calendar.monthrange(year, month_number)[1]
+    return f"{year:04d}-{month_number:02d}-01", f"{year:04d}-{month_number:02d}-{last_day:02d}"
+
+
+# argparse types, so a bad --month, --from or --to is a usage error
+def month_argument(value):
+    try:
+        month_range(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value.strip()
+
+
+def date_argument(value):
+    try:
+        return datetime.date.fromisoformat(value.strip()).isoformat()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value!r} is not a date; expected yyyy-mm-dd, e.g. 2023-07-31")
+
+
+class ResultStore:
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        # WAL lets readers query while a batch is writing
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def _header_row(self, details, source_path, processed_at):
+        values = []
+        for field in HEADER_FIELDS:
+            value = details.get(field, "")
+            if field in DASH_COLUMNS and value in DASH_VALUES:
+                value = "-"
+            values.append(value)
+        return [source_path, processed_at, iso_date(details.get('Date of Invoice', ""))] + values
+
+    # Function to insert many (details, source path) pairs in a single transaction
+    def add_many(self, results):
+        processed_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+        header_sql = (f"INSERT INTO invoices (source_path, processed_at, invoice_date, "
+                      f"{', '.join(HEADER_FIELDS.values())}) VALUES ({', '.join('?' * (len(HEADER_FIELDS) + 3))})")
+        items_sql = (f"INSERT INTO line_items (invoice_id, position, {', '.join(LINE_ITEM_FIELDS.values())}) "
+                     f"VALUES ({', '.join('?' * (len(LINE_ITEM_FIELDS) + 2))})")
+        ids = []
+        with self.conn:
+            for details, source_path in results:
+                cursor = self.conn.execute(header_sql, self._header_row(details, source_path, processed_at))
+                invoice_id = cursor.lastrowid
+                columns = [details.get(field, []) for field in LINE_ITEM_FIELDS]
+                self.conn.executemany(items_sql, [
+                    (invoice_id, position, goods, hsn, bags, pack, to_float(quintal), to_float(rate), to_float(amount))
+                    for position, (goods, hsn, bags, pack, quintal, rate, amount) in enumerate(zip(*columns))])
+                ids.append(invoice_id)
+        return ids
+
+    def add(self, details, source_path=None):
+        return self.add_many([(details, source_path)])[0]
+
+    # Function to delete the invoices read from a source file, with their line items
+    def delete_source(self, source_path):
+        with self.conn:
+            return self.conn.execute("DELETE FROM invoices WHERE source_path = ?", (source_path,)).rowcount
+
+    # Function to look invoices up; every filter is optional and they combine with AND.
+    # gstin matches either the supplier (GSTIN NO) or the buyer (GSTIN) column.
+    def find(self, gstin=None, invoice_no=None, company=None, date_from=None, date_to=None, month=None,
+             with_items=False, limit=None):
+        if month:
+            date_from, date_to = month_range(month)
+
+        conditions = []
+        params = []
+        if invoice_no:
+            conditions.append("invoice_no = ?")
+            params.append(invoice_no)
+        if company:
+            conditions.append("company_name = ?")
+            params.append(company)
+        date_conditions = []
+        date_params = []
+        if date_from:
+            date_conditions.append("invoice_date >= ?")
+            date_params.append(date_from)
+        if date_to:
+            date_conditions.append("invoice_date <= ?")
+            date_params.append(date_to)
+
+        if gstin:
+            # Each side of the OR repeats the date range so both (gstin, date) indexes are used
+            sides = []
+            for column in ("gstin_no", "gstin"):
+                sides.append(" AND ".join([f"{column} = ?"] + date_conditions))
+                params.extend([gstin] + date_params)
+            conditions.append("(" + " OR ".join(f"({side})" for side in sides) + ")")
+        else:
+            conditions.extend(date_conditions)
+            params.extend(date_params)
+
+        sql = "SELECT * FROM invoices"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY invoice_date, id"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+
+        invoices = [dict(row) for row in self.conn.execute(sql, params)]
+        if with_items and invoices:
+            self._attach_items(invoices)
+        return invoices
+
+    def _attach_items(self, invoices):
+        by_id = {invoice["id"]: invoice for invoice in invoices}
+        for invoice in invoices:
+            invoice["line_items"] = []
+        ids = list(by_id)
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT * FROM line_items WHERE invoice_id IN ({', '.join('?' * len(chunk))}) "
+                f"ORDER BY invoice_id, position", chunk)
+            for row in rows:
+                item = dict(row)
+                by_id[item.pop("invoice_id")]["line_items"].append(item)
+
+    def count(self):
+        invoices = self.conn.execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+        line_items = self.conn.execute("SELECT COUNT(*) FROM line_items").fetchone()[0]
+        return invoices, line_items
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Batch runner sink: invoices are buffered and committed batch_size at a time,
+# one transaction per batch
+class StoreSink(OutputSink):
+    def __init__(self, path, batch_size=500):
+        super().__init__(path)
+        self.store = ResultStore(path)
+        self.batch_size = batch_size
+        self._pending = []
+
+    def write_details(self, details, source_path=None):
+        self._pending.append((details, source_path))
+        self.rows_written += len(details.get('Goods Description', []))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.store.add_many(self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        self.store.close()
+
+
+# Same column order as the consolidated workbook, one row per line item
+def invoices_to_rows(invoices):
+    for invoice in invoices:
+        header = [invoice[HEADER_FIELDS[field]] for field in HEADER_COLUMNS]
+        for item in invoice.get("line_items", []):
+            yield [item.get(LINE_ITEM_FIELDS[field], "") for field in LINE_ITEM_COLUMNS] + header
+
+
+# NULL as an empty cell, numbers as they are
+def _cell(value):
+    return "" if value is None else str(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query invoices stored by Extraction.py --db.")
+    parser.add_argument("db", help="SQLite database written by Extraction.py --db.")
+    parser.add_argument("--gstin", help="Supplier or buyer GSTIN.")
+    parser.add_argument("--invoice-no")
+    parser.add_argument("--company", help="Exact company name.")
+    parser.add_argument("--month", type=month_argument, help="yyyy-mm, e.g. 2023-07.")
+    parser.add_argument("--from", dest="date_from", type=date_argument, help="First date, yyyy-mm-dd.")
+    parser.add_argument("--to", dest="date_to", type=date_argument, help="Last date, yyyy-mm-dd.")
+    parser.add_argument("--items", action="store_true", help="Include line items.")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--format", choices=("table", "json", "csv"), default="table")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"No database at {args.db}")
+        return 1
+
+    with ResultStore(args.db) as store:
+        started = time.perf_counter()
+        invoices = store.find(gstin=args.gstin, invoice_no=args.invoice_no, company=args.company,
+                              date_from=args.date_from, date_to=args.date_to, month=args.month,
+                              with_items=args.items or args.format == "csv", limit=args.limit)
+        elapsed = time.perf_counter() - started
+
+    if args.format == "json":
+        json.dump(invoices, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    elif args.format == "csv":
+        writer = csv.writer(sys.stdout)
+        writer.writerow(LINE_ITEM_COLUMNS + HEADER_COLUMNS)
+        writer.writerows(invoices_to_rows(invoices))
+    else:
+        # Any column may be NULL, which the format specs don't take
+        for invoice in invoices:
+            print(f"{invoice['invoice_date'] or invoice['invoice_date_raw'] or '':<12} "
+                  f"{invoice['invoice_no'] or '':<10} {invoice['gstin_no'] or '':<16} {invoice['company_name'] or ''}")
+            for item in invoice.get("line_items", []):
+                print(f"    {item['goods_description'] or '':<30} {_cell(item['quintal']):>10} x "
+                      f"{_cell(item['rate']):>10} = {_cell(item['amount']):>12}")
+        print(f"{len(invoices)} invoice(s) in {elapsed * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
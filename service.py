@@ -0,0 +1,448 @@
+# Local HTTP extraction service.
+#
+# Other systems submit invoices over HTTP instead of the desktop file picker. Each
+# PDF (an upload or a path on this machine) becomes a job in a persistent SQLite
+# queue (jobqueue.py) that a pool of worker processes drains, so queued work survives
+# a restart. Standard library only, bound to localhost by default.
+#
+#   python service.py --port 8765 --workers 4
+#
+#   POST /extract            body: the PDF (Content-Type: application/pdf) or {"path": "..."};
+#                            waits for the details (?wait=0 returns the job id at once)
+#   POST /batch              {"paths": [...]} -> batch id; results at GET /batches/<id>
+#   GET  /jobs/<id>          status, details or error of one job
+#   GET  /batches/<id>       status and results of a batch
+#   GET  /metrics            request latency per endpoint, queue depth, extraction times
+#   GET  /health
+#
+# Bursts are absorbed by the queue up to --max-queue waiting jobs and by up to
+# --max-inflight requests being served; past either limit requests get 503 with a
+# Retry-After header instead of piling up.
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import deque, defaultdict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from jobqueue import JobQueue, worker_name
+
+DEFAULT_QUEUE_PATH = "extraction_jobs.db"
+DEFAULT_UPLOAD_DIR = "uploads"
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+
+# Latencies of the most recent requests per endpoint, and counts per status code
+class Metrics:
+    def __init__(self, window=2048):
+        self.window = window
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._latencies = defaultdict(lambda: deque(maxlen=self.window))
+        self._statuses = defaultdict(int)
+        self._extraction = deque(maxlen=window)
+        self.rejected = 0
+
+    def record_request(self, route, status, seconds):
+        with self._lock:
+            self._latencies[route].append(seconds)
+            self._statuses[f"{route} {status}"] += 1
+            if status == 503:
+                self.rejected += 1
+
+    def record_extraction(self, seconds):
+        with self._lock:
+            self._extraction.append(seconds)
+
+    @staticmethod
+    def _summary(values):
+        if not values:
+            return {"count": 0}
+        ordered = sorted(values)
+
+        def percentile(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+
+        return {"count": len(ordered), "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p50_ms": percentile(0.50), "p95_ms": percentile(0.95), "p99_ms": percentile(0.99),
+                "max_ms": round(ordered[-1] * 1000, 2)}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_s": round(time.time() - self.started, 1),
+                "requests": {route: self._summary(values) for route, values in self._latencies.items()},
+                "responses": dict(self._statuses),
+                "rejected_503": self.rejected,
+                "extraction": self._summary(self._extraction),
+            }
+
+
+# Worker pool: one dispatcher thread per worker process claims jobs from the queue and
+# waits for its process to extract them, renewing the lease of long jobs
+class WorkerPool:
+    def __init__(self, queue, workers, options, metrics, upload_dir):
+        self.queue = queue
+        self.workers = workers
+        self.options = options
+        self.metrics = metrics
+        self.upload_dir = os.path.abspath(upload_dir)
+        self.busy = 0
+        self._busy_lock = threading.Lock()
+        self._executor = ProcessPoolExecutor(max_workers=workers)
+        self._executor_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Condition()
+        self._finished = threading.Condition()
+        self._threads = [threading.Thread(target=self._dispatch, args=(index,), daemon=True)
+                         for index in range(workers)]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    # Called after enqueueing so an idle dispatcher picks the job up at once
+    def notify(self):
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    # Function to replace the process pool once one of its processes died (OOM-killed,
+    # segfault): a broken pool fails every job handed to it. Only the first dispatcher
+    # to notice replaces it.
+    def _restart_executor(self, broken):
+        with self._executor_lock:
+            if self._executor is broken:
+                print("A worker process died; restarting the worker pool")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    # Function to extract one job on the process pool, renewing its lease while it runs.
+    # A job caught in a pool that broke is tried once more on the new pool.
+    def _run(self, job, worker):
+        from Extraction import process_pdf
+        for attempt in range(2):
+            executor = self._executor
+            try:
+                future = executor.submit(process_pdf, job["pdf_path"], **{**self.options, **job["options"]})
+                while True:
+                    try:
+                        return future.result(timeout=self.queue.lease_seconds / 3)[1:]
+                    except FutureTimeoutError:
+                        self.queue.renew(job["id"], worker)
+            except BrokenProcessPool:
+                self._restart_executor(executor)
+                if attempt:
+                    raise
+
+    def _dispatch(self, index):
+        worker = worker_name(index)
+
+        while not self._stop.is_set():
+            job = self.queue.claim(worker)
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(timeout=1.0)
+                continue
+
+            with self._busy_lock:
+                self.busy += 1
+            started = time.perf_counter()
+            try:
+                details, error, trace = self._run(job, worker)
+            except Exception as e:
+                details, error, trace = None, f"{type(e).__name__}: {e}", None
+            finally:
+                with self._busy_lock:
+                    self.busy -= 1
+
+            self.metrics.record_extraction(time.perf_counter() - started)
+            if error:
+                self.queue.fail(job["id"], worker, error, trace)
+            else:
+                self.queue.complete(job["id"], worker, details, trace)
+            # Every upload is its own file, only needed until its result is stored; files
+            # submitted by path belong to whoever submitted them
+            if job["uploaded"]:
+                try:
+                    os.remove(job["pdf_path"])
+                except OSError:
+                    pass
+            with self._finished:
+                self._finished.notify_all()
+
+    # Function to wait until a job is done or failed; returns the job, or None on timeout
+    def wait_for(self, job_id, timeout):
+        deadline = time.time() + timeout
+        while True:
+            job = self.queue.get(job_id)
+            if job is None or job["status"] in ("done", "failed"):
+                return job
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            with self._finished:
+                self._finished.wait(timeout=min(remaining, 0.5))
+
+    def stop(self):
+        self._stop.set()
+        self.notify()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._executor.shutdown(cancel_futures=True)
+
+
+def job_response(job):
+    response = {"job_id": job["id"], "status": job["status"], "pdf_path": job["pdf_path"],
+                "batch_id": job["batch_id"], "attempts": job["attempts"]}
+    if job["status"] == "done":
+        response["details"] = job["details"]
+    if job["status"] == "failed":
+        response["error"] = job["error"]
+    if job["finished_at"] and job["started_at"]:
+        response["seconds"] = round(job["finished_at"] - job["started_at"], 3)
+    return response
+
+
+class ExtractionHandler(BaseHTTPRequestHandler):
+    server_version = "InvoiceExtraction/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self._status = status
+
+    def _busy(self, reason):
+        retry_after = max(1, int(self.server.estimated_wait()))
+        self._send(503, {"error": reason, "retry_after_s": retry_after}, {"Retry-After": str(retry_after)})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _handle(self, method):
+        started = time.perf_counter()
+        self._status = 500
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        route = "/" + parts[0] if parts else "/"
+
+        if not self.server.admission.acquire(blocking=False):
+            self._busy("Too many requests in flight")
+        else:
+            try:
+                self._route(method, parts, parse_qs(url.query))
+            except (ValueError, KeyError) as e:
+                self._send(400, {"error": f"Bad request: {e}"})
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+            finally:
+                self.server.admission.release()
+        self.server.metrics.record_request(f"{method} {route}", self._status, time.perf_counter() - started)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _route(self, method, parts, query):
+        server = self.server
+        if method == "GET" and parts == ["health"]:
+            self._send(200, {"status": "ok"})
+        elif method == "GET" and parts == ["metrics"]:
+            self._send(200, {**server.metrics.snapshot(), "queue": server.queue.counts(),
+                             "workers": server.pool.workers, "workers_busy": server.pool.busy})
+        elif method == "GET" and len(parts) == 2 and parts[0] == "jobs":
+            job = server.queue.get(int(parts[1]))
+            self._send(200, job_response(job)) if job else self._send(404, {"error": "No such job"})
+        elif method == "GET" and len(parts) == 2 and parts[0] == "batches":
+            jobs = server.queue.batch(parts[1])
+            if not jobs:
+                self._send(404, {"error": "No such batch"})
+            else:
+                self._send(200, {"batch_id": parts[1], "counts": server.queue.counts(parts[1]),
+                                 "jobs": [job_response(job) for job in jobs]})
+        elif method == "POST" and parts == ["extract"]:
+            self._extract(query)
+        elif method == "POST" and parts == ["batch"]:
+            self._batch()
+        else:
+            self._send(404, {"error": "Not found"})
+
+    def _extract(self, query):
+        server = self.server
+        if server.queue_full(1):
+            return self._busy("Queue is full")
+
+        content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip()
+        uploaded = content_type != "application/json"
+        if not uploaded:
+            pdf_path = server.checked_path(self._read_json()["path"])
+        else:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > server.max_upload_bytes:
+                return self._send(413, {"error": f"Upload larger than {server.max_upload_bytes} bytes"})
+            pdf_path = server.save_upload(self.rfile.read(length))
+
+        job_id = server.queue.enqueue(pdf_path, uploaded=uploaded)
+        server.pool.notify()
+        if query.get("wait", ["1"])[0] in ("0", "false", "no"):
+            return self._send(202, {"job_id": job_id, "status": "queued"}, {"Location": f"/jobs/{job_id}"})
+
+        timeout = float(query.get("timeout", [server.wait_timeout])[0])
+        job = server.pool.wait_for(job_id, timeout)
+        if job is None:
+            self._send(202, {"job_id": job_id, "status": "queued"}, {"Location": f"/jobs/{job_id}"})
+        else:
+            self._send(200 if job["status"] == "done" else 422, job_response(job))
+
+    def _batch(self):
+        server = self.server
+        paths = self._read_json()["paths"]
+        if not isinstance(paths, list) or not paths:
+            raise ValueError("'paths' must be a non-empty list")
+        if server.queue_full(len(paths)):
+            return self._busy("Queue is full")
+
+        pdf_paths = [server.checked_path(path) for path in paths]
+        batch_id = uuid.uuid4().hex
+        job_ids = server.queue.enqueue_many(pdf_paths, batch_id=batch_id)
+        server.pool.notify()
+        self._send(202, {"batch_id": batch_id, "job_ids": job_ids}, {"Location": f"/batches/{batch_id}"})
+
+
+class ExtractionServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, queue, pool, metrics, upload_dir=DEFAULT_UPLOAD_DIR, max_queue=1000,
+                 max_inflight=64, max_upload_bytes=MAX_UPLOAD_BYTES, wait_timeout=120.0, allowed_dirs=None,
+                 verbose=False):
+        super().__init__(address, ExtractionHandler)
+        self.queue = queue
+        self.pool = pool
+        self.metrics = metrics
+        self.upload_dir = upload_dir
+        self.max_queue = max_queue
+        self.admission = threading.BoundedSemaphore(max_inflight)
+        self.max_upload_bytes = max_upload_bytes
+        self.wait_timeout = wait_timeout
+        # Paths sent by clients are read with the service's rights, so never from anywhere
+        self.allowed_dirs = [os.path.abspath(path) for path in allowed_dirs or [os.getcwd()]]
+        self.verbose = verbose
+        os.makedirs(upload_dir, exist_ok=True)
+
+    def queue_full(self, adding):
+        counts = self.queue.counts()
+        return counts["queued"] + adding > self.max_queue
+
+    # Seconds until a newly queued job would likely start, for Retry-After
+    def estimated_wait(self):
+        snapshot = self.metrics.snapshot()["extraction"]
+        per_job = snapshot.get("mean_ms", 1000) / 1000
+        return self.queue.counts()["queued"] * per_job / max(1, self.pool.workers)
+
+    def checked_path(self, path):
+        path = os.path.abspath(path)
+        if not any(os.path.commonpath([path, root]) == root for root in self.allowed_dirs):
+            raise ValueError(f"{path} is outside the allowed directories")
+        if not os.path.isfile(path):
+            raise ValueError(f"No such file: {path}")
+        return path
+
+    # Every upload gets a file of its own: the worker deletes it once its job is finished,
+    # so two jobs must never share one, even for the same bill sent twice
+    def save_upload(self, data):
+        if not data.startswith(b"%PDF"):
+            raise ValueError("Body is not a PDF")
+        path = os.path.abspath(os.path.join(self.upload_dir, uuid.uuid4().hex + ".pdf"))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+
+def main(argv=None):
+    from Extraction import ocr_roi_argument
+
+    parser = argparse.ArgumentParser(description="Serve invoice extraction over HTTP on this machine.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Extraction processes.")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="SQLite file of the job queue.")
+    parser.add_argument("--upload-dir", default=DEFAULT_UPLOAD_DIR)
+    parser.add_argument("--max-queue", type=int, default=1000, help="Queued jobs before new ones get 503.")
+    parser.add_argument("--max-inflight", type=int, default=64, help="Requests served at once before 503.")
+    parser.add_argument("--allow-dir", action="append", default=[],
+                        help="Only accept paths under this directory (repeatable). Default: the working directory.")
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--ocr-engine", default="auto")
+    parser.add_argument("--ocr-workers", type=int, default=1)
+    parser.add_argument("--cache-dir", default=None, help="Text cache shared by the workers.")
+    parser.add_argument("--stop-early", action="store_true")
+    parser.add_argument("--ner-fallback", action="store_true")
+    parser.add_argument("--ocr-preprocess", action="store_true", help="See Extraction.py --ocr-preprocess.")
+    parser.add_argument("--ocr-roi", type=ocr_roi_argument, default="auto")
+    parser.add_argument("--low-memory", nargs="?", type=int, const=1, default=None, metavar="PAGES",
+                        help="See Extraction.py --low-memory.")
+    parser.add_argument("--max-rss", type=int, default=None, metavar="MB", help="See Extraction.py --max-rss.")
+    parser.add_argument("--verbose", action="store_true", help="Log every request.")
+    args = parser.parse_args(argv)
+
+    from ocr_engines import resolve_engine
+    from pdf_backends import DEFAULT_BACKEND
+    try:
+        ocr_engine = resolve_engine(args.ocr_engine)
+    except RuntimeError as e:
+        # Text-layer PDFs don't need one; the workers look for it again when a page does
+        print(f"Warning: {e}; scanned pages will fail, text-layer PDFs are extracted as usual.")
+        ocr_engine = args.ocr_engine
+
+    options = {"ocr_workers": args.ocr_workers, "backend": args.backend or DEFAULT_BACKEND,
+               "ocr_engine": ocr_engine, "cache_dir": os.path.abspath(args.cache_dir) if args.cache_dir else None,
+               "stop_early": args.stop_early, "ner_fallback": args.ner_fallback,
+               "low_memory": args.low_memory, "max_rss_mb": args.max_rss}
+    if args.ocr_preprocess:
+        from ocr_preprocess import OcrPreprocessor
+        options["ocr_preprocess"] = OcrPreprocessor(roi=args.ocr_roi)
+    metrics = Metrics()
+    queue = JobQueue(args.queue)
+    pool = WorkerPool(queue, args.workers, options, metrics, args.upload_dir)
+    server = ExtractionServer((args.host, args.port), queue, pool, metrics, upload_dir=args.upload_dir,
+                              max_queue=args.max_queue, max_inflight=args.max_inflight,
+                              allowed_dirs=args.allow_dir, verbose=args.verbose)
+    counts = queue.counts()
+    if counts["queued"] or counts["running"]:
+        print(f"Resuming {counts['queued']} queued and {counts['running']} interrupted job(s)")
+
+    pool.start()
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]} "
+          f"with {args.workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down.")
+    finally:
+        server.server_close()
+        pool.stop()
+        queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,532 @@
+# Vendor layout templates.
+#
+# Most bills come from a few dozen suppliers whose layouts never change, yet each one
+# goes through every generic regex in extract_details, and scanned ones through full
+# page OCR. A template is learned from the first text-layer bill of a supplier layout
+# that the generic path reads, and is keyed on the supplier's GSTIN plus the positions
+# of the header keywords on the first page (the layout fingerprint). It holds:
+#
+#   word fields   single-word values (Invoice No, Date, GSTIN NO, ...) read from the
+#                 word at a fixed offset from their label, via the PDF's word positions
+#   regex fields  the other fields, searched only from their own label
+#   last page     pages past it are never read unless the line-item table runs on
+#   OCR regions   boxes on each page around the fields and the table; scans of a known
+#                 supplier only have these cropped areas OCR-ed
+#
+# A document whose fingerprint matches skips the generic path. When a template leaves a
+# field it knows empty, the document falls back to the generic path; every
+# VERIFY_EVERY-th hit is also checked against it, and a template that disagrees is
+# retired so the layout is learned again. Templates live in SQLite so every worker
+# process shares what any of them learned.
+#
+#   python templates.py list
+#   python templates.py forget 27ABCDE1234F1Z5
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+
+from Extraction import (FIELD_SPECS, LINE_ITEMS, LINE_ITEMS_END, GOODS_PATTERN, page_needs_ocr, find_last_gstin,
+                        search_from_label, build_label_index, extract_line_items, ocr_page_image, render_resolution, DEFAULT_BACKEND,
+                        DEFAULT_ENGINE)
+from ocr_engines import get_ocr_pool
+from instrumentation import NULL_TRACE
+
+DEFAULT_TEMPLATES_DB = ".extraction_templates.db"
+# Run the generic path alongside every n-th template hit and compare
+VERIFY_EVERY = 50
+# Label positions (page fractions) that count as the same place
+LABEL_TOLERANCE_X = 0.02
+LABEL_TOLERANCE_Y = 0.006
+# Share of a template's header labels that must be in place for a layout to match
+MIN_LABEL_MATCH = 0.8
+# How far a value word may sit from where the template expects it
+VALUE_TOLERANCE_X = 0.01
+VALUE_TOLERANCE_Y = 0.004
+# Words after its label that a value may be
+VALUE_SEARCH_WORDS = 12
+# OCR regions: margin around each band of lines, gap that splits bands, and the extra
+# height below the last band for tables longer than the one learned from
+REGION_MARGIN = 0.008
+REGION_GAP = 0.03
+REGION_GROWTH = 0.12
+# Top of the first page OCR-ed to find the supplier GSTIN of a scan
+PROBE_BOX = (0.0, 0.0, 1.0, 0.3)
+
+# Single-word fields and the shape of their value, as captured by FIELD_SPECS
+WORD_FIELDS = {
+    'GSTIN NO': re.compile(r'[\w\d]+'),
+    'Invoice No': re.compile(r'\d+'),
+    'Date of Invoice': re.compile(r'[\d\-]+'),
+    'FSSAI': re.compile(r'\d+'),
+    'Vehicle No': re.compile(r'[\w\d]+'),
+    'Licence No': re.compile(r'[\w\d]+'),
+    'Mobile No': re.compile(r'\d+'),
+    'PAN NO': re.compile(r'[\w\d]+'),
+    'TAN NO': re.compile(r'[\w\d\-]+'),
+    'STD': re.compile(r'[\d\-]+'),
+}
+
+SPECS = {spec[0]: spec for spec in FIELD_SPECS if spec is not LINE_ITEMS}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS templates (
+    id INTEGER PRIMARY KEY,
+    gstin TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    template TEXT NOT NULL,
+    source_path TEXT,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    retired INTEGER NOT NULL DEFAULT 0,
+    created_at REAL,
+    UNIQUE (gstin, layout)
+);
+CREATE INDEX IF NOT EXISTS templates_gstin ON templates (gstin, retired);
+"""
+
+
+# Function to search one field the way extract_details does, from the first of its labels
+def search_field(text, field):
+    _, labels, pattern, window, default = SPECS[field]
+    starts = [position for position in map(text.find, labels) if position != -1]
+    match = search_from_label(pattern, text, min(starts), window) if starts else None
+    return match.group(match.lastindex).strip() if match else default
+
+
+# Function to find the first occurrence of a label in a page's words; returns the word index
+def find_label(words, label, start=0):
+    tokens = label.split()
+    for index in range(start, len(words) - len(tokens) + 1):
+        if all(words[index + offset][4].startswith(token) for offset, token in enumerate(tokens)):
+            return index
+    return None
+
+
+# Function to group a page's words into lines: [(top, bottom, x0, x1, text)]
+def word_lines(words):
+    lines = []
+    for x0, top, x1, bottom, text in words:
+        if lines and abs(lines[-1][0] - top) <= LABEL_TOLERANCE_Y:
+            line_top, line_bottom, line_x0, line_x1, line_text = lines[-1]
+            lines[-1] = (line_top, max(line_bottom, bottom), min(line_x0, x0), max(line_x1, x1),
+                         f"{line_text} {text}")
+        else:
+            lines.append((top, bottom, x0, x1, text))
+    return lines
+
+
+# Function to give the layout of a first page: where each header label sits, up to the
+# first line item (below it, positions move with the length of the table)
+def layout_of(words):
+    lines = word_lines(words)
+    table_top = next((top for top, _, _, _, text in lines if GOODS_PATTERN.search(text)), 1.0)
+    labels = {}
+    for field, (_, field_labels, _, _, _) in SPECS.items():
+        for label in field_labels:
+            index = find_label(words, label)
+            if index is not None and words[index][1] < table_top:
+                labels[label] = (round(words[index][0], 3), round(words[index][1], 3))
+    return labels
+
+
+def layout_key(labels):
+    return hashlib.sha1(json.dumps(sorted(labels)).encode()).hexdigest()[:16]
+
+
+def layout_matches(template_labels, labels):
+    if not template_labels:
+        return False
+    in_place = sum(1 for label, (x, y) in template_labels.items()
+                   if label in labels and abs(labels[label][0] - x) <= LABEL_TOLERANCE_X
+                   and abs(labels[label][1] - y) <= LABEL_TOLERANCE_Y)
+    return in_place / len(template_labels) >= MIN_LABEL_MATCH
+
+
+# Function to fill a details dict in the order extract_details does, from the fields a
+# template found. A field the template doesn't know is searched from its label when the
+# label is in the text, as the generic path would, and keeps its default otherwise.
+def assemble_details(text, values, has_line_items):
+    details = {'GSTIN': values.get('GSTIN', "")}
+    label_index = build_label_index(text)
+    for spec in FIELD_SPECS:
+        if spec is LINE_ITEMS:
+            if has_line_items:
+                extract_line_items(text, details)
+            continue
+        field, labels, _, _, default = spec
+        if field in values:
+            details[field] = values[field]
+        elif any(label in label_index for label in labels):
+            details[field] = search_field(text, field)
+        else:
+            details[field] = default
+    return details
+
+
+# Result of running a template on a document
+class TemplateMatch:
+    def __init__(self, template_id, details, text, pages, ocr_pages, skipped_pages, verify=False):
+        self.template_id = template_id
+        self.details = details
+        self.text = text
+        self.pages = pages
+        self.ocr_pages = ocr_pages
+        self.skipped_pages = skipped_pages
+        self.verify = verify
+
+
+class TemplateRegistry:
+    def __init__(self, path=DEFAULT_TEMPLATES_DB, learn=True, verify_every=VERIFY_EVERY):
+        self.path = path
+        self.learn_new = learn
+        self.verify_every = verify_every
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self._hits = {}
+
+    def has_templates(self):
+        return self.conn.execute("SELECT 1 FROM templates WHERE retired = 0 LIMIT 1").fetchone() is not None
+
+    def templates_for(self, gstin):
+        rows = self.conn.execute(
+            "SELECT id, template FROM templates WHERE gstin = ? AND retired = 0 ORDER BY hits DESC", (gstin,))
+        return [(template_id, json.loads(template)) for template_id, template in rows]
+
+    def _count(self, template_id, column):
+        self.conn.execute(f"UPDATE templates SET {column} = {column} + 1 WHERE id = ?", (template_id,))
+        self.conn.commit()
+
+    def _hit(self, template_id):
+        hits = self._hits[template_id] = self._hits.get(template_id, 0) + 1
+        # Counters are shared between processes; every tenth hit is enough for the listing
+        if hits % 10 == 0:
+            self.conn.execute("UPDATE templates SET hits = hits + 10 WHERE id = ?", (template_id,))
+            self.conn.commit()
+        return self.verify_every and hits % self.verify_every == 0
+
+    # Function to extract an open document with the template of its supplier layout.
+    # Returns a TemplateMatch, or None when no template fits and the generic path must run.
+    # Scanned pages rendered at the generic path's resolution are left in page_images, and
+    # a text-layer first page whose layout has no template is described in unknown_layout
+    # for learn.
+    def extract(self, doc, trace=NULL_TRACE, ocr_engine=DEFAULT_ENGINE, ocr_workers=1, cache=None,
+                preprocess=None, page_images=None, unknown_layout=None):
+        with trace.span("text", 0):
+            first_text = doc.page_text(0) if len(doc) else ""
+        if page_needs_ocr(first_text):
+            return self._extract_scan(doc, trace, ocr_engine, ocr_workers, cache, preprocess, page_images)
+
+        gstin = search_field(first_text, 'GSTIN NO')
+        if not gstin:
+            return None
+        templates = self.templates_for(gstin)
+        words = doc.page_words(0)
+        labels = layout_of(words)
+        for template_id, template in templates:
+            if layout_matches(template["labels"], labels):
+                break
+        else:
+            if unknown_layout is not None and labels:
+                unknown_layout.update(gstin=gstin, labels=labels, words=words)
+            return None
+
+        with trace.span("parse"):
+            match = self._extract_text(doc, template, first_text, words)
+        if match is None:
+            self._count(template_id, "misses")
+            return None
+        match.template_id = template_id
+        match.verify = self._hit(template_id)
+        return match
+
+    # Text-layer document: word fields from their positions, regex fields from their labels
+    def _extract_text(self, doc, template, first_text, first_words):
+        page_texts = [first_text]
+        page_words = {0: first_words}
+        has_line_items = template["line_items"]
+        table_ended = LINE_ITEMS_END in first_text
+        page_number = 1
+        # Read to the template's last page, and on while the line-item table hasn't ended
+        while page_number < len(doc) and (page_number <= template["last_page"] or has_line_items and not table_ended):
+            page_texts.append(doc.page_text(page_number))
+            if page_needs_ocr(page_texts[-1]):
+                return None
+            table_ended = table_ended or LINE_ITEMS_END in page_texts[-1]
+            page_number += 1
+        text = "".join(page_texts)
+
+        values = {}
+        for field, box in template["word_fields"].items():
+            page = box["page"]
+            if page >= len(page_texts):
+                return None
+            if page not in page_words:
+                page_words[page] = doc.page_words(page)
+            value = self._read_word_field(page_words[page], field, box)
+            if not value:
+                return None
+            values[field] = value
+
+        for field in template["regex_fields"]:
+            values[field] = search_field(text, field)
+            if values[field] in ("", "N/A"):
+                return None
+        if template["gstin"]:
+            values['GSTIN'] = find_last_gstin(text)
+
+        details = assemble_details(text, values, has_line_items)
+        if has_line_items and not details.get('Amount'):
+            return None
+        return TemplateMatch(None, details, text, len(page_texts), 0, len(doc) - len(page_texts))
+
+    @staticmethod
+    def _read_word_field(words, field, box):
+        label_index = find_label(words, box["label"])
+        if label_index is None:
+            return None
+        x = words[label_index][0] + box["dx"]
+        y = words[label_index][1] + box["dy"]
+        nearest = min(words[label_index:label_index + VALUE_SEARCH_WORDS],
+                      key=lambda word: abs(word[0] - x) + abs(word[1] - y))
+        if abs(nearest[0] - x) > VALUE_TOLERANCE_X or abs(nearest[1] - y) > VALUE_TOLERANCE_Y:
+            return None
+        match = WORD_FIELDS[field].match(nearest[4], box["offset"])
+        return match.group() if match else None
+
+    # Scanned document: OCR the top of the first page to find the supplier, then only the
+    # regions of that supplier's template, and search its fields in what comes back.
+    # Without any template there is no supplier to find, so nothing is OCR-ed. Each page
+    # is rendered once; with --ocr-preprocess that is the generic path's resolution too,
+    # and the renders go on to it in page_images.
+    def _extract_scan(self, doc, trace, ocr_engine, ocr_workers, cache, preprocess, page_images=None):
+        if not self.has_templates():
+            return None
+        from ocr_preprocess import OcrPreprocessor
+        base = preprocess or OcrPreprocessor()
+        images = {}
+        try:
+            return self._match_scan(doc, trace, ocr_engine, ocr_workers, cache, base, images)
+        finally:
+            if page_images is not None and base.render_dpi == render_resolution(preprocess):
+                page_images.update(images)
+
+    def _match_scan(self, doc, trace, ocr_engine, ocr_workers, cache, base, images):
+        from ocr_preprocess import OcrPreprocessor
+
+        def ocr_regions(page_number, boxes):
+            cropper = OcrPreprocessor(dpi=base.dpi, threshold=base.threshold, deskew=base.deskew,
+                                      max_skew=base.max_skew, roi=boxes)
+            if page_number not in images:
+                with trace.span("render", page_number):
+                    images[page_number] = doc.render(page_number, cropper.render_dpi)
+            image = images[page_number]
+            pool = get_ocr_pool(ocr_engine, max(1, ocr_workers))
+
+            def traced_ocr(engine):
+                with trace.span("ocr", page_number):
+                    return ocr_page_image(image, cache, engine, cropper)
+            return pool.submit(traced_ocr).result()
+
+        probe = ocr_regions(0, [PROBE_BOX])
+        gstin = search_field(probe, 'GSTIN NO')
+        templates = self.templates_for(gstin) if gstin else []
+        if not templates:
+            return None
+        # No word positions on a scan: the supplier's most used layout is taken
+        template_id, template = templates[0]
+
+        pages = min(len(doc), template["last_page"] + 1)
+        text = "".join(ocr_regions(page_number, template["regions"][str(page_number)])
+                       for page_number in range(pages) if str(page_number) in template["regions"])
+        values = {}
+        with trace.span("parse"):
+            for field in list(template["word_fields"]) + template["regex_fields"]:
+                values[field] = search_field(text, field)
+                if values[field] in ("", "N/A"):
+                    self._count(template_id, "misses")
+                    return None
+            if template["gstin"]:
+                values['GSTIN'] = find_last_gstin(text)
+            details = assemble_details(text, values, template["line_items"])
+        if template["line_items"] and not details.get('Amount'):
+            self._count(template_id, "misses")
+            return None
+        return TemplateMatch(template_id, details, text, pages, pages, len(doc) - pages,
+                             verify=self._hit(template_id))
+
+    # Function to learn the template of a document the generic path has read, from the
+    # layout extract found no template for. Only text-layer documents are learned from,
+    # since the template needs word positions.
+    def learn(self, doc, pdf_path, details, unknown_layout, backend=DEFAULT_BACKEND):
+        gstin = details.get('GSTIN NO')
+        if not self.learn_new or not unknown_layout or gstin != unknown_layout["gstin"]:
+            return None
+        labels = unknown_layout["labels"]
+        key = layout_key(labels)
+
+        page_texts = []
+        for page_number in range(len(doc)):
+            page_texts.append(doc.page_text(page_number))
+            if page_needs_ocr(page_texts[-1]):
+                return None
+        pages_words = [unknown_layout["words"]] + [doc.page_words(page_number) for page_number in range(1, len(doc))]
+
+        present = [field for field, spec in SPECS.items() if details.get(field, spec[4]) != spec[4]]
+        word_fields = {}
+        last_page = 0
+        for field in present:
+            page, box = self._learn_word_field(pages_words, page_texts, field, details[field])
+            if box is not None and self._read_word_field(pages_words[page], field, box) == details[field]:
+                word_fields[field] = box
+            last_page = max(last_page, self._page_of(page_texts, field, details[field]))
+        has_line_items = bool(details.get('Amount'))
+        if has_line_items:
+            last_page = max(last_page, next((number for number, text in enumerate(page_texts)
+                                             if LINE_ITEMS_END in text), len(page_texts) - 1))
+
+        template = {
+            "labels": labels,
+            "word_fields": word_fields,
+            "regex_fields": [field for field in present if field not in word_fields],
+            "gstin": bool(details.get('GSTIN')),
+            "line_items": has_line_items,
+            "last_page": last_page,
+            "regions": self._learn_regions(pages_words[:last_page + 1], details, present),
+            "backend": backend,
+        }
+        # A retired template of the same layout makes way for the new one
+        self.conn.execute("DELETE FROM templates WHERE gstin = ? AND layout = ? AND retired = 1", (gstin, key))
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO templates (gstin, layout, template, source_path, created_at) VALUES (?, ?, ?, ?, ?)",
+            (gstin, key, json.dumps(template), pdf_path, time.time()))
+        self.conn.commit()
+        if cursor.rowcount:
+            print(f"Learned the layout of {details.get('Company Name') or gstin} from {pdf_path}")
+        return template
+
+    @staticmethod
+    def _page_of(page_texts, field, value):
+        for page_number, text in enumerate(page_texts):
+            if any(label in text for label in SPECS[field][1]) and value.split("\n")[0] in text:
+                return page_number
+        return 0
+
+    # Where the value of a single-word field sits relative to its label
+    @staticmethod
+    def _learn_word_field(pages_words, page_texts, field, value):
+        if field not in WORD_FIELDS:
+            return None, None
+        label = SPECS[field][1][0]
+        for page_number, words in enumerate(pages_words):
+            label_index = find_label(words, label)
+            if label_index is None:
+                continue
+            label_x, label_y = words[label_index][0], words[label_index][1]
+            for x0, top, _, _, text in words[label_index:label_index + VALUE_SEARCH_WORDS]:
+                offset = text.find(value)
+                if offset != -1:
+                    return page_number, {"page": page_number, "label": label, "dx": round(x0 - label_x, 4),
+                                         "dy": round(top - label_y, 4), "offset": offset}
+            return page_number, None
+        return None, None
+
+    # OCR regions of each page: bands of the lines that hold a label, a value or a line item
+    @staticmethod
+    def _learn_regions(pages_words, details, present):
+        labels = [label for field in present for label in SPECS[field][1]] + [LINE_ITEMS_END]
+        values = [part for field in present for part in str(details[field]).splitlines() if part.strip()]
+        regions = {}
+        for page_number, words in enumerate(pages_words):
+            lines = [line for line in word_lines(words)
+                     if any(part in line[4] for part in labels + values) or GOODS_PATTERN.search(line[4])]
+            bands = []
+            for top, bottom, x0, x1, _ in lines:
+                if bands and top - bands[-1][3] <= REGION_GAP:
+                    left, band_top, right, band_bottom = bands[-1]
+                    bands[-1] = [min(left, x0), band_top, max(right, x1), max(band_bottom, bottom)]
+                else:
+                    bands.append([x0, top, x1, bottom])
+            if not bands:
+                continue
+            bands[-1][3] += REGION_GROWTH
+            regions[str(page_number)] = [
+                [round(max(0.0, left - REGION_MARGIN), 4), round(max(0.0, top - REGION_MARGIN), 4),
+                 round(min(1.0, right + REGION_MARGIN), 4), round(min(1.0, bottom + REGION_MARGIN), 4)]
+                for left, top, right, bottom in bands]
+        return regions
+
+    # Function to compare a verified template result with the generic one; a template that
+    # disagrees is retired, and the layout is learned again from the next bill
+    def confirm(self, match, details):
+        if match.details == details:
+            return True
+        self.conn.execute("UPDATE templates SET retired = 1 WHERE id = ?", (match.template_id,))
+        self.conn.commit()
+        print(f"Template {match.template_id} disagreed with the generic extraction; retired it")
+        return False
+
+    def list(self):
+        return self.conn.execute(
+            "SELECT id, gstin, json_extract(template, '$.last_page'), hits, misses, retired, source_path "
+            "FROM templates ORDER BY gstin, id").fetchall()
+
+    def forget(self, gstin):
+        cursor = self.conn.execute("DELETE FROM templates WHERE gstin = ?", (gstin,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_registries = {}
+
+# Function to get one registry per database and process (workers reuse it across files)
+def get_registry(path=DEFAULT_TEMPLATES_DB, learn=True):
+    key = (os.path.abspath(path), learn)
+    if key not in _registries:
+        _registries[key] = TemplateRegistry(path, learn=learn)
+    return _registries[key]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List or forget the vendor templates learned by Extraction.py.")
+    parser.add_argument("command", choices=("list", "forget"))
+    parser.add_argument("gstin", nargs="?", help="Supplier GSTIN whose templates to forget.")
+    parser.add_argument("--db", default=DEFAULT_TEMPLATES_DB)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"No templates at {args.db}")
+        return 1
+
+    with TemplateRegistry(args.db) as registry:
+        if args.command == "forget":
+            if not args.gstin:
+                print("forget needs a GSTIN")
+                return 2
+            print(f"Forgot {registry.forget(args.gstin)} template(s) of {args.gstin}")
+            return 0
+        rows = registry.list()
+        for template_id, gstin, last_page, hits, misses, retired, source_path in rows:
+            print(f"{template_id:>4} {gstin:<16} pages {last_page + 1:<3} hits {hits:<6} misses {misses:<4}"
+                  f"{' retired' if retired else ''}  {source_path}")
+        print(f"{len(rows)} template(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,7 @@
+# The modules are flat at the top of the repo; the synthetic bills come from benchmarks/
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
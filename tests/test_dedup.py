@@ -0,0 +1,63 @@
+# Duplicate detection: exact hits on the invoice key, near hits on the MinHash of the text.
+import random
+
+import dedup
+from generate_invoices import invoice_lines
+from Extraction import extract_details
+from dedup import Deduplicator, minhash_signature, signature_to_hex, similarity
+
+
+def bill_text(invoice_no):
+    return "\n".join(invoice_lines(random.Random(invoice_no), invoice_no, 5, 1)) + "\n"
+
+
+def check(deduplicator, pdf_path, text):
+    return deduplicator.check(pdf_path, extract_details(text), signature_to_hex(minhash_signature(text)))
+
+
+def test_exact_duplicate_is_the_same_invoice_key(tmp_path):
+    with Deduplicator(str(tmp_path / "dedup.db")) as deduplicator:
+        text = bill_text(101)
+        assert check(deduplicator, "a.pdf", text) is None
+        duplicate = check(deduplicator, "copy.pdf", text)
+
+    assert (duplicate.kind, duplicate.duplicate_of) == ("exact", "a.pdf")
+
+
+def test_rescan_with_ocr_noise_is_a_near_duplicate(tmp_path):
+    text = bill_text(101)
+    # A re-scan that read the date wrong: another invoice key, nearly the same text
+    details = extract_details(text)
+    rescan = text.replace(details['Date of Invoice'], "30-12-2023").replace("RATE", "RA TE")
+
+    with Deduplicator(str(tmp_path / "dedup.db")) as deduplicator:
+        assert check(deduplicator, "a.pdf", text) is None
+        duplicate = check(deduplicator, "rescan.pdf", rescan)
+
+    assert (duplicate.kind, duplicate.duplicate_of) == ("near", "a.pdf")
+    assert duplicate.similarity >= dedup.DEFAULT_THRESHOLD
+
+
+def test_other_invoices_and_the_same_file_again_are_not_duplicates(tmp_path):
+    with Deduplicator(str(tmp_path / "dedup.db")) as deduplicator:
+        assert check(deduplicator, "a.pdf", bill_text(101)) is None
+        assert check(deduplicator, "b.pdf", bill_text(102)) is None
+        assert check(deduplicator, "c.pdf", bill_text(103)) is None
+        assert check(deduplicator, "a.pdf", bill_text(101)) is None
+        assert deduplicator.flagged == []
+
+
+def test_forgotten_file_is_checked_as_new(tmp_path):
+    with Deduplicator(str(tmp_path / "dedup.db")) as deduplicator:
+        text = bill_text(101)
+        check(deduplicator, "a.pdf", text)
+        deduplicator.forget("a.pdf")
+        assert check(deduplicator, "copy.pdf", text) is None
+
+
+def test_signature_in_chunks_is_the_whole_signature(monkeypatch):
+    text = "".join(bill_text(number) for number in range(101, 111))
+    signature = minhash_signature(text)
+    monkeypatch.setattr(dedup, "SHINGLE_CHUNK", 1 << 30)
+    assert (minhash_signature(text) == signature).all()
+    assert similarity(signature, minhash_signature(bill_text(101))) < 0.5
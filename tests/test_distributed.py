@@ -0,0 +1,85 @@
+# Distributed runs against a temporary directory queue and a temporary SQLite queue:
+# two batches submitted, worked off by three worker processes, one merged by --batch.
+import csv
+import random
+import multiprocessing
+
+import pytest
+
+from generate_invoices import write_invoice_pdf, invoice_lines
+from distributed import main, open_queue, work_loop
+
+LINE_ITEMS = 3
+
+
+def write_batch(directory, first_invoice_no, count):
+    directory.mkdir()
+    rng = random.Random(first_invoice_no)
+    for invoice_no in range(first_invoice_no, first_invoice_no + count):
+        write_invoice_pdf(str(directory / f"{invoice_no}.pdf"), invoice_lines(rng, invoice_no, LINE_ITEMS, 1), 1)
+    return {str(invoice_no) for invoice_no in range(first_invoice_no, first_invoice_no + count)}
+
+
+def run_workers(queue_path, count):
+    processes = [multiprocessing.Process(target=work_loop, args=(queue_path, index, {"ocr_workers": 1},
+                                                                 60, 3, 0.1, False))
+                 for index in range(count)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=300)
+    assert [process.exitcode for process in processes] == [0] * count
+
+
+@pytest.mark.parametrize("queue_name", ["queue", "queue.db"])
+def test_workers_and_merge_by_batch(tmp_path, queue_name, capsys):
+    queue_path = str(tmp_path / queue_name)
+    first = write_batch(tmp_path / "first", 100, 5)
+    second = write_batch(tmp_path / "second", 200, 4)
+    assert main(["submit", queue_path, str(tmp_path / "first"), "--batch", "first"]) == 0
+    assert main(["submit", queue_path, str(tmp_path / "second")]) == 0
+    assert "as batch " in capsys.readouterr().out
+
+    run_workers(queue_path, 3)
+
+    with open_queue(queue_path) as queue:
+        assert queue.counts() == {"queued": 0, "running": 0, "done": 9, "failed": 0}
+        assert queue.counts("first") == {"queued": 0, "running": 0, "done": 5, "failed": 0}
+        assert queue.counts("no such batch") == {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        # Every job was claimed exactly once
+        assert [job["attempts"] for job in queue.finished()] == [1] * 9
+
+    output = str(tmp_path / "first.csv")
+    assert main(["merge", queue_path, "--batch", "first", "-o", output]) == 0
+    with open(output, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 5 * LINE_ITEMS
+    assert {row["Invoice No"] for row in rows} == first
+    # Merged in the order the files were submitted
+    assert [row["Invoice No"] for row in rows[::LINE_ITEMS]] == sorted(first)
+
+    output = str(tmp_path / "all.csv")
+    assert main(["merge", queue_path, "-o", output]) == 0
+    with open(output, newline="", encoding="utf-8") as f:
+        assert {row["Invoice No"] for row in csv.DictReader(f)} == first | second
+
+    assert main(["merge", queue_path, "--batch", "no such batch", "-o", output]) == 1
+
+
+def test_directory_queue_submits_to_one_batch_and_claims_each_job_once(tmp_path):
+    queue_path = str(tmp_path / "queue")
+    # Two submitters that each opened the queue before the other wrote its batch
+    first, second = open_queue(queue_path), open_queue(queue_path)
+    ids = first.enqueue_many([f"/inbox/{number}.pdf" for number in range(5)], batch_id="day")
+    ids += second.enqueue_many([f"/inbox/{number}.pdf" for number in range(5, 8)], batch_id="day")
+    assert first.counts("day")["queued"] == 8
+
+    # Workers claiming from their own listings never get the same job twice
+    workers = [open_queue(queue_path) for _ in range(3)]
+    claimed = []
+    while True:
+        jobs = [queue.claim(f"worker-{index}") for index, queue in enumerate(workers)]
+        if not any(jobs):
+            break
+        claimed += [job["id"] for job in jobs if job]
+    assert sorted(claimed) == sorted(ids)
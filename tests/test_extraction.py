@@ -0,0 +1,57 @@
+# Reading only the pages a bill needs (--stop-early): when the tracker stops, and that
+# extract_details then finds what a full read does.
+import random
+
+from generate_invoices import invoice_lines, write_invoice_pdf
+from Extraction import PageFieldTracker, extract_details, extract_hybrid_text
+from instrumentation import DocumentTrace
+
+ANNEXURE = "Annexure: transport\nTransporter GSTIN : 29ABCDE1234F1Z9\n"
+
+
+def bill_page(invoice_no=42):
+    return "\n".join(invoice_lines(random.Random(invoice_no), invoice_no, 2, 1)) + "\n"
+
+
+def test_stops_once_fields_and_line_items_are_read():
+    tracker = PageFieldTracker()
+    assert tracker.feed(bill_page())
+    assert tracker.complete()
+
+
+def test_waits_for_the_gstins():
+    lines = bill_page().splitlines(keepends=True)
+    tracker = PageFieldTracker()
+    assert not tracker.feed("".join(line for line in lines if "GSTIN" not in line))
+    assert tracker.need_gstin
+    assert tracker.feed("".join(line for line in lines if "GSTIN" in line))
+
+
+def long_bill(path, annexure=False):
+    lines = invoice_lines(random.Random(42), 42, 2, 3)
+    if annexure:
+        lines += ANNEXURE.splitlines()
+    write_invoice_pdf(str(path), lines, 3)
+    return str(path)
+
+
+def test_stopping_early_skips_the_terms_pages(tmp_path):
+    pdf_path = long_bill(tmp_path / "bill.pdf")
+    trace = DocumentTrace(pdf_path)
+    text, pages, _ = extract_hybrid_text(pdf_path, stop_early=True, trace=trace)
+    full_text, _, _ = extract_hybrid_text(pdf_path)
+
+    assert (pages, trace.skipped_pages) == (1, 2)
+    assert extract_details(text) == extract_details(full_text)
+
+
+def test_gstin_on_a_later_page_is_still_the_last_one(tmp_path):
+    pdf_path = long_bill(tmp_path / "bill.pdf", annexure=True)
+    trace = DocumentTrace(pdf_path)
+    text, pages, _ = extract_hybrid_text(pdf_path, stop_early=True, trace=trace)
+    full_text, _, _ = extract_hybrid_text(pdf_path)
+
+    # The first page and the annexure's page are read, the terms page between them isn't
+    assert (pages, trace.skipped_pages) == (2, 1)
+    assert extract_details(text)['GSTIN'] == "29ABCDE1234F1Z9"
+    assert extract_details(text) == extract_details(full_text)
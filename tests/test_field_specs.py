@@ -0,0 +1,89 @@
+# The field-spec table must read exactly what the old extract_details read: one
+# re.search over the whole text per field, the GSTIN the last one in the text.
+import re
+import random
+
+import pytest
+
+from generate_invoices import invoice_lines
+from Extraction import extract_details
+
+
+# extract_details as it was before FIELD_SPECS, patterns unchanged
+def reference_details(text):
+    def first(pattern, flags=0):
+        match = re.search(pattern, text, flags)
+        return match.group(1) if match else ""
+
+    details = {}
+    gstins = re.findall(r"\b[0-9]{2}[A-Z]{5}[0-9]{4}[A-Z]{1}[A-Z0-9]{1}[Z]{1}[A-Z0-9]{1}\b", text)
+    details['GSTIN'] = gstins[-1] if gstins else ""
+    details['GSTIN NO'] = first(r'GSTIN\s*NO\s*[:\-]?\s*([\w\d]+)')
+    details['Company Name'] = first(
+        r'^(?:BILL OF SUPPLY|TAX INVOICE)\s*[\r\n]?(M/s\s+[A-Z][A-Z0-9 &,-\.]+|[A-Z][A-Z0-9 &,-\.]+)',
+        re.MULTILINE).strip() or "N/A"
+    details['Invoice No'] = first(r'Invoice No\.\s*[:\-]?\s*(\d+)')
+    details['Date of Invoice'] = first(r'Date of Invoice\s*[:\-]?\s*([\d\-]+)')
+    details['Shipped to'] = first(r'Shipped to\s*[:\-]?\s*([\s\S]+?)\s*FSSAI').strip()
+
+    goods = re.findall(r'\d+\.\s+(.*?)\s+(\d{8})\s+([\d\.]+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+([\d,]+)', text)
+    if goods:
+        columns = ['Goods Description', 'HSN/SAC', 'Bags', 'Pack', 'Quintal', 'Rate', 'Amount']
+        for column in columns:
+            details[column] = []
+        for description, hsn, bags, pack, quintal, rate in goods:
+            quintal, rate = quintal.replace(",", ""), rate.replace(",", "")
+            row = [description, hsn, bags, pack, quintal, rate, round(float(quintal) * float(rate), 2)]
+            for column, value in zip(columns, row):
+                details[column].append(value)
+
+    fssai = re.search(r'FSSAI\s*NO\.?\s*[-]?\s*([\d]+)|FSSAI\s*[-]?\s*([\d]+)', text)
+    details['FSSAI'] = (fssai.group(1) or fssai.group(2)) if fssai else ""
+    details['Transport'] = first(r'Transport\s*[:\-]?\s*([\s\S]+?)\s+Despatch Date').strip()
+    details['Vehicle No'] = first(r'Vehicle No\.\s*[:\-]?\s*([\w\d]+)')
+    details['Licence No'] = first(r'Licence No\s*[:\-]?\s*([\w\d]+)')
+    details['Mobile No'] = first(r'Mobile No\s*[:\-]?\s*([\d]+)')
+    details['PAN NO'] = first(r'PAN NO\s*[:\-]?\s*([\w\d]+)')
+    details['TAN NO'] = first(r'TAN NO\s*[:\-]?\s*([\w\d\-]+)')
+    details['STD'] = first(r'STD\s*[:\-]?\s*([\d\-]+)')
+    details['Place of Supply'] = first(
+        r'Place of Supply\s*[:\-]?\s*([\w\s\(\)\d]+)(?=\s+Date of Invoice)').strip()
+    return details
+
+
+def bill_text(seed, line_items=5, pages=1):
+    return "\n".join(invoice_lines(random.Random(seed), 1000 + seed, line_items, pages)) + "\n"
+
+
+def assert_same(text):
+    details = extract_details(text)
+    assert details == reference_details(text)
+    # Same keys in the same order, so the output columns come out the same
+    assert list(details) == list(reference_details(text))
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_generated_bills(seed):
+    assert_same(bill_text(seed, line_items=1 + seed % 12, pages=1 + seed % 3))
+
+
+def test_values_past_the_search_window():
+    text = bill_text(3)
+    # A label with nothing after it at first: the value is far past the label's window
+    far = text.replace("Invoice No.", "Invoice No." + " " * 150, 1)
+    far = far.replace("Mobile No", "Mobile No :" + "\n" * 120, 1)
+    assert_same(far)
+    # The first occurrence of a label has no value; a later one does
+    assert_same("Invoice No. pending\n" + text)
+    assert_same("FSSAI - 12345678901234\n" + text.replace("FSSAI", "FSSAI NO.", 1))
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "TAX INVOICE\n",
+    "GSTIN NO : 27AAEPW8766H1ZY\nGSTIN 27AAEPW8766H1ZY 29ABCDE1234F1Z9\n",
+    "Place of Supply : Maharashtra (27)\nDate of Invoice : 14-07-2023\nSTD 07174-220370",
+    "Transport : SAIKRUPA LORRY\nARRENGERS Despatch Date 15-07-2023\nVehicle No. MH04GR1659",
+])
+def test_partial_and_empty_texts(text):
+    assert_same(text)
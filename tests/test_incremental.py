@@ -0,0 +1,39 @@
+# Incremental runs: a file changed after its rows were written is extracted again, and
+# its old rows leave the output.
+import os
+import csv
+import random
+
+from generate_invoices import invoice_lines, write_invoice_pdf
+from Extraction import main
+
+
+def write_bill(path, invoice_no):
+    write_invoice_pdf(str(path), invoice_lines(random.Random(invoice_no), invoice_no, 2, 1), 1)
+
+
+def invoice_numbers(output):
+    with open(output, newline="", encoding="utf-8") as f:
+        return sorted(row['Invoice No'] for row in csv.DictReader(f))
+
+
+def test_changed_file_replaces_its_rows(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    for number in (101, 102, 103):
+        write_bill(inbox / f"{number}.pdf", number)
+    output = str(tmp_path / "out.csv")
+    argv = [str(inbox), "--output", output, "--format", "csv", "--incremental", "--no-journal"]
+
+    assert main(argv) == 0
+    assert invoice_numbers(output) == ["101", "101", "102", "102", "103", "103"]
+
+    write_bill(inbox / "102.pdf", 202)
+    stat = os.stat(inbox / "102.pdf")
+    os.utime(inbox / "102.pdf", ns=(stat.st_atime_ns, stat.st_mtime_ns - 10 ** 9))
+    assert main(argv) == 0
+    assert invoice_numbers(output) == ["101", "101", "103", "103", "202", "202"]
+
+    # Nothing new: the output is left as it is
+    assert main(argv) == 0
+    assert invoice_numbers(output) == ["101", "101", "103", "103", "202", "202"]
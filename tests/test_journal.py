@@ -0,0 +1,87 @@
+# Result journal: a torn last line from a crash is dropped, and a resumed run extracts
+# only what the journal doesn't have before rebuilding the output from it.
+import csv
+import json
+import random
+from collections import Counter
+
+from generate_invoices import invoice_lines, write_invoice_pdf
+from Extraction import main
+from journal import Journal, read_records, consolidate, DONE, FAILED
+
+
+def write_bill(path, invoice_no):
+    write_invoice_pdf(str(path), invoice_lines(random.Random(invoice_no), invoice_no, 2, 1), 1)
+
+
+def invoice_numbers(output):
+    with open(output, newline="", encoding="utf-8") as f:
+        return sorted({row['Invoice No'] for row in csv.DictReader(f)})
+
+
+def test_torn_last_line_is_skipped_and_cut_off(tmp_path):
+    path = str(tmp_path / "out.journal.jsonl")
+    with Journal(path) as journal:
+        journal.append("a.pdf", DONE, {'Invoice No': "1"})
+        journal.append("b.pdf", DONE, {'Invoice No': "2"})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "/c.pdf", "status": "do')
+
+    assert [record["pdf_path"] for record in read_records(path)] == ["a.pdf", "b.pdf"]
+    with Journal(path, resume=True) as journal:
+        assert journal.pending(["a.pdf", "b.pdf", "c.pdf"]) == ["c.pdf"]
+        journal.append("c.pdf", DONE, {'Invoice No': "3"})
+
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert [json.loads(line)["pdf_path"] for line in lines] == ["a.pdf", "b.pdf", "c.pdf"]
+
+
+def test_consolidate_keeps_the_last_record_of_each_file(tmp_path):
+    path = str(tmp_path / "out.journal.jsonl")
+    bill = {'Invoice No': "1", 'Goods Description': ["RICE"], 'HSN/SAC': ["10063090"], 'Bags': ["1"],
+            'Pack': ["0.5"], 'Quintal': ["1.0"], 'Rate': ["10"], 'Amount': [10.0]}
+    with Journal(path) as journal:
+        journal.append("a.pdf", FAILED, error="boom")
+        journal.append("b.pdf", DONE, {**bill, 'Invoice No': "2"})
+        journal.append("a.pdf", DONE, bill)
+
+    output = str(tmp_path / "out.csv")
+    assert consolidate(path, output, "csv") == (2, 2)
+    assert invoice_numbers(output) == ["1", "2"]
+
+
+def test_resumed_run_extracts_only_what_is_missing(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    for number in (101, 102, 103, 104):
+        write_bill(inbox / f"{number}.pdf", number)
+    (inbox / "broken.pdf").write_bytes(b"not a pdf")
+    output = str(tmp_path / "out.csv")
+    journal_path = output + ".journal.jsonl"
+    argv = [str(inbox), "--output", output, "--format", "csv"]
+
+    main(argv)
+    assert invoice_numbers(output) == ["101", "102", "103", "104"]
+
+    # Killed after two files, halfway through writing the third record
+    with open(journal_path, encoding="utf-8") as f:
+        lines = f.readlines()
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.writelines(lines[:2])
+        f.write(lines[2][:len(lines[2]) // 2])
+    kept = [json.loads(line)["key"] for line in lines[:2]]
+
+    main(argv + ["--resume"])
+    records = list(read_records(journal_path))
+    counts = Counter(record["key"] for record in records)
+    # The first two weren't extracted again; everything else was, exactly once
+    assert all(counts[key] == 1 for key in kept)
+    assert len(counts) == 5 and set(counts.values()) == {1}
+    assert invoice_numbers(output) == ["101", "102", "103", "104"]
+
+    # Failures stay failed unless asked to retry them
+    main(argv + ["--resume"])
+    assert len(list(read_records(journal_path))) == 5
+    main(argv + ["--resume", "--retry-failed"])
+    assert Counter(record["status"] for record in read_records(journal_path))[FAILED] == 2
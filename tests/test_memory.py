@@ -0,0 +1,36 @@
+# Peak memory per document: the kernel's high-water mark is process-wide, so it is only
+# reset and used for a document that had the process to itself.
+import memory
+from memory import MemoryMonitor
+
+
+def test_document_alone_uses_the_kernel_peak(monkeypatch):
+    resets = []
+    monkeypatch.setattr(memory, "reset_peak", lambda: resets.append(1) or True)
+    monitor = MemoryMonitor()
+    monitor.check(0)
+    assert not monitor.sampled
+    monitor.close()
+    assert len(resets) == 1
+
+
+def test_overlapping_documents_are_sampled_and_leave_the_mark_alone(monkeypatch):
+    resets = []
+    monkeypatch.setattr(memory, "reset_peak", lambda: resets.append(1) or True)
+    first = MemoryMonitor()
+    second = MemoryMonitor()
+    first.check(0)
+    second.check(0)
+
+    # The first reset the mark, the second didn't, and the second starting spoiled the first
+    assert len(resets) == 1
+    assert first.sampled and second.sampled
+    assert first.peak_mb() and second.peak_mb()
+    first.close()
+    second.close()
+    first.close()
+
+    # Both done: the next document is alone again
+    third = MemoryMonitor()
+    assert not third.sampled
+    third.close()
@@ -0,0 +1,44 @@
+# OCR engine lookup: a requested name is resolved once per process, and a missing engine
+# only fails the pages that need one.
+import pytest
+
+import ocr_engines
+from ocr_engines import get_ocr_pool
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    monkeypatch.setattr(ocr_engines, "_pools", {})
+    monkeypatch.setattr(ocr_engines, "_resolved", {})
+    lookups = []
+
+    def resolve_engine(name):
+        lookups.append(name)
+        if not installed:
+            raise RuntimeError("No OCR engine installed (install tesserocr or pytesseract)")
+        return "pytesseract"
+    installed = []
+    monkeypatch.setattr(ocr_engines, "resolve_engine", resolve_engine)
+    return lookups, installed
+
+
+def test_name_is_resolved_once_per_pool(engines):
+    lookups, installed = engines
+    installed.append(True)
+    pool = get_ocr_pool("auto", 1)
+    created = len(lookups)
+    pools = {get_ocr_pool("auto", 1) for _ in range(5)}
+
+    assert pools == {pool}
+    assert len(lookups) == created
+    pool.close()
+
+
+def test_missing_engine_is_looked_for_again(engines):
+    lookups, installed = engines
+    with pytest.raises(RuntimeError):
+        get_ocr_pool("auto", 1)
+    installed.append(True)
+    get_ocr_pool("auto", 1).close()
+
+    assert lookups[:2] == ["auto", "auto"]
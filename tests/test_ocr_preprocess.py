@@ -0,0 +1,50 @@
+# OCR preprocessing: boxes are cut from the page as rendered, before deskewing turns
+# and grows it, and a bad --ocr-roi is a usage error.
+import argparse
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from ocr_preprocess import OcrPreprocessor, roi_argument, REGION_PADDING_INCHES
+
+DPI = 100
+
+
+# A white page with a black bar of text-like stripes across the band top..bottom (fractions)
+def page_with_band(top, bottom, skew=0.0):
+    page = np.full((1100, 850), 255, dtype=np.uint8)
+    for y in range(int(top * 1100), int(bottom * 1100), 12):
+        page[y:y + 6, 100:750] = 0
+    image = Image.fromarray(page)
+    return image.rotate(skew, fillcolor=255) if skew else image
+
+
+def test_box_is_cut_from_the_page_as_rendered():
+    preprocess = OcrPreprocessor(dpi=DPI, deskew=False, roi=[(0.0, 0.0, 1.0, 0.5)])
+    result = np.asarray(preprocess(page_with_band(0.1, 0.3)))
+    padding = round(REGION_PADDING_INCHES * DPI)
+
+    assert result.shape == (550 + 2 * padding, 850 + 2 * padding)
+    assert (result == 0).any()
+
+
+def test_box_on_a_skewed_page_keeps_what_it_covered():
+    # The ink is all in the top half; the bottom half box must stay blank after deskewing
+    page = page_with_band(0.1, 0.3, skew=3.0)
+    top = np.asarray(OcrPreprocessor(dpi=DPI, roi=[(0.0, 0.0, 1.0, 0.5)])(page))
+    bottom = np.asarray(OcrPreprocessor(dpi=DPI, roi=[(0.0, 0.5, 1.0, 1.0)])(page))
+
+    assert (top == 0).mean() > 0.05
+    assert not (bottom == 0).any()
+
+
+@pytest.mark.parametrize("value", ["0,0,2,1", "0.5,0,0.2,1", "a", "0,0,1"])
+def test_bad_roi_is_a_usage_error(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        roi_argument(value)
+
+
+def test_good_roi_is_passed_on_as_given():
+    assert roi_argument("0,0,1,0.55;0,0.6,1,1") == "0,0,1,0.55;0,0.6,1,1"
+    assert roi_argument("auto") == "auto"
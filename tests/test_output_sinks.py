@@ -0,0 +1,104 @@
+# Every output format holds the same rows: the invoices' line items with the header
+# fields repeated, "-" for junk in DASH_COLUMNS, in the order the invoices were written.
+import json
+import random
+
+import pandas as pd
+import pytest
+
+from generate_invoices import invoice_lines
+from Extraction import extract_details
+from output_sinks import open_sink, details_to_rows, OUTPUT_COLUMNS, SINK_FORMATS
+
+NUMERIC_COLUMNS = ['Quintal', 'Rate', 'Amount']
+
+
+def all_details():
+    details = [extract_details("\n".join(invoice_lines(random.Random(seed), 500 + seed, 1 + seed % 4, 1)))
+               for seed in range(6)]
+    # Junk and missing values for the "-" columns, and an invoice without line items
+    details[1]['Transport'] = "Advance"
+    details[2]['Mobile No'] = ""
+    details[3].pop('Vehicle No', None)
+    details.insert(4, {'Company Name': "N/A", 'Invoice No': "77"})
+    return details
+
+
+def write(path, fmt, details, append=False):
+    with open_sink(str(path), fmt, append=append) as sink:
+        for invoice in details:
+            sink.write_details(invoice, "x.pdf")
+    return sink.rows_written
+
+
+def read(path, fmt):
+    if fmt == "csv":
+        frame = pd.read_csv(path, dtype=str, keep_default_na=False)
+    elif fmt == "jsonl":
+        with open(path, encoding="utf-8") as f:
+            frame = pd.DataFrame([json.loads(line) for line in f], columns=OUTPUT_COLUMNS)
+    elif fmt == "xlsx":
+        frame = pd.read_excel(path, dtype=str, keep_default_na=False)
+    else:
+        frame = pd.read_parquet(path)
+    return frame
+
+
+# Numbers compared as numbers (xlsx and parquet keep floats, csv keeps text), the rest as text
+def normalised(frame):
+    frame = frame[OUTPUT_COLUMNS].astype(object)
+    for column in OUTPUT_COLUMNS:
+        if column in NUMERIC_COLUMNS:
+            frame[column] = frame[column].astype(float).round(6)
+        else:
+            frame[column] = frame[column].astype(str)
+    return frame.reset_index(drop=True)
+
+
+def expected(details):
+    return normalised(pd.DataFrame([row for invoice in details for row in details_to_rows(invoice)],
+                                   columns=OUTPUT_COLUMNS))
+
+
+@pytest.mark.parametrize("fmt", SINK_FORMATS)
+def test_every_format_writes_the_same_rows(tmp_path, fmt):
+    if fmt == "parquet":
+        pytest.importorskip("pyarrow")
+    details = all_details()
+    path = tmp_path / f"out.{fmt}"
+
+    rows = write(path, fmt, details)
+    frame = read(path, fmt)
+
+    assert rows == len(frame) == sum(len(invoice.get('Goods Description', [])) for invoice in details)
+    assert list(frame.columns) == (OUTPUT_COLUMNS if fmt != "parquet" else
+                                   [name for column in OUTPUT_COLUMNS
+                                    for name in (column, "Date of Invoice Parsed" if column == 'Date of Invoice'
+                                                 else None) if name])
+    pd.testing.assert_frame_equal(normalised(frame), expected(details))
+    assert set(frame['Transport']) >= {"-"}
+
+
+def test_parsed_date_in_parquet_follows_the_date_as_written(tmp_path):
+    pytest.importorskip("pyarrow")
+    details = all_details()
+    details[0]['Date of Invoice'] = "31-02-2023"
+    path = tmp_path / "out.parquet"
+    write(path, "parquet", details)
+    frame = pd.read_parquet(path)
+
+    parsed = pd.to_datetime(frame['Date of Invoice'].astype(str), format="%d-%m-%Y", errors="coerce")
+    assert (frame['Date of Invoice Parsed'].isna() == parsed.isna()).all()
+    assert (frame['Date of Invoice Parsed'].dropna().values == parsed.dropna().values).all()
+    assert frame['Date of Invoice Parsed'].isna().any()
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl", "xlsx"])
+def test_appending_gives_the_rows_of_one_run(tmp_path, fmt):
+    details = all_details()
+    whole, halves = tmp_path / f"whole.{fmt}", tmp_path / f"halves.{fmt}"
+    write(whole, fmt, details)
+    write(halves, fmt, details[:3])
+    write(halves, fmt, details[3:], append=True)
+
+    pd.testing.assert_frame_equal(normalised(read(halves, fmt)), normalised(read(whole, fmt)))
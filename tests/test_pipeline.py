@@ -0,0 +1,59 @@
+# Staged pipeline (--pipeline): results come back in input order, a file that fails
+# doesn't hold up the others, and stopping early reads the same text as run_batch.
+import random
+
+from generate_invoices import invoice_lines, write_invoice_pdf
+from Extraction import extract_hybrid_text, extract_details
+from instrumentation import RunStats
+from pipeline import run_pipeline
+
+
+def write_bill(path, invoice_no, pages=1, extra_lines=()):
+    lines = invoice_lines(random.Random(invoice_no), invoice_no, 2, pages) + list(extra_lines)
+    write_invoice_pdf(str(path), lines, pages)
+    return str(path)
+
+
+def test_results_keep_the_input_order(tmp_path):
+    # Long bills first, so the short ones behind them are loaded before they are
+    pdf_paths = [write_bill(tmp_path / f"{number}.pdf", number, pages=4 if number < 103 else 1)
+                 for number in range(101, 107)]
+    written = []
+
+    details, failures = run_pipeline(pdf_paths, workers=3, ocr_workers=1,
+                                     on_result=lambda pdf_path, details, error: written.append(pdf_path))
+
+    assert failures == []
+    assert written == pdf_paths
+    assert [invoice['Invoice No'] for invoice in details] == [str(number) for number in range(101, 107)]
+
+
+def test_failed_file_is_reported_and_the_rest_written(tmp_path):
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+    pdf_paths = [write_bill(tmp_path / "101.pdf", 101), str(broken), write_bill(tmp_path / "102.pdf", 102)]
+    results = []
+
+    details, failures = run_pipeline(pdf_paths, workers=2, ocr_workers=1,
+                                     on_result=lambda pdf_path, details, error: results.append((pdf_path, error)))
+
+    assert [invoice['Invoice No'] for invoice in details] == ["101", "102"]
+    assert [pdf_path for pdf_path, _ in failures] == [str(broken)]
+    assert [pdf_path for pdf_path, _ in results] == pdf_paths
+    assert results[1][1] is not None and results[0][1] is None and results[2][1] is None
+
+
+def test_stopping_early_reads_what_run_batch_reads(tmp_path):
+    annexure = ["Annexure: transport", "Transporter GSTIN : 29ABCDE1234F1Z9"]
+    pdf_paths = [write_bill(tmp_path / "plain.pdf", 101, pages=3),
+                 write_bill(tmp_path / "annexure.pdf", 102, pages=3, extra_lines=annexure)]
+    stats = RunStats(keep_documents=True)
+
+    details, failures = run_pipeline(pdf_paths, workers=2, ocr_workers=1, stop_early=True, stats=stats)
+
+    assert failures == []
+    for pdf_path, invoice in zip(pdf_paths, details):
+        text, _, _ = extract_hybrid_text(pdf_path, stop_early=True)
+        assert invoice == extract_details(text)
+        assert invoice == extract_details(extract_hybrid_text(pdf_path)[0])
+    assert [document["pages"] for document in stats.documents] == [1, 2]
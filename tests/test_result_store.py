@@ -0,0 +1,35 @@
+# Result store queries: month filters are real months, and dates the calendar doesn't
+# have are kept as written but not as ISO dates.
+import pytest
+
+from result_store import ResultStore, iso_date, month_range, main
+
+
+def test_impossible_dates_have_no_iso_date():
+    assert iso_date("28-02-2023") == "2023-02-28"
+    assert iso_date("29-02-24") == "2024-02-29"
+    assert iso_date("31-02-2023") is None
+    assert iso_date("29-02-2023") is None
+    assert iso_date("15-13-2023") is None
+
+
+def test_month_is_checked_and_ends_on_its_last_day():
+    assert month_range("2023-02") == ("2023-02-01", "2023-02-28")
+    assert month_range("2023-7") == ("2023-07-01", "2023-07-31")
+    for month in ("2023", "2023-7x", "2023-13", "07-2023"):
+        with pytest.raises(ValueError):
+            month_range(month)
+
+
+def test_bad_month_on_the_command_line_is_a_usage_error(tmp_path, capsys):
+    path = str(tmp_path / "invoices.db")
+    with ResultStore(path) as store:
+        store.add({'Invoice No': "1", 'Date of Invoice': "28-02-2023"}, "a.pdf")
+        store.add({'Invoice No': "2", 'Date of Invoice': "31-02-2023"}, "b.pdf")
+        assert [invoice["invoice_no"] for invoice in store.find(month="2023-02")] == ["1"]
+
+    for argv in (["--month", "2023-7x"], ["--month", "2023"], ["--from", "2023-02-31"]):
+        with pytest.raises(SystemExit) as exit_info:
+            main([path] + argv)
+        assert exit_info.value.code == 2
+    assert main([path, "--month", "2023-02", "--format", "json"]) == 0
@@ -0,0 +1,131 @@
+# The extraction service end to end: HTTP handler, worker pool and a SQLite queue in a
+# temporary directory, extracting generated text PDFs.
+import os
+import json
+import time
+import random
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from generate_invoices import write_invoice_pdf, invoice_lines
+from jobqueue import JobQueue
+from service import Metrics, WorkerPool, ExtractionServer
+
+
+@pytest.fixture
+def service(tmp_path):
+    upload_dir = tmp_path / "uploads"
+    upload_dir.mkdir()
+    metrics = Metrics()
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    pool = WorkerPool(queue, 2, {}, metrics, str(upload_dir))
+    server = ExtractionServer(("127.0.0.1", 0), queue, pool, metrics, upload_dir=str(upload_dir),
+                              wait_timeout=60.0, allowed_dirs=[str(tmp_path)])
+    pool.start()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        pool.stop()
+        queue.close()
+
+
+@pytest.fixture
+def invoice_pdf(tmp_path):
+    path = str(tmp_path / "invoice.pdf")
+    write_invoice_pdf(path, invoice_lines(random.Random(7), 4711, 3, 1), 1)
+    return path
+
+
+def request(server, method, path, data=None, content_type="application/pdf"):
+    url = f"http://127.0.0.1:{server.server_address[1]}{path}"
+    req = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": content_type})
+    try:
+        with urllib.request.urlopen(req, timeout=120) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_health(service):
+    assert request(service, "GET", "/health") == (200, {"status": "ok"})
+
+
+def test_same_upload_sent_concurrently(service, invoice_pdf):
+    with open(invoice_pdf, "rb") as f:
+        data = f.read()
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(lambda _: request(service, "POST", "/extract", data), range(4)))
+
+    assert [status for status, _ in responses] == [200] * 4
+    assert len({body["job_id"] for _, body in responses}) == 4
+    assert {body["details"]["Invoice No"] for _, body in responses} == {"4711"}
+    # Each job removed its own upload and nothing else
+    assert os.listdir(service.upload_dir) == []
+
+    status, body = request(service, "GET", f"/jobs/{responses[0][1]['job_id']}")
+    assert status == 200 and body["status"] == "done"
+
+
+def test_file_sent_by_path_is_left_in_place(service, invoice_pdf):
+    # Even when it sits in the upload directory, it was not uploaded
+    path = os.path.join(service.upload_dir, "mine.pdf")
+    os.replace(invoice_pdf, path)
+    body = json.dumps({"path": path}).encode()
+
+    status, response = request(service, "POST", "/extract", body, "application/json")
+    assert status == 200 and response["details"]["Invoice No"] == "4711"
+    assert os.path.isfile(path)
+
+
+def test_path_outside_the_allowed_directories_is_refused(service, tmp_path_factory):
+    outside = str(tmp_path_factory.mktemp("elsewhere") / "invoice.pdf")
+    write_invoice_pdf(outside, invoice_lines(random.Random(7), 4711, 3, 1), 1)
+    body = json.dumps({"path": outside}).encode()
+
+    assert request(service, "POST", "/extract", body, "application/json")[0] == 400
+
+
+def test_queue_from_before_uploads_were_marked_is_migrated(tmp_path):
+    import sqlite3
+    path = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE jobs (id INTEGER PRIMARY KEY, batch_id TEXT, pdf_path TEXT NOT NULL, options TEXT, "
+                 "status TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+                 "lease_expires REAL, details TEXT, trace TEXT, error TEXT, created_at REAL, started_at REAL, "
+                 "finished_at REAL)")
+    conn.execute("INSERT INTO jobs (pdf_path, options) VALUES ('/inbox/a.pdf', '{}')")
+    conn.commit()
+    conn.close()
+
+    with JobQueue(path) as queue:
+        assert queue.claim("w")["uploaded"] == 0
+        assert queue.get(queue.enqueue("/uploads/b.pdf", uploaded=True))["uploaded"] == 1
+
+
+def test_upload_must_be_pdf(service):
+    status, body = request(service, "POST", "/extract", b"not a pdf")
+    assert status == 400
+
+
+def test_pool_recovers_from_dead_worker(service, invoice_pdf):
+    body = json.dumps({"path": invoice_pdf}).encode()
+    assert request(service, "POST", "/extract", body, "application/json")[0] == 200
+
+    executor = service.pool._executor
+    for process in list(executor._processes.values()):
+        process.kill()
+    deadline = time.time() + 10
+    while not executor._broken and time.time() < deadline:
+        time.sleep(0.05)
+
+    status, response = request(service, "POST", "/extract", body, "application/json")
+    assert status == 200, response
+    assert response["details"]["Invoice No"] == "4711"
+    assert service.pool._executor is not executor
@@ -0,0 +1,63 @@
+# Vendor templates: what is learned from a bill, and when a bill of a known layout still
+# has to match what the generic path reads.
+import random
+
+from generate_invoices import invoice_lines, write_invoice_pdf
+from Extraction import _extract_pdf, extract_full_text, extract_details
+from instrumentation import DocumentTrace
+from templates import TemplateRegistry
+
+
+def write_bill(path, invoice_no, drop=None):
+    lines = invoice_lines(random.Random(7), invoice_no, 3, 1)
+    if drop is not None:
+        # The line stays, so every label below it keeps its place; only the label goes
+        lines = [line.replace(drop, "X" * len(drop)) for line in lines]
+    write_invoice_pdf(str(path), lines, 1)
+    return str(path)
+
+
+def extract(pdf_path, templates):
+    trace = DocumentTrace(pdf_path)
+    details = _extract_pdf(pdf_path, 1, None, trace, "pymupdf", "tesseract", False, templates=templates)
+    return details, trace
+
+
+def learned(templates):
+    return TemplateRegistry(templates).conn.execute("SELECT COUNT(*) FROM templates").fetchone()[0]
+
+
+def test_learns_a_layout_once_and_then_matches_it(tmp_path):
+    templates = str(tmp_path / "templates.db")
+    first = write_bill(tmp_path / "first.pdf", 101)
+    second = write_bill(tmp_path / "second.pdf", 102)
+
+    details, trace = extract(first, templates)
+    assert trace.template is None
+    assert learned(templates) == 1
+
+    details, trace = extract(second, templates)
+    assert trace.template is not None
+    assert details == extract_details(extract_full_text(second))
+    assert learned(templates) == 1
+
+
+def test_field_the_template_never_saw_is_still_read(tmp_path):
+    templates = str(tmp_path / "templates.db")
+    extract(write_bill(tmp_path / "without_tan.pdf", 101, drop="TAN NO"), templates)
+    bill = write_bill(tmp_path / "with_tan.pdf", 102)
+
+    details, trace = extract(bill, templates)
+    assert trace.template is not None
+    assert details['TAN NO'].startswith("NGPVO-")
+    assert details == extract_details(extract_full_text(bill))
+
+
+def test_falls_back_when_a_known_field_is_missing(tmp_path):
+    templates = str(tmp_path / "templates.db")
+    extract(write_bill(tmp_path / "first.pdf", 101), templates)
+    bill = write_bill(tmp_path / "without_vehicle.pdf", 102, drop="Vehicle No.")
+
+    details, trace = extract(bill, templates)
+    assert trace.template is None
+    assert details == extract_details(extract_full_text(bill))
@@ -0,0 +1,54 @@
+# Text cache: keys change with everything that changes the text, and the size kept for
+# eviction follows what is on disk.
+import random
+
+from generate_invoices import invoice_lines, write_invoice_pdf
+from Extraction import hybrid_cache_key, extract_full_text
+from ocr_preprocess import OcrPreprocessor
+from text_cache import TextCache, make_key
+
+
+def write_bill(path, invoice_no):
+    write_invoice_pdf(str(path), invoice_lines(random.Random(invoice_no), invoice_no, 2, 1), 1)
+    return str(path)
+
+
+def test_key_changes_with_content_and_settings(tmp_path):
+    pdf_path = write_bill(tmp_path / "bill.pdf", 101)
+    key = hybrid_cache_key(pdf_path, "pymupdf", "pytesseract")
+
+    assert hybrid_cache_key(pdf_path, "pymupdf", "pytesseract") == key
+    assert hybrid_cache_key(pdf_path, "pdfplumber", "pytesseract") != key
+    assert hybrid_cache_key(pdf_path, "pymupdf", "pytesseract", stop_early=True) != key
+    preprocessed = hybrid_cache_key(pdf_path, "pymupdf", "pytesseract", preprocess=OcrPreprocessor())
+    assert preprocessed != key
+    assert hybrid_cache_key(pdf_path, "pymupdf", "pytesseract", preprocess=OcrPreprocessor(roi="page")) != preprocessed
+
+    # Same name, new content
+    write_bill(tmp_path / "bill.pdf", 102)
+    assert hybrid_cache_key(pdf_path, "pymupdf", "pytesseract") != key
+    assert make_key("text", "digest", {"a": 1}) != make_key("ocr-page", "digest", {"a": 1})
+
+
+def test_changed_file_is_not_served_stale_text(tmp_path):
+    cache = TextCache(str(tmp_path / "cache"))
+    pdf_path = write_bill(tmp_path / "bill.pdf", 101)
+    first = extract_full_text(pdf_path, cache)
+    assert extract_full_text(pdf_path, cache) == first
+    assert cache.hits == 1
+
+    write_bill(tmp_path / "bill.pdf", 102)
+    assert "102" in extract_full_text(pdf_path, cache)
+    assert extract_full_text(pdf_path, cache) != first
+
+
+def test_overwriting_a_key_counts_only_the_new_size(tmp_path):
+    cache = TextCache(str(tmp_path / "cache"), max_bytes=1000)
+    cache.put("ab" * 32, "x" * 100)
+    cache.put("cd" * 32, "y" * 100)
+    for _ in range(20):
+        cache.put("ab" * 32, "z" * 300)
+
+    assert cache._total_bytes == 400
+    # Under the limit all along, so nothing was evicted
+    assert cache.get("cd" * 32) == "y" * 100